@@ -0,0 +1,679 @@
+# Offline benchmarks for the bridge: main.py runs against an in-process fake radio and a
+# fake Discord, so throughput, latency and memory can be measured without either.
+#
+#   python bench.py                          # every scenario with the default sizes
+#   python bench.py relay --rates 50 500     # just the relay, at two packet rates
+#   python bench.py --json results.json      # save the results...
+#   python bench.py --baseline results.json  # ...and later fail (exit 1) on regressions
+#   python bench.py replay --capture bridge.capture --speed 0   # a field capture, as fast as possible
+#   python bench.py startup                  # time from launch to the first mesh text on Discord
+#   python bench.py daemon --rates 100       # the relay with the radio in a separate daemon process
+#   python bench.py autoreply                # the relay stays as fast while a slow LLM answers every text
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+
+import meshtastic.tcp_interface
+from aiohttp import web
+from discord.ext import commands
+from meshtastic.protobuf import localonly_pb2
+from meshtastic.protobuf import mesh_pb2
+from pubsub import pub
+
+SCENARIOS = ("relay", "nodes", "info", "nearby", "nearby-scan", "startup", "daemon", "autoreply", "replay")
+DEFAULT_RATES = (10, 100, 400)                  # Mesh texts per second offered to the relay
+DEFAULT_DURATION = 5.0                          # Seconds texts are offered for in each relay run
+DEFAULT_SIZES = (10, 100, 1000, 10000)          # NodeDB sizes for /nodes, /info and /nearby
+DEFAULT_REPEATS = 200                           # Command invocations per NodeDB size
+DISCORD_LATENCY = 0.08                          # Simulated seconds per Discord API call
+DISCORD_RATE_LIMIT = 5                          # Posts allowed per DISCORD_RATE_PERIOD, as Discord does per channel
+DISCORD_RATE_PERIOD = 5.0
+RELAY_DRAIN_TIMEOUT = 120.0                     # Give up waiting for the relay after this many seconds
+REGRESSION_TOLERANCE = 0.25                     # Allowed slowdown against a baseline before failing
+STARTUP_CONNECT_LATENCY = 3.0                   # Simulated seconds for a radio to connect and send its NodeDB
+STARTUP_LOGIN_LATENCY = 1.5                     # Simulated seconds for the Discord gateway login
+STARTUP_SYNC_LATENCY = 0.5                      # Simulated seconds for a slash command sync
+STARTUP_TIMEOUT = 60.0
+AUTOREPLY_RATE = 20.0                           # Mesh texts per second while unattended mode answers them
+FAKE_LLM_LATENCY = 2.0                          # Seconds the fake model server takes per reply
+DAEMON_CALL_REPEATS = 500                       # Radio writes timed through the daemon socket, and in process
+BRIDGE_SETTINGS = {                             # Environment configuration for the bridge under test
+    "DISCORD_BOT_TOKEN": "bench",
+    "DISCORD_CHANNEL_ID": "1000",
+    "MESHTASTIC_HOSTNAME": "bench-radio",
+    "METRICS_PORT": "null",
+}
+
+# --------------------------
+# Fake Radio
+# --------------------------
+class FakeSentPacket:
+    __slots__ = ("id",)
+
+    def __init__(self, packet_id: int):
+        self.id = packet_id
+
+class FakeInterface:
+    # Stands in for meshtastic.tcp_interface.TCPInterface. Writes are counted and dropped;
+    # received texts are published from a reader thread, as the real interface does.
+    def __init__(self, hostname: str, **kwargs):
+        self.hostname = hostname
+        self.nodes = {}
+        self.myInfo = mesh_pb2.MyNodeInfo(my_node_num=0x0B1D6E00)
+        self.metadata = None
+        self.localNode = types.SimpleNamespace(localConfig=localonly_pb2.LocalConfig(), channels=[])
+        self.isConnected = threading.Event()
+        self.isConnected.set()
+        self.writes = 0
+        self._ids = itertools.count(1)
+        self._packet_ids = itertools.count(0x20000000)  # Unique across runs, or the duplicate filter drops them
+        self._runs = itertools.count(1)  # Texts differ between runs too, for the same reason
+
+    def _write(self, *args, **kwargs):
+        self.writes += 1
+        return FakeSentPacket(next(self._ids))
+
+    sendText = sendData = sendPosition = sendTelemetry = sendTraceRoute = _write
+
+    def sendHeartbeat(self):
+        pass
+
+    def getLongName(self):
+        return "Bench Bridge"
+
+    def getShortName(self):
+        return "BNCH"
+
+    def close(self):
+        self.isConnected.clear()
+
+    def emit_texts(self, count: int, rate: float, sent_at: dict) -> threading.Thread:
+        # Publishes count texts at rate per second on a thread; sent_at maps sequence -> send time.
+        run_number = next(self._runs)
+
+        def run():
+            start = time.monotonic()
+            for seq in range(count):
+                delay = start + seq / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                sender = 0x10000000 + seq % 64
+                packet = {
+                    "id": next(self._packet_ids), "from": sender, "fromId": f"!{sender:08x}", "to": 0xFFFFFFFF,
+                    "toId": "^all", "channel": 0,
+                    "decoded": {"portnum": "TEXT_MESSAGE_APP", "text": f"bench {seq} run {run_number} the quick brown fox"},
+                }
+                sent_at[seq] = time.monotonic()
+                pub.sendMessage("meshtastic.receive.text", packet=packet, interface=self)
+        thread = threading.Thread(target=run, daemon=True, name="fake-meshtastic-reader")
+        thread.start()
+        return thread
+
+def synthetic_nodes(count: int, seed: int = 1) -> dict:
+    # A NodeDB shaped like the library's, with nodes scattered over roughly 100 km.
+    rng = random.Random(seed)
+    now = int(time.time())
+    nodes = {}
+    for index in range(count):
+        num = 0x30000000 + index
+        node_id = f"!{num:08x}"
+        nodes[node_id] = {
+            "num": num,
+            "user": {"id": node_id, "longName": f"Bench Node {index}", "shortName": f"B{index % 1000:03d}", "hwModel": "TBEAM"},
+            "position": {"latitude": 47.6 + rng.uniform(-0.5, 0.5), "longitude": -122.3 + rng.uniform(-0.7, 0.7), "altitude": rng.randint(0, 500)},
+            "deviceMetrics": {"batteryLevel": rng.randint(1, 100), "voltage": rng.uniform(3.3, 4.2), "channelUtilization": rng.uniform(0, 40), "airUtilTx": rng.uniform(0, 10)},
+            "snr": rng.uniform(-20, 10),
+            "hopsAway": rng.randint(0, 7),
+            "lastHeard": now - rng.randint(0, 86400),
+            "isFavorite": index % 50 == 0,
+        }
+    return nodes
+
+# --------------------------
+# Fake Discord
+# --------------------------
+class FakeMessage:
+    def __init__(self, channel: "FakeChannel", content: str):
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content: str = None, **kwargs):
+        await self.channel.call(content)
+        self.content = content
+        return self
+
+class FakeChannel:
+    # A text channel with per-call latency and Discord's per-channel rate limit. Calls over the
+    # limit wait out the bucket, as discord.py does after a 429, and are counted.
+    def __init__(self, channel_id: int, latency: float, rate_limit: int, rate_period: float):
+        self.id = channel_id
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.calls = []  # Monotonic times of calls in the current rate-limit period
+        self.total_calls = 0
+        self.rate_limited = 0
+        self.delivered = {}  # bench sequence number -> monotonic time it reached the channel
+        self._lock = None
+
+    async def call(self, content: str):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            now = time.monotonic()
+            self.calls = [t for t in self.calls if now - t < self.rate_period]
+            if len(self.calls) >= self.rate_limit:
+                self.rate_limited += 1
+                await asyncio.sleep(self.calls[0] + self.rate_period - now)
+            self.calls.append(time.monotonic())
+            self.total_calls += 1
+        await asyncio.sleep(self.latency)
+        arrived = time.monotonic()
+        for seq in re.findall(r"bench (\d+) ", content or ""):
+            self.delivered.setdefault(int(seq), arrived)
+
+    async def send(self, content: str = None, **kwargs):
+        await self.call(content)
+        return FakeMessage(self, content)
+
+class FakeResponse:
+    def __init__(self):
+        self.sent = []
+        self._done = False
+
+    async def send_message(self, *args, **kwargs):
+        self.sent.append((args, kwargs))
+        self._done = True
+
+    async def edit_message(self, *args, **kwargs):
+        self.sent.append((args, kwargs))
+        self._done = True
+
+    async def defer(self, *args, **kwargs):
+        self._done = True
+
+    def is_done(self) -> bool:
+        return self._done
+
+class FakeInteraction:
+    def __init__(self):
+        self.user = types.SimpleNamespace(id=1, name="bench")
+        self.channel_id = None
+        self.response = FakeResponse()
+
+# --------------------------
+# Loading the Bridge
+# --------------------------
+def load_bridge(directory: str = None, interface_class=FakeInterface):
+    # Importing main.py connects to nothing; the radio is swapped for a fake before the bridge
+    # is started, and its databases go to a throwaway directory.
+    os.chdir(directory or tempfile.mkdtemp(prefix="bridge-bench-"))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ.update({f"MESHBRIDGE_{name}": value for name, value in BRIDGE_SETTINGS.items()})
+    meshtastic.tcp_interface.TCPInterface = interface_class
+    import main
+    return main
+
+async def start_loop_side(main):
+    # BridgeApp.start without the Discord login.
+    main.bridge_app.start_radios(asyncio.get_running_loop())
+    main.discord_ready.set()
+    while not all(radio.supervisor.connected for radio in main.radios.values()):
+        await asyncio.sleep(0.01)
+
+# --------------------------
+# Measurements
+# --------------------------
+def latency_summary(samples: list) -> dict:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50_ms": None, "p99_ms": None}
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] * 1000
+    return {"p50_ms": round(pick(50), 3), "p99_ms": round(pick(99), 3)}
+
+async def measure_memory(run) -> int:
+    # Peak bytes allocated while run() executes; a separate pass, since tracing slows everything.
+    tracemalloc.start()
+    try:
+        await run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+# --------------------------
+# Scenarios
+# --------------------------
+async def relay_once(main, rate: float, count: int, rate_limit: int = DISCORD_RATE_LIMIT) -> dict:
+    channel = FakeChannel(main.DISCORD_CHANNEL_ID, DISCORD_LATENCY, rate_limit, DISCORD_RATE_PERIOD)
+    main.bot.get_channel = lambda channel_id: channel
+    sent_at = {}
+    started = time.monotonic()
+    main.mesh_supervisor.interface.emit_texts(count, rate, sent_at)
+    while len(channel.delivered) < count and time.monotonic() - started < RELAY_DRAIN_TIMEOUT:
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - started
+    latencies = [channel.delivered[seq] - sent_at[seq] for seq in channel.delivered if seq in sent_at]
+    return {
+        "ops": len(channel.delivered),
+        "lost": count - len(channel.delivered),
+        "throughput": round(len(channel.delivered) / elapsed, 1),
+        "discord_calls": channel.total_calls,
+        "rate_limited": channel.rate_limited,
+        **latency_summary(latencies),
+    }
+
+async def bench_relay(main, args) -> list[dict]:
+    results = []
+    for rate in args.rates:
+        count = max(1, int(rate * args.duration))
+        result = await relay_once(main, rate, count)
+        if args.memory:
+            result["peak_kib"] = round(await measure_memory(lambda: relay_once(main, rate, count)) / 1024)
+        results.append({"scenario": f"relay@{rate:g}/s", **result})
+    return results
+
+def load_nodedb(main, size: int):
+    nodes = synthetic_nodes(size)
+    main.mesh_supervisor.interface.nodes = nodes
+    main.node_registry.load(nodes)
+    main.node_positions.load(nodes)
+    main.node_render_cache.clear()
+
+async def time_calls(call, repeats: int) -> tuple[list, float]:
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeats):
+        t = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - t)
+    return latencies, time.perf_counter() - started
+
+async def command_scenario(main, args, name: str, call) -> list[dict]:
+    results = []
+    for size in args.sizes:
+        load_nodedb(main, size)
+        latencies, elapsed = await time_calls(call, args.repeats)
+        result = {"scenario": f"{name}@{size}", "ops": len(latencies), "throughput": round(len(latencies) / elapsed, 1), **latency_summary(latencies)}
+        if args.memory:
+            result["peak_kib"] = round(await measure_memory(lambda: time_calls(call, args.repeats)) / 1024)
+        results.append(result)
+    return results
+
+async def run_nodes(main):
+    interaction = FakeInteraction()
+    await main.nodes.callback(interaction)
+    view = interaction.response.sent[-1][1]["view"]
+    # Page through the first few pages, as someone browsing would.
+    for _ in range(3):
+        if view.current_page < view.page_count - 1:
+            await view.next_callback(FakeInteraction())
+    view.stop()
+
+async def run_info(main):
+    interaction = FakeInteraction()
+    await main.info.callback(interaction)
+    view = interaction.response.sent[-1][1]["view"]
+    for _ in range(3):
+        if view.current_page < view.page_count - 1:
+            await view.next_callback(FakeInteraction())
+    view.stop()
+
+def histogram_since(main, name: str, before):
+    # The observations a metrics histogram gained since the copy in before.
+    after = main.metrics.histogram(name)
+    after.counts = [a - b for a, b in zip(after.counts, before.counts)]
+    after.count -= before.count
+    after.sum -= before.sum
+    return after
+
+async def bench_replay(main, args) -> list[dict]:
+    # Replays a capture made with CAPTURE_PATH through the same pubsub path as live packets,
+    # into the fake Discord, and reports packets per second and mesh -> Discord latency.
+    channel = FakeChannel(main.DISCORD_CHANNEL_ID, DISCORD_LATENCY, DISCORD_RATE_LIMIT, DISCORD_RATE_PERIOD)
+    main.bot.get_channel = lambda channel_id: channel
+    before = main.metrics.histogram("bridge_mesh_to_discord_seconds")
+    replayer = main.CaptureReplayer(args.capture, args.speed)
+    started = time.monotonic()
+    replayer.start(main.radios)
+    await asyncio.to_thread(replayer.finished.wait)
+    fed = time.monotonic() - started
+    while time.monotonic() - started < RELAY_DRAIN_TIMEOUT:
+        relay = main.discord_relay.stats()
+        if relay["relayed"] >= relay["received"] and not any(radio.ingest.stats()["depth"] for radio in main.radios.values()):
+            break
+        await asyncio.sleep(0.05)
+    latency = histogram_since(main, "bridge_mesh_to_discord_seconds", before)
+    return [{
+        "scenario": f"replay@{args.speed:g}x" if args.speed else "replay@max",
+        "ops": replayer.replayed,
+        "throughput": round(replayer.replayed / max(fed, 1e-9), 1),
+        "p50_ms": round(latency.quantile(0.5) * 1000, 3) if latency.count else None,
+        "p99_ms": round(latency.quantile(0.99) * 1000, 3) if latency.count else None,
+        "discord_calls": channel.total_calls,
+        "rate_limited": channel.rate_limited,
+    }]
+
+async def run_nearby(main):
+    interaction = FakeInteraction()
+    await main.nearby.callback(interaction, "!30000000", 10, None)
+
+async def run_nearby_scan(main):
+    # What /nearby did before the position index: haversine to every positioned node, then sort.
+    # Compare nearby-scan@N with nearby@N for the index's speedup.
+    nodes = main.mesh_supervisor.interface.nodes
+    origin = nodes["!30000000"]["position"]
+    lat, lon = origin["latitude"], origin["longitude"]
+    distances = [
+        (main.haversine_km(lat, lon, node["position"]["latitude"], node["position"]["longitude"]), node_id)
+        for node_id, node in nodes.items()
+        if node_id != "!30000000" and "latitude" in node.get("position", {})
+    ]
+    distances.sort()
+    return distances[:10]
+
+class SlowFakeInterface(FakeInterface):
+    # A radio that takes STARTUP_CONNECT_LATENCY to connect, as a real one does while it sends
+    # its NodeDB.
+    def __init__(self, hostname: str, **kwargs):
+        time.sleep(STARTUP_CONNECT_LATENCY)
+        super().__init__(hostname, **kwargs)
+
+def startup_child(directory: str) -> dict:
+    # Runs in a fresh process, so imports are cold: starts the bridge through BridgeApp.run with
+    # a slow fake radio and a fake Discord login, has the radio hear one text as soon as it is
+    # connected, and returns the wall-clock time each startup milestone was reached.
+    main = load_bridge(directory, SlowFakeInterface)
+    channel = FakeChannel(main.DISCORD_CHANNEL_ID, DISCORD_LATENCY, DISCORD_RATE_LIMIT, DISCORD_RATE_PERIOD)
+
+    async def sync(*args, **kwargs):
+        await asyncio.sleep(STARTUP_SYNC_LATENCY)
+
+    async def login(self, token: str, **kwargs):
+        await asyncio.sleep(STARTUP_LOGIN_LATENCY)
+        self.get_channel = lambda channel_id: channel
+        await main.bridge_app.on_login()
+        started = time.monotonic()
+        while not channel.delivered and time.monotonic() - started < STARTUP_TIMEOUT:
+            await asyncio.sleep(0.01)
+
+    def first_text():
+        while not main.mesh_supervisor.connected:
+            time.sleep(0.01)
+        main.mesh_supervisor.interface.emit_texts(1, 1.0, {})
+
+    main.tree.sync = sync
+    commands.Bot.start = login
+    threading.Thread(target=first_text, daemon=True).start()
+    main.bridge_app.run()
+    offset = time.time() - time.monotonic()
+    return {phase: offset + main.startup_timer.started + seconds for phase, seconds in main.startup_timer.phases.items()}
+
+async def bench_startup(main, args) -> list[dict]:
+    # Time from launching the bridge to each startup milestone, ending with the first mesh text
+    # reaching Discord. The second run is a restart: the slash commands are unchanged, so it
+    # skips the sync.
+    directory = tempfile.mkdtemp(prefix="bridge-startup-")
+    results = []
+    for label in ("first", "restart"):
+        spawned = time.time()
+        child = await asyncio.to_thread(
+            subprocess.run, [sys.executable, os.path.abspath(__file__), "--startup-child", directory],
+            capture_output=True, text=True, timeout=STARTUP_TIMEOUT
+        )
+        if child.returncode:
+            raise RuntimeError(f"startup run failed:\n{child.stderr[-2000:]}")
+        phases = json.loads(child.stdout.splitlines()[-1])
+        results.append({
+            "scenario": f"startup@{label}", "ops": 1,
+            **{f"{phase}_ms": round((wall - spawned) * 1000, 1) for phase, wall in phases.items()},
+        })
+    return results
+
+def daemon_child(directory: str, count: int, rate: float):
+    # The radio daemon with a fake radio. Once a bot attaches, the radio hears count texts at
+    # rate per second; their send times go to sent_at.json for the bot side to compare against.
+    main = load_bridge(directory)
+
+    def emit():
+        while not main.radio_daemon._writers:
+            time.sleep(0.01)
+        sent_at = {}
+        main.mesh_supervisor.interface.emit_texts(count, rate, sent_at).join()
+        with open(os.path.join(directory, "sent_at.tmp"), "w") as f:
+            json.dump(sent_at, f)
+        os.replace(os.path.join(directory, "sent_at.tmp"), os.path.join(directory, "sent_at.json"))
+
+    threading.Thread(target=emit, daemon=True).start()
+    main.radio_daemon.run()
+
+async def bot_child(directory: str, count: int) -> dict:
+    # The bot side of the daemon scenario: relays what the daemon forwards into a fake Discord,
+    # then times radio writes made through the daemon. Both processes read the same monotonic
+    # clock, so mesh -> Discord latency spans the socket.
+    main = load_bridge(directory)
+    channel = FakeChannel(main.DISCORD_CHANNEL_ID, DISCORD_LATENCY, DISCORD_RATE_LIMIT, DISCORD_RATE_PERIOD)
+    main.bot.get_channel = lambda channel_id: channel
+    await start_loop_side(main)
+    started = time.monotonic()
+    path = os.path.join(directory, "sent_at.json")
+    while (len(channel.delivered) < count or not os.path.exists(path)) and time.monotonic() - started < RELAY_DRAIN_TIMEOUT:
+        await asyncio.sleep(0.05)
+    with open(path) as f:
+        sent_at = {int(seq): at for seq, at in json.load(f).items()}
+    sender = main.radios[main.PRIMARY_RADIO].sender
+    calls, elapsed = await time_calls(lambda: sender.submit(main.RadioCall("sendText", "bench call")), DAEMON_CALL_REPEATS)
+    finished = max(channel.delivered.values(), default=started)
+    return {
+        "relay": {
+            "ops": len(channel.delivered),
+            "lost": count - len(channel.delivered),
+            "throughput": round(len(channel.delivered) / max(finished - min(sent_at.values()), 1e-9), 1),
+            "discord_calls": channel.total_calls,
+            "rate_limited": channel.rate_limited,
+            **latency_summary([channel.delivered[seq] - sent_at[seq] for seq in channel.delivered if seq in sent_at]),
+        },
+        "calls": calls,
+        "calls_elapsed": elapsed,
+    }
+
+async def bench_daemon(main, args) -> list[dict]:
+    # The relay with the radio in a radio daemon process and the bot in another, to compare with
+    # the in-process relay@ rows, and the round trip of one radio write through the daemon
+    # socket against the same write made in process.
+    sender = main.radios[main.PRIMARY_RADIO].sender
+    calls, elapsed = await time_calls(lambda: sender.submit(main.RadioCall("sendText", "bench call")), DAEMON_CALL_REPEATS)
+    results = [{"scenario": "call@local", "ops": len(calls), "throughput": round(len(calls) / elapsed, 1), **latency_summary(calls)}]
+    for rate in args.rates:
+        count = max(1, int(rate * args.duration))
+        directory = tempfile.mkdtemp(prefix="bridge-daemon-")
+        env = {**os.environ, "MESHBRIDGE_RADIO_DAEMON_SOCKET": os.path.join(directory, "radio.sock")}
+        script = os.path.abspath(__file__)
+        daemon = subprocess.Popen(
+            [sys.executable, script, "--daemon-child", directory, "--count", str(count), "--rates", str(rate)],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        )
+        try:
+            bot = await asyncio.to_thread(
+                subprocess.run, [sys.executable, script, "--bot-child", directory, "--count", str(count)],
+                env=env, capture_output=True, text=True, timeout=RELAY_DRAIN_TIMEOUT + STARTUP_TIMEOUT
+            )
+        finally:
+            daemon.send_signal(signal.SIGINT)
+            daemon.wait()
+        if bot.returncode:
+            raise RuntimeError(f"daemon bot run failed:\n{bot.stderr[-2000:]}")
+        measured = json.loads(bot.stdout.splitlines()[-1])
+        results.append({"scenario": f"daemon-relay@{rate:g}/s", **measured["relay"]})
+        if rate == args.rates[0]:
+            calls = measured["calls"]
+            results.append({"scenario": "call@daemon", "ops": len(calls), "throughput": round(len(calls) / measured["calls_elapsed"], 1), **latency_summary(calls)})
+    return results
+
+async def fake_model_server() -> tuple[web.AppRunner, str]:
+    # A local stand-in for Ollama's /api/chat that takes FAKE_LLM_LATENCY to answer.
+    async def chat(request: web.Request) -> web.Response:
+        await request.json()
+        await asyncio.sleep(FAKE_LLM_LATENCY)
+        return web.json_response({"message": {"role": "assistant", "content": "copy that"}})
+
+    app = web.Application()
+    app.router.add_post("/api/chat", chat)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/api/chat"
+
+async def bench_autoreply(main, args) -> list[dict]:
+    # The relay at AUTOREPLY_RATE, first on its own and then with unattended mode answering
+    # every text through a slow fake model server. Relay latency has to stay flat: a slow LLM
+    # may delay the auto replies, never the texts going to Discord. Both runs are without
+    # Discord's rate limit (the fake channel's and the relay's own bucket), or the auto replies'
+    # own posts would hold the texts back and hide what is being measured, the event loop.
+    runner, url = await fake_model_server()
+    count = max(1, int(AUTOREPLY_RATE * args.duration))
+    engine = main.auto_reply_engine
+    api_url = engine.api_url
+    relay_limit = main.discord_relay.rate_limit
+    main.discord_relay.rate_limit = count * 2
+    try:
+        quiet = await relay_once(main, AUTOREPLY_RATE, count, rate_limit=count * 2)
+        engine.api_url = url
+        main.unattended_mode = True
+        busy = await relay_once(main, AUTOREPLY_RATE, count, rate_limit=count * 2)
+        llm_requests = main.metrics.histogram("bridge_llm_seconds").count
+    finally:
+        main.unattended_mode = False
+        for worker in list(engine._workers.values()):
+            worker.cancel()
+        engine.api_url = api_url
+        main.discord_relay.rate_limit = relay_limit
+        await engine.close()
+        await runner.cleanup()
+    if not llm_requests:
+        raise RuntimeError("autoreply: the fake model server was never asked for a reply")
+    for key in ("p50_ms", "p99_ms"):
+        if busy[key] is None or busy[key] > quiet[key] * (1 + args.tolerance) + DISCORD_LATENCY * 1000:
+            raise RuntimeError(f"autoreply: relay {key} went from {quiet[key]} to {busy[key]} with a slow LLM")
+    return [
+        {"scenario": "autoreply@off", **quiet},
+        {"scenario": "autoreply@slow-llm", **busy},
+    ]
+
+SCENARIO_RUNNERS = {
+    "relay": bench_relay,
+    "nodes": lambda main, args: command_scenario(main, args, "nodes", lambda: run_nodes(main)),
+    "info": lambda main, args: command_scenario(main, args, "info", lambda: run_info(main)),
+    "nearby": lambda main, args: command_scenario(main, args, "nearby", lambda: run_nearby(main)),
+    "nearby-scan": lambda main, args: command_scenario(main, args, "nearby-scan", lambda: run_nearby_scan(main)),
+    "startup": bench_startup,
+    "daemon": bench_daemon,
+    "autoreply": bench_autoreply,
+    "replay": bench_replay,
+}
+
+# --------------------------
+# Reporting
+# --------------------------
+def print_table(results: list[dict]):
+    columns = ("scenario", "ops", "throughput", "p50_ms", "p99_ms", "peak_kib", "discord_calls", "rate_limited", "lost",
+               "radio_connected_ms", "discord_ready_ms", "commands_ready_ms", "first_relay_ms")
+    present = [column for column in columns if any(column in result for result in results)]
+    rows = [[str(result.get(column, "")) for column in present] for result in results]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(present)]
+    print("  ".join(column.ljust(width) for column, width in zip(present, widths)).rstrip())
+    for row in rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+
+def find_regressions(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    previous = {result["scenario"]: result for result in baseline}
+    problems = []
+    for result in results:
+        before = previous.get(result["scenario"])
+        if before is None:
+            continue
+        for key in ("p50_ms", "p99_ms", "peak_kib", "first_relay_ms"):
+            if before.get(key) and result.get(key) is not None and result[key] > before[key] * (1 + tolerance):
+                problems.append(f"{result['scenario']}: {key} {before[key]} -> {result[key]}")
+        if before.get("throughput") and result.get("throughput") is not None and result["throughput"] < before["throughput"] * (1 - tolerance):
+            problems.append(f"{result['scenario']}: throughput {before['throughput']} -> {result['throughput']}")
+    return problems
+
+async def run(args) -> list[dict]:
+    main = load_bridge()
+    await start_loop_side(main)
+    results = []
+    for scenario in args.scenarios:
+        results.extend(await SCENARIO_RUNNERS[scenario](main, args))
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bridge against a fake radio and a fake Discord.")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"any of {', '.join(SCENARIOS)} (default: all; replay only with --capture)")
+    parser.add_argument("--rates", type=float, nargs="+", default=list(DEFAULT_RATES), help="relay packet rates, per second")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds of traffic per relay rate")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="NodeDB sizes")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="command invocations per NodeDB size")
+    parser.add_argument("--capture", help="capture file for the replay scenario")
+    parser.add_argument("--speed", type=float, default=0, help="replay speed: 1 is real time, 0 as fast as possible")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc pass")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare with results saved by --json and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="allowed relative slowdown")
+    parser.add_argument("--startup-child", help=argparse.SUPPRESS)
+    parser.add_argument("--daemon-child", help=argparse.SUPPRESS)
+    parser.add_argument("--bot-child", help=argparse.SUPPRESS)
+    parser.add_argument("--count", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    if "replay" in args.scenarios and not args.capture:
+        parser.error("the replay scenario needs --capture")
+    args.scenarios = args.scenarios or [scenario for scenario in SCENARIOS if scenario != "replay" or args.capture]
+    return args
+
+def main_cli(argv=None) -> int:
+    args = parse_args(argv)
+    if args.startup_child:
+        print(json.dumps(startup_child(args.startup_child)))
+        return 0
+    if args.daemon_child:
+        daemon_child(args.daemon_child, args.count, args.rates[0])
+        return 0
+    if args.bot_child:
+        print(json.dumps(asyncio.run(bot_child(args.bot_child, args.count))))
+        return 0
+    # load_bridge() changes directory, so file arguments are resolved first.
+    args.json = args.json and os.path.abspath(args.json)
+    args.baseline = args.baseline and os.path.abspath(args.baseline)
+    args.capture = args.capture and os.path.abspath(args.capture)
+    results = asyncio.run(run(args))
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = find_regressions(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        return 1 if problems else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
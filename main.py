@@ -1,86 +1,3340 @@
+import time
+BRIDGE_STARTED = time.monotonic()  # Before the other imports, so startup timings include them
 import asyncio
 import threading
-import time
 import discord
 from discord.ext import commands
 from discord import app_commands, Embed, Color
 from discord.ui import View, Button, Select, Modal, TextInput
 import datetime
-import requests
 import json
-import re
+import collections
+import functools
+import hashlib
+import importlib
+import importlib.util
+import math
+import bisect
+import heapq
+import itertools
+import concurrent.futures
+import sqlite3
+import random
+import queue
+import signal
+import socket
+import sys
+import array
+import io
+import logging
+import mmap
+import os
+import struct
+import types
+import zlib
+
+import aiohttp
+from aiohttp import web
+
+import meshtastic.tcp_interface
+from pubsub import pub
+from meshtastic.protobuf import channel_pb2  # Required for channel role checks
+from meshtastic.protobuf import config_pb2  # Required for modem preset lookups
+from meshtastic.protobuf import localonly_pb2
+from meshtastic.protobuf import mesh_pb2
+from meshtastic.protobuf import portnums_pb2
+from meshtastic.util import message_to_json
+
+log = logging.getLogger("meshbridge")  # Debug detail only; discord.utils.setup_logging shows INFO and up
+HAS_MATPLOTLIB = importlib.util.find_spec("matplotlib") is not None  # Optional: /stats charts; a text sparkline is used without it
+
+@functools.cache
+def optional_module(name: str):
+    # Optional dependencies (numpy for /stats aggregates, matplotlib for its charts) are imported
+    # the first time they are used rather than at startup; matplotlib alone takes about a second.
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+# --------------------------
+# Configuration Loading
+# --------------------------
+CONFIG_ENV_PREFIX = "MESHBRIDGE_"
+
+def load_config(path: str) -> dict:
+    # Settings from a JSON file, if there is one, then from MESHBRIDGE_<NAME> environment
+    # variables, which win. Environment values are parsed as JSON where they parse, so
+    # MESHBRIDGE_METRICS_PORT=null or MESHBRIDGE_DISCORD_CHANNEL_ID=123 get their proper types.
+    config = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            config.update(json.load(f))
+    for key, value in os.environ.items():
+        if key.startswith(CONFIG_ENV_PREFIX) and key != f"{CONFIG_ENV_PREFIX}CONFIG":
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+            config[key[len(CONFIG_ENV_PREFIX):]] = value
+    return config
+
+CONFIG = load_config(os.environ.get(f"{CONFIG_ENV_PREFIX}CONFIG", "config.json"))
+_settings_read = set()
+
+def setting(name: str, default):
+    _settings_read.add(name)
+    return CONFIG.get(name, default)
+
+# --------------------------
+# Configuration
+# --------------------------
+DISCORD_BOT_TOKEN = setting("DISCORD_BOT_TOKEN", "YOUR_DISCORD_TOKEN")
+DISCORD_CHANNEL_ID = setting("DISCORD_CHANNEL_ID", None)
+MESHTASTIC_HOSTNAME = setting("MESHTASTIC_HOSTNAME", "YOUR_MESHTASTIC_API_URL") ##localhost will probably work if meshtastic is installed on the same machine as this script
+LORA_MODEM_PRESET = setting("LORA_MODEM_PRESET", None)          # e.g. "LONG_FAST"; None uses the preset configured on the node
+TX_DUTY_CYCLE = setting("TX_DUTY_CYCLE", 0.10)                  # Fraction of wall-clock time the bridge may spend transmitting
+TX_BURST_AIRTIME = setting("TX_BURST_AIRTIME", 10.0)            # Seconds of airtime that can be spent back to back before throttling
+TX_MAX_QUEUED_PER_USER = setting("TX_MAX_QUEUED_PER_USER", 5)   # Pending transmissions allowed per Discord user
+MESHTASTIC_HEARTBEAT_INTERVAL = setting("MESHTASTIC_HEARTBEAT_INTERVAL", 30.0)  # Seconds between link health checks
+MESHTASTIC_HEARTBEAT_TIMEOUT = setting("MESHTASTIC_HEARTBEAT_TIMEOUT", 10.0)    # A heartbeat write taking longer than this marks the link down
+MESHTASTIC_RECONNECT_INITIAL = setting("MESHTASTIC_RECONNECT_INITIAL", 1.0)     # First reconnect delay; doubles up to the maximum
+MESHTASTIC_RECONNECT_MAX = setting("MESHTASTIC_RECONNECT_MAX", 60.0)
+OUTBOUND_QUEUE_PATH = setting("OUTBOUND_QUEUE_PATH", "outbound_queue.db")  # Sends made while the link is down wait here, surviving restarts
+OUTBOUND_QUEUE_MAX = setting("OUTBOUND_QUEUE_MAX", 500)
+MESHTASTIC_RADIOS = setting("MESHTASTIC_RADIOS", {  # Radio name -> hostname; the first is the primary radio commands use by default
+    "primary": MESHTASTIC_HOSTNAME,
+})
+BRIDGE_ROUTES = setting("BRIDGE_ROUTES", [          # (radio name, mesh channel index, Discord channel ID): mesh texts go to the
+    (next(iter(MESHTASTIC_RADIOS)), 0, DISCORD_CHANNEL_ID),  # Discord channel, and /lora used there sends via that radio
+])
+COMMAND_SYNC_STATE_PATH = setting("COMMAND_SYNC_STATE_PATH", "commands.sync")  # Hash of the last synced slash commands; unchanged commands are not synced again
+METRICS_HOST = setting("METRICS_HOST", "127.0.0.1")  # Prometheus-style endpoint at http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_PORT = setting("METRICS_PORT", 9464)         # None disables the endpoint; /metrics in Discord still works
+PROFILER_INTERVAL = 0.005          # Seconds of CPU time between stack samples while the sampling profiler is on
+PROFILER_MAX_SECONDS = 120         # Longest profile one request may take
+
+# --------------------------
+# Metrics
+# --------------------------
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+class Histogram:
+    # Fixed buckets, so an observation is a bisect and three additions: cheap enough per packet.
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Interpolated within the bucket holding the q-th observation, as Prometheus' histogram_quantile does.
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                low = self.buckets[index - 1] if index else 0.0
+                return low + (self.buckets[index] - low) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Metrics:
+    # Counters and latency histograms keyed by (name, labels), with labels a tuple of
+    # (key, value) pairs. Only touched from the event loop, so there is no locking; queue
+    # depths and the like are read from each component's stats() by collectors at scrape time.
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counters = collections.Counter()
+        self.histograms = {}
+        self.help = {}
+        self._collectors = []
+
+    def describe(self, name: str, kind: str, text: str):
+        self.help[name] = (kind, text)
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        self.counters[name, labels] += value
+
+    def observe(self, name: str, value: float, labels: tuple = ()):
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[name, labels] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def collector(self, func):
+        # func() returns (name, labels, value) samples; the kind comes from describe().
+        self._collectors.append(func)
+        return func
+
+    def histogram(self, name: str) -> Histogram:
+        # All label sets of one histogram merged, for summaries.
+        merged = Histogram(self.buckets)
+        for (metric, _), histogram in self.histograms.items():
+            if metric == name:
+                merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                merged.sum += histogram.sum
+                merged.count += histogram.count
+        return merged
+
+    def collect(self) -> list[tuple]:
+        samples = []
+        for func in self._collectors:
+            try:
+                samples.extend(func())
+            except Exception as e:
+                print(f"Error collecting metrics from {func.__name__}: {e}")
+        return samples
+
+    def render(self) -> str:
+        # Prometheus text exposition format.
+        families = collections.defaultdict(list)
+        for (name, labels), value in self.counters.items():
+            families[name].append((name, labels, value))
+        for name, labels, value in self.collect():
+            families[name].append((name, labels, value))
+        for (name, labels), histogram in self.histograms.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                families[name].append((f"{name}_bucket", labels + (("le", le),), cumulative))
+            families[name].append((f"{name}_sum", labels, histogram.sum))
+            families[name].append((f"{name}_count", labels, histogram.count))
+        lines = []
+        for name in sorted(families):
+            kind, text = self.help.get(name, ("histogram" if (name, ()) in self.histograms else "gauge", ""))
+            if text:
+                lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample, labels, value in families[name]:
+                value = repr(float(value)) if isinstance(value, float) else str(int(value))
+                if labels:
+                    label_text = ",".join(f'{key}="{escape_label(val)}"' for key, val in labels)
+                    sample = f"{sample}{{{label_text}}}"
+                lines.append(f"{sample} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics(LATENCY_BUCKETS)
+metrics.describe("bridge_packets_total", "counter", "Mesh packets handled, by portnum")
+metrics.describe("bridge_ingest_wait_seconds", "histogram", "Time from the reader thread to the packet's handlers")
+metrics.describe("bridge_mesh_to_discord_seconds", "histogram", "Time from receiving a mesh text to posting it on Discord")
+metrics.describe("bridge_radio_write_seconds", "histogram", "Time from a send being queued to its radio write completing, by priority")
+metrics.describe("bridge_command_seconds", "histogram", "Time from a slash command being invoked to its handler finishing, by command")
+metrics.describe("bridge_llm_seconds", "histogram", "Auto-reply LLM round-trip time")
+metrics.describe("bridge_llm_errors_total", "counter", "Auto-reply LLM requests that failed")
+metrics.describe("bridge_auto_reply_messages_total", "counter", "Mesh texts handed to the auto-reply engine")
+metrics.describe("bridge_auto_replies_total", "counter", "Auto-reply turns, by result (sent, empty, error)")
+
+class SamplingProfiler:
+    # While switched on, a SIGPROF timer interrupts the main thread (the one running the event
+    # loop) after every interval of CPU time and the interrupted stack is counted. A signal sees
+    # the code that actually holds the GIL, which a sampling thread would not. Off, it costs nothing.
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self.running = False
+        self._previous_handler = None
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> bool:
+        if self.running:
+            return False
+        if not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+            raise RuntimeError("the sampling profiler needs signal.setitimer and the main thread")
+        self.samples = collections.Counter()
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.running = True
+        return True
+
+    def stop(self) -> collections.Counter:
+        if self.running:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+            self.running = False
+        return self.samples
+
+    async def profile(self, seconds: float) -> collections.Counter:
+        # Profiles for the given time while the event loop carries on; None if a profile is already running.
+        if not self.start():
+            return None
+        try:
+            await asyncio.sleep(min(seconds, PROFILER_MAX_SECONDS))
+        finally:
+            samples = self.stop()
+        return samples
+
+    @staticmethod
+    def collapsed(samples: collections.Counter) -> str:
+        # One "frame;frame;frame count" line per stack, the input format of flamegraph tools.
+        return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+    @staticmethod
+    def top(samples: collections.Counter, count: int) -> list[tuple]:
+        # (function, share of CPU samples it was running, share it was anywhere on the stack), busiest first.
+        total = sum(samples.values()) or 1
+        inclusive, own = collections.Counter(), collections.Counter()
+        for stack, hits in samples.items():
+            frames = stack.split(";")
+            for frame in set(frames):
+                inclusive[frame] += hits
+            own[frames[-1]] += hits
+        return [(frame, hits / total, inclusive[frame] / total) for frame, hits in own.most_common(count)]
+
+profiler = SamplingProfiler(PROFILER_INTERVAL)
+
+class StartupTimer:
+    # Seconds from the start of the process (before its imports) to each startup milestone,
+    # recorded the first time it is reached, so a restart's time to its first relayed message
+    # shows up in the log and on /metrics.
+    def __init__(self, started: float):
+        self.started = started
+        self.phases = {}
+
+    def mark(self, phase: str):
+        if phase not in self.phases:
+            self.phases[phase] = time.monotonic() - self.started
+            print(f"Startup: {phase.replace('_', ' ')} after {self.phases[phase]:.2f}s")
+
+startup_timer = StartupTimer(BRIDGE_STARTED)
+metrics.describe("bridge_startup_seconds", "gauge", "Seconds from process start to each startup milestone")
+
+# --------------------------
+# Outbound Radio Sender
+# --------------------------
+class RadioUnavailable(Exception):
+    pass
+
+def _encode_bytes(value):
+    if isinstance(value, bytes):
+        return {"__bytes__": value.hex()}
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _decode_bytes(value: dict):
+    return bytes.fromhex(value["__bytes__"]) if "__bytes__" in value else value
+
+class RadioCall:
+    # A write to the radio described as data, so it can wait in the durable outbound queue
+    # across reconnects and restarts and then run against whichever interface is current.
+    __slots__ = ("method", "args", "kwargs")
+
+    def __init__(self, method: str, *args, **kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self, interface):
+        return getattr(interface, self.method)(*self.args, **self.kwargs)
+
+    def to_json(self) -> str:
+        return json.dumps([self.method, self.args, self.kwargs], default=_encode_bytes)
+
+    @classmethod
+    def from_json(cls, text: str) -> "RadioCall":
+        method, args, kwargs = json.loads(text, object_hook=_decode_bytes)
+        return cls(method, *args, **kwargs)
+
+class RadioSender:
+    # All writes to the TCPInterface go through one dedicated thread, so a stalled
+    # socket to the node never blocks the Discord event loop and writes keep their order.
+    # Each radio has its own sender, so one stalled radio does not hold up writes to another.
+    def __init__(self, name: str = "primary"):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"meshtastic-sender-{name}")
+        self.supervisor = None  # Set when the radio is assembled (see Radio)
+
+    def _run(self, call: RadioCall):
+        interface = self.supervisor.interface
+        if interface is None or not self.supervisor.connected:
+            raise RadioUnavailable("Radio link is down")
+        try:
+            return call(interface)
+        except OSError as e:
+            self.supervisor.mark_down(e)
+            raise RadioUnavailable(f"Radio link lost: {e}") from e
+
+    def submit(self, call: RadioCall) -> asyncio.Future:
+        # Returns an awaitable resolving to the call's result (or raising its exception).
+        return asyncio.get_running_loop().run_in_executor(self._executor, self._run, call)
+
+    def run_blocking(self, call: RadioCall, timeout: float):
+        # For callers on other threads (the connection supervisor).
+        return self._executor.submit(self._run, call).result(timeout)
+
+radio_sender = RadioSender()
+
+class OutboundQueue:
+    # Bounded FIFO of sends waiting for the link to come back, kept in SQLite so it
+    # survives restarts. When full, the oldest entry of whoever has the most entries is
+    # dropped and counted as lost, so one busy user cannot push out everyone else's messages.
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._db = None
+        self._count = 0
+        self.queued_total = 0
+        self.lost = 0
+
+    def open(self):
+        # Called when the bridge starts rather than on import, so importing main.py creates no files.
+        if self._db is not None:
+            return
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbound ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, call TEXT NOT NULL, priority INTEGER NOT NULL, "
+            "owner TEXT NOT NULL, airtime REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._count = self._db.execute("SELECT COUNT(*) FROM outbound").fetchone()[0]
+
+    def __len__(self):
+        return self._count
+
+    def push(self, call: RadioCall, priority: int, owner, airtime: float) -> tuple[int, list[int]]:
+        dropped = []
+        while self._count >= self.max_entries:
+            # The new row counts towards its owner, so a user at the top only displaces their own.
+            heaviest = self._db.execute(
+                "SELECT owner FROM outbound GROUP BY owner "
+                "ORDER BY COUNT(*) + (owner = ?) DESC, MIN(id) LIMIT 1", (json.dumps(owner),)
+            ).fetchone()[0]
+            row_id = self._db.execute("SELECT MIN(id) FROM outbound WHERE owner = ?", (heaviest,)).fetchone()[0]
+            self._db.execute("DELETE FROM outbound WHERE id = ?", (row_id,))
+            dropped.append(row_id)
+            self._count -= 1
+            self.lost += 1
+        cursor = self._db.execute(
+            "INSERT INTO outbound (call, priority, owner, airtime) VALUES (?, ?, ?, ?)",
+            (call.to_json(), priority, json.dumps(owner), airtime)
+        )
+        self._db.commit()
+        self._count += 1
+        self.queued_total += 1
+        return cursor.lastrowid, dropped
+
+    def load(self) -> list[tuple]:
+        return [
+            (row_id, RadioCall.from_json(call), priority, json.loads(owner), airtime)
+            for row_id, call, priority, owner, airtime in self._db.execute(
+                "SELECT id, call, priority, owner, airtime FROM outbound ORDER BY id"
+            )
+        ]
+
+    def delete(self, row_id: int):
+        cursor = self._db.execute("DELETE FROM outbound WHERE id = ?", (row_id,))
+        self._db.commit()
+        self._count -= cursor.rowcount
+
+outbound_queue = OutboundQueue(OUTBOUND_QUEUE_PATH, OUTBOUND_QUEUE_MAX)
+
+# --------------------------
+# Airtime-Aware Transmit Scheduler
+# --------------------------
+# (spreading factor, bandwidth Hz, coding rate denominator) for each Meshtastic modem preset
+LORA_MODEM_PRESETS = {
+    "SHORT_TURBO": (7, 500000, 5),
+    "SHORT_FAST": (7, 250000, 5),
+    "SHORT_SLOW": (8, 250000, 5),
+    "MEDIUM_FAST": (9, 250000, 5),
+    "MEDIUM_SLOW": (10, 250000, 5),
+    "LONG_FAST": (11, 250000, 5),
+    "LONG_MODERATE": (11, 125000, 8),
+    "LONG_SLOW": (12, 125000, 8),
+    "VERY_LONG_SLOW": (12, 62500, 8),
+}
+LORA_PREAMBLE_SYMBOLS = 16
+MESH_PACKET_OVERHEAD = 20  # Meshtastic header plus Data protobuf framing, in bytes
+POSITION_PAYLOAD_LEN = 24   # Typical encoded Position protobuf
+TELEMETRY_PAYLOAD_LEN = 24  # Typical encoded DeviceMetrics telemetry
+TRACEROUTE_PAYLOAD_LEN = 8  # RouteDiscovery grows with each hop; this covers the outbound request
+
+TX_PRIORITY_DIRECT = 0      # DMs, acks and other interactive sends
+TX_PRIORITY_AUTO_REPLY = 1  # Unattended-mode LLM replies
+TX_PRIORITY_BULK = 2        # Custom data and other bulk traffic
+TX_PRIORITY_COUNT = 3
+
+def estimate_airtime(payload_len: int, preset: str) -> float:
+    # Semtech time-on-air formula (explicit header, CRC on), in seconds.
+    sf, bw, cr = LORA_MODEM_PRESETS.get(preset, LORA_MODEM_PRESETS["LONG_FAST"])
+    symbol_time = (2 ** sf) / bw
+    low_data_rate = 1 if symbol_time > 0.016 else 0
+    payload_bits = 8 * (payload_len + MESH_PACKET_OVERHEAD) - 4 * sf + 28 + 16
+    payload_symbols = 8 + max(math.ceil(payload_bits / (4 * (sf - 2 * low_data_rate))) * cr, 0)
+    return (LORA_PREAMBLE_SYMBOLS + 4.25 + payload_symbols) * symbol_time
+
+def detect_modem_preset(interface):
+    # None while the radio is not connected (or does not say), so the caller asks again later.
+    if LORA_MODEM_PRESET:
+        return LORA_MODEM_PRESET
+    if interface is None or getattr(interface, "localNode", None) is None:
+        return None
+    try:
+        modem_preset = interface.localNode.localConfig.lora.modem_preset
+        return config_pb2.Config.LoRaConfig.ModemPreset.Name(modem_preset)
+    except Exception as e:
+        print(f"Could not read modem preset from node, assuming LONG_FAST for now: {e}")
+        return None
+
+class TransmitQueueFull(Exception):
+    pass
+
+class TxJob:
+    __slots__ = ("call", "airtime", "priority", "owner", "future", "queue_depth", "estimated_wait", "row_id", "queued_at")
+
+    def __init__(self, call: RadioCall, airtime: float, priority: int, owner):
+        self.call = call
+        self.airtime = airtime
+        self.priority = priority
+        self.owner = owner
+        self.future = None
+        self.queue_depth = 0
+        self.estimated_wait = 0.0
+        self.row_id = None  # Set once the job has been written to the outbound queue
+        self.queued_at = time.monotonic()
+
+class TransmitScheduler:
+    # Token bucket measured in seconds of airtime: it refills at duty_cycle seconds per
+    # second and holds at most burst_airtime. Within a priority class, owners (Discord
+    # users, or the auto-reply engine) are served round-robin so nobody can hog the channel.
+    # A job counts against its owner's limit from submit until it is sent, fails or is
+    # dropped, including while it is parked in the outbound queue. Every job is written to
+    # the outbound queue when submitted and deleted once finished, so a restart loses neither
+    # parked jobs nor those waiting for airtime.
+    def __init__(self, duty_cycle: float, burst_airtime: float, max_queued_per_owner: int):
+        self.duty_cycle = duty_cycle
+        self.burst_airtime = burst_airtime
+        self.max_queued_per_owner = max_queued_per_owner
+        self.preset = None
+        self.tokens = burst_airtime
+        self._refilled_at = time.monotonic()
+        self._queues = [collections.OrderedDict() for _ in range(TX_PRIORITY_COUNT)]  # owner -> deque of jobs
+        self._queued_airtime = [0.0] * TX_PRIORITY_COUNT
+        self._per_owner = collections.Counter()  # owner -> jobs queued or parked
+        self.depth = 0
+        self._persisted = {}  # outbound queue row id -> job, for jobs with a row on disk
+        self._parked = set()  # row ids of jobs waiting for the link to come back
+        self._wakeup = None
+        self._task = None
+        self.sender = None      # This radio's sender, supervisor and outbound queue,
+        self.supervisor = None  # set when the radio is assembled (see Radio)
+        self.outbound = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst_airtime, self.tokens + (now - self._refilled_at) * self.duty_cycle)
+        self._refilled_at = now
+
+    def submit(self, call: RadioCall, payload_len: int, priority: int, owner) -> TxJob:
+        return self.submit_many([(call, payload_len)], priority, owner)[0]
+
+    def submit_many(self, calls: list, priority: int, owner) -> list[TxJob]:
+        # The packets of one message, as (call, payload_len) pairs. They are admitted together,
+        # so a long text split into fragments counts once against the per-owner limit.
+        if self._per_owner[owner] >= self.max_queued_per_owner:
+            raise TransmitQueueFull(f"{self._per_owner[owner]} transmissions already queued, try again shortly")
+        if self.preset is None:
+            self.preset = detect_modem_preset(self.supervisor.interface)
+        preset = self.preset or "LONG_FAST"  # Estimates only; not kept, so the real preset is used once known
+        loop = asyncio.get_running_loop()
+        self._refill()
+        jobs = []
+        for call, payload_len in calls:
+            job = TxJob(call, estimate_airtime(payload_len, preset), priority, owner)
+            job.future = loop.create_future()
+            airtime_ahead = sum(self._queued_airtime[:priority + 1])
+            job.queue_depth = self.depth
+            job.estimated_wait = max(0.0, (airtime_ahead + job.airtime - self.tokens) / self.duty_cycle)
+            self._per_owner[owner] += 1
+            self._persist(job)
+            self._enqueue(job)
+            jobs.append(job)
+        return jobs
+
+    def _enqueue(self, job: TxJob, front: bool = False):
+        queue = self._queues[job.priority]
+        jobs = queue.setdefault(job.owner, collections.deque())
+        if front:
+            jobs.appendleft(job)
+            queue.move_to_end(job.owner, last=False)
+        else:
+            jobs.append(job)
+        self._queued_airtime[job.priority] += job.airtime
+        self.depth += 1
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        self._wakeup.set()
+
+    def _persist(self, job: TxJob) -> bool:
+        try:
+            row_id, dropped = self.outbound.push(job.call, job.priority, job.owner, job.airtime)
+        except Exception as e:
+            print(f"Error saving a send to the outbound queue: {e}")
+            return False
+        job.row_id = row_id
+        self._persisted[row_id] = job
+        for dropped_id in dropped:
+            lost = self._persisted.pop(dropped_id, None)
+            if lost is None:
+                continue
+            lost.row_id = None
+            if dropped_id in self._parked:
+                self._parked.discard(dropped_id)
+                self._release(lost)
+            # A queued job stays in its queue; _run sees the failed future and skips it.
+            if not lost.future.done():
+                lost.future.set_exception(RadioUnavailable("Dropped from the full outbound queue"))
+        return True
+
+    def _park(self, job: TxJob):
+        # Jobs whose row could not be written when submitted get another try here.
+        if job.row_id is None and not self._persist(job):
+            # Fail this send rather than the scheduler task, which every other job depends on.
+            self._release(job)
+            if not job.future.done():
+                job.future.set_exception(RadioUnavailable("Radio link is down and the send could not be queued"))
+            return
+        self._parked.add(job.row_id)
+
+    def _release(self, job: TxJob):
+        self._per_owner[job.owner] -= 1
+        if self._per_owner[job.owner] <= 0:
+            del self._per_owner[job.owner]
+
+    def _finish(self, job: TxJob):
+        self._release(job)
+        if job.row_id is not None:
+            self._persisted.pop(job.row_id, None)
+            try:
+                self.outbound.delete(job.row_id)
+            except Exception as e:
+                print(f"Error removing a finished send from the outbound queue: {e}")
+
+    def resume(self):
+        # Called on the event loop once the radio link is up: parked jobs, and any left on
+        # disk by a previous run, go back to the front of their queues in original order.
+        # The radio may have come back with another modem preset, so it is read again.
+        self.preset = detect_modem_preset(self.supervisor.interface)
+        loop = asyncio.get_running_loop()
+        for row_id, call, priority, owner, airtime in reversed(self.outbound.load()):
+            job = self._persisted.get(row_id)
+            if job is None:
+                job = TxJob(call, airtime, priority, owner)
+                job.row_id = row_id
+                job.future = loop.create_future()
+                job.future.add_done_callback(lambda f: f.cancelled() or f.exception())  # Nobody awaits these
+                self._persisted[row_id] = job
+                self._per_owner[owner] += 1
+            elif row_id not in self._parked:
+                continue
+            self._parked.discard(row_id)
+            self._enqueue(job, front=True)
+
+    def _peek(self):
+        for queue in self._queues:
+            if queue:
+                return queue, next(iter(queue))
+        return None, None
+
+    def _pop(self, queue, owner) -> TxJob:
+        jobs = queue[owner]
+        job = jobs.popleft()
+        if jobs:
+            queue.move_to_end(owner)
+        else:
+            del queue[owner]
+        self._queued_airtime[job.priority] -= job.airtime
+        self.depth -= 1
+        return job
+
+    async def _run(self):
+        while True:
+            queue, owner = self._peek()
+            if queue is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if queue[owner][0].future.done():
+                # Cancelled by its caller, or dropped from the full outbound queue.
+                self._finish(self._pop(queue, owner))
+                continue
+            if not self.supervisor.connected:
+                self._park(self._pop(queue, owner))
+                continue
+            # Packets longer than the whole bucket go out once it is full and leave it in debt.
+            needed = min(queue[owner][0].airtime, self.burst_airtime)
+            self._refill()
+            if self.tokens < needed:
+                # Re-check after the deficit is paid off, or sooner if a higher-priority job arrives.
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), (needed - self.tokens) / self.duty_cycle)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job = self._pop(queue, owner)
+            self.tokens -= job.airtime
+            try:
+                result = await self.sender.submit(job.call)
+            except RadioUnavailable:
+                # Nothing went on air; hold the job until the supervisor reconnects.
+                self.tokens += job.airtime
+                self._park(job)
+                continue
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                metrics.observe(
+                    "bridge_radio_write_seconds", time.monotonic() - job.queued_at,
+                    (("radio", self.supervisor.radio.name), ("priority", job.priority))
+                )
+                capture_writer.record(CAPTURE_OUT, {"radio": self.supervisor.radio.name, "call": job.call.to_json()})
+                if not job.future.done():
+                    job.future.set_result(result)
+                if job.call.method == "sendText":
+                    message_archive.record(
+                        "out", local_node_id(), str(job.call.kwargs.get("destinationId", "^all")),
+                        job.call.kwargs.get("channelIndex", 0), job.call.args[0]
+                    )
+            self._finish(job)
+
+tx_scheduler = TransmitScheduler(TX_DUTY_CYCLE, TX_BURST_AIRTIME, TX_MAX_QUEUED_PER_USER)
+
+def queue_note(pending: str, jobs: list, scheduler: TransmitScheduler = tx_scheduler) -> str:
+    pending = f"{pending}\nQueue depth: {jobs[0].queue_depth}, estimated wait: {jobs[-1].estimated_wait:.0f}s"
+    if not scheduler.supervisor.connected:
+        pending = f"{pending}\nRadio link is down; this will be sent once it reconnects."
+    return pending
+
+async def send_and_report(interaction: discord.Interaction, call, pending: str, done: str, error: str,
+                          title: str = None, ephemeral: bool = False,
+                          payload_len: int = None, priority: int = TX_PRIORITY_DIRECT):
+    # Acknowledge the interaction right away, then edit the reply once the radio write finishes.
+    # Sends with a payload_len go through the transmit scheduler; others (e.g. heartbeats) never reach the air.
+    if payload_len is not None:
+        try:
+            job = tx_scheduler.submit(call, payload_len, priority, interaction.user.id)
+        except TransmitQueueFull as e:
+            await interaction.response.send_message(f"{error}: {e}", ephemeral=ephemeral)
+            return
+        result = job.future
+        pending = queue_note(pending, [job])
+    else:
+        result = radio_sender.submit(call)
+    await report_send(interaction, result, pending, done, error, title, ephemeral)
+
+async def report_send(interaction: discord.Interaction, result, pending: str, done: str, error: str,
+                      title: str = None, ephemeral: bool = False) -> bool:
+    # Returns whether the send went through.
+    if title is not None:
+        embed = Embed(title=title, description=pending, color=Color.light_grey())
+        if ephemeral:
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        else:
+            await interaction.response.send_message(embed=embed, view=DismissView())
+    else:
+        await interaction.response.send_message(pending, ephemeral=ephemeral)
+    try:
+        await result
+    except Exception as e:
+        await interaction.edit_original_response(content=f"{error}: {e}", embed=None)
+        return False
+    await edit_report(interaction, done, title)
+    return True
+
+async def edit_report(interaction: discord.Interaction, text: str, title: str = None, color: Color = Color.green()):
+    if title is not None:
+        await interaction.edit_original_response(embed=Embed(title=title, description=text, color=color))
+    else:
+        await interaction.edit_original_response(content=text)
+
+# --------------------------
+# Create Bot Client and Command Tree
+# --------------------------
+intents = discord.Intents.default()
+intents.message_content = True
+bot = commands.Bot(command_prefix="!", intents=intents)
+tree = bot.tree
+discord_ready = asyncio.Event()  # Set on the first on_ready; Discord posts made before it wait
+
+# --------------------------
+# Global Variables for Unattended Mode
+# --------------------------
+unattended_mode = False
+
+# --------------------------
+# Duplicate Packet Suppression
+# --------------------------
+DEDUP_MAX_ENTRIES = 4096   # Per table; oldest entries are evicted first
+DEDUP_ID_WINDOW = 600.0    # Seconds a (sender, packet id) pair is remembered
+DEDUP_TEXT_WINDOW = 60.0   # Seconds identical text from the same sender counts as a rebroadcast
+
+class DuplicateFilter:
+    # Rebroadcasts keep the original packet id, and multi-hop copies can arrive with a
+    # different id but the same text, so both keys are checked. Each table is an
+    # OrderedDict in first-seen order, which makes time and size eviction pop from the front.
+    def __init__(self, max_entries: int, id_window: float, text_window: float):
+        self.max_entries = max_entries
+        self.id_window = id_window
+        self.text_window = text_window
+        self._ids = collections.OrderedDict()
+        self._texts = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _seen(self, table: collections.OrderedDict, key, window: float, now: float) -> bool:
+        while table:
+            oldest_key, seen_at = next(iter(table.items()))
+            if now - seen_at < window and len(table) < self.max_entries:
+                break
+            del table[oldest_key]
+        if key in table:
+            return True
+        table[key] = now
+        return False
+
+    def is_duplicate(self, packet: dict) -> bool:
+        now = time.monotonic()
+        sender = packet.get("fromId") or packet.get("from")
+        packet_id = packet.get("id")
+        text = packet.get("decoded", {}).get("text")
+        with self._lock:
+            duplicate = False
+            if packet_id:
+                duplicate = self._seen(self._ids, (sender, packet_id), self.id_window, now)
+            if text:
+                # Only copies of one send match: the same words to another channel or node are a new message.
+                key = hash((sender, packet.get("toId") or packet.get("to"), packet.get("channel", 0), text))
+                duplicate = self._seen(self._texts, key, self.text_window, now) or duplicate
+            if duplicate:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return duplicate
+
+duplicate_filter = DuplicateFilter(DEDUP_MAX_ENTRIES, DEDUP_ID_WINDOW, DEDUP_TEXT_WINDOW)
+
+# --------------------------
+# Node Registry
+# --------------------------
+class NodeRecord:
+    __slots__ = ("node_id", "long_name", "short_name", "last_heard", "snr", "is_favorite", "device_metrics")
+
+    def __init__(self, node_id: str, node: dict):
+        self.node_id = node_id
+        self.update(node)
+
+    def update(self, node: dict):
+        user = node.get("user", {})
+        self.long_name = user.get("longName", "Unknown")
+        self.short_name = user.get("shortName", "N/A")
+        self.last_heard = node.get("lastHeard") or 0
+        self.snr = node.get("snr", "N/A")
+        self.is_favorite = bool(node.get("isFavorite", False))
+        self.device_metrics = node.get("deviceMetrics", {})
+
+def node_id_of(node: dict):
+    node_id = node.get("user", {}).get("id")
+    if node_id is None and node.get("num") is not None:
+        node_id = f"!{node['num']:08x}"
+    return node_id
+
+class NodeRegistry:
+    # Bot-side view of the NodeDB kept current from pubsub events. _by_recency is a sorted
+    # list of (-lastHeard, node id), so the most recently heard nodes are a slice away.
+    def __init__(self):
+        self._nodes = {}
+        self._by_recency = []
+        self._favorites = set()
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snapshot = None
+        self._snapshot_version = -1
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def load(self, nodes: dict):
+        with self._lock:
+            self._nodes = {}
+            self._favorites = set()
+            for node in nodes.values():
+                node_id = node_id_of(node)
+                if node_id is not None:
+                    self._nodes[node_id] = NodeRecord(node_id, node)
+            self._by_recency = sorted((-record.last_heard, node_id) for node_id, record in self._nodes.items())
+            self._favorites = {node_id for node_id, record in self._nodes.items() if record.is_favorite}
+            self._version += 1
+
+    def upsert(self, node: dict):
+        node_id = node_id_of(node)
+        if node_id is None:
+            return
+        with self._lock:
+            record = self._nodes.get(node_id)
+            if record is None:
+                record = self._nodes[node_id] = NodeRecord(node_id, node)
+            else:
+                old_key = (-record.last_heard, node_id)
+                record.update(node)
+                if old_key == (-record.last_heard, node_id):
+                    self._update_favorite(record)
+                    return
+                del self._by_recency[bisect.bisect_left(self._by_recency, old_key)]
+            bisect.insort(self._by_recency, (-record.last_heard, node_id))
+            self._version += 1
+            self._update_favorite(record)
+
+    def _update_favorite(self, record: NodeRecord):
+        if record.is_favorite:
+            self._favorites.add(record.node_id)
+        else:
+            self._favorites.discard(record.node_id)
+
+    def get(self, node_id: str):
+        return self._nodes.get(node_id)
+
+    def recent(self, start: int = 0, count: int = None) -> list[NodeRecord]:
+        with self._lock:
+            end = len(self._by_recency) if count is None else start + count
+            return [self._nodes[node_id] for _, node_id in self._by_recency[start:end]]
+
+    def snapshot(self) -> list[NodeRecord]:
+        # Every caller gets the same list until the ordering changes; treat it as read-only.
+        with self._lock:
+            if self._snapshot_version != self._version:
+                self._snapshot = [self._nodes[node_id] for _, node_id in self._by_recency]
+                self._snapshot_version = self._version
+            return self._snapshot
+
+    def favorites(self) -> list[NodeRecord]:
+        with self._lock:
+            return [self._nodes[node_id] for node_id in self._favorites]
+
+node_registry = NodeRegistry()
+
+NODE_RENDER_CACHE_SIZE = 1024  # Nodes whose rendered views are kept
+
+class NodeRenderCache:
+    # Rendered text for a node (e.g. its /info page), shared by every view and user.
+    # All renderings of a node are dropped together when that node updates.
+    def __init__(self, max_nodes: int):
+        self.max_nodes = max_nodes
+        self._entries = collections.OrderedDict()  # node id -> {kind: rendered value}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, node_id: str, kind: str, render):
+        # Rendering happens under the lock so an update racing with it cannot leave a stale entry behind.
+        with self._lock:
+            rendered = self._entries.get(node_id)
+            if rendered is not None and kind in rendered:
+                self._entries.move_to_end(node_id)
+                self.hits += 1
+                return rendered[kind]
+            value = render()
+            self.misses += 1
+            self._entries.setdefault(node_id, {})[kind] = value
+            self._entries.move_to_end(node_id)
+            while len(self._entries) > self.max_nodes:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, node_id: str):
+        with self._lock:
+            self._entries.pop(node_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+node_render_cache = NodeRenderCache(NODE_RENDER_CACHE_SIZE)
+
+# --------------------------
+# Node Position Index
+# --------------------------
+NEARBY_CELL_DEGREES = 0.05   # Grid cell size, about 5.5 km north-south
+NEARBY_DEFAULT_COUNT = 10
+NEARBY_MAX_RESULTS = 25      # Rows /nearby shows at most
+EARTH_RADIUS_KM = 6371.0088
+COMPASS_POINTS = ("N", "NE", "E", "SE", "S", "SW", "W", "NW")
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def initial_bearing(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    delta = math.radians(lon2 - lon1)
+    x = math.sin(delta) * math.cos(phi2)
+    y = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(delta)
+    return math.degrees(math.atan2(x, y)) % 360
+
+def compass_point(bearing: float) -> str:
+    return COMPASS_POINTS[round(bearing / 45) % len(COMPASS_POINTS)]
+
+def position_coordinates(position: dict):
+    # The library fills latitude/longitude in from the integer fields; 0,0 means no fix.
+    lat, lon = position.get("latitude"), position.get("longitude")
+    if lat is None or lon is None or (lat == 0 and lon == 0):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+class PositionIndex:
+    # Node positions bucketed into a uniform lat/lon grid. A move touches at most two cells,
+    # and queries only read the cells around the point, widening ring by ring until no
+    # unvisited cell can hold anything closer. Sparse corners of the world fall back to a scan.
+    def __init__(self, cell_degrees: float):
+        self.cell = cell_degrees
+        self.rows = math.ceil(180 / cell_degrees)
+        self.columns = math.ceil(360 / cell_degrees)
+        self._positions = {}  # node id -> (lat, lon, cell)
+        self._cells = {}      # (row, column) -> set of node ids
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _cell_of(self, lat: float, lon: float) -> tuple[int, int]:
+        return min(int((lat + 90) / self.cell), self.rows - 1), int((lon + 180) / self.cell) % self.columns
+
+    def _update(self, node_id: str, lat: float, lon: float):
+        cell = self._cell_of(lat, lon)
+        old = self._positions.get(node_id)
+        if old is None or old[2] != cell:
+            if old is not None:
+                members = self._cells[old[2]]
+                members.discard(node_id)
+                if not members:
+                    del self._cells[old[2]]
+            self._cells.setdefault(cell, set()).add(node_id)
+        self._positions[node_id] = (lat, lon, cell)
+
+    def update(self, node_id: str, position: dict):
+        coordinates = position_coordinates(position)
+        if node_id is None or coordinates is None:
+            return
+        with self._lock:
+            self._update(node_id, *coordinates)
+
+    def load(self, nodes: dict):
+        with self._lock:
+            self._positions = {}
+            self._cells = {}
+            for node in nodes.values():
+                node_id = node_id_of(node)
+                coordinates = position_coordinates(node.get("position") or {})
+                if node_id is not None and coordinates is not None:
+                    self._update(node_id, *coordinates)
+
+    def get(self, node_id: str):
+        entry = self._positions.get(node_id)
+        return entry[:2] if entry is not None else None
+
+    def _ring(self, row: int, column: int, radius: int):
+        # Cells at exactly Chebyshev distance radius from (row, column); columns wrap at the antimeridian.
+        if radius == 0:
+            yield row, column
+            return
+        for r in range(max(row - radius, 0), min(row + radius, self.rows - 1) + 1):
+            edge = r in (row - radius, row + radius)
+            for c in (range(column - radius, column + radius + 1) if edge else (column - radius, column + radius)):
+                yield r, c % self.columns
+
+    def _clearance_km(self, lat: float, radius: int) -> float:
+        # Lower bound on the distance from the query point to any cell outside the searched rings:
+        # exact along a meridian, and from the haversine formula at the most poleward latitude across one.
+        span = math.radians(radius * self.cell)
+        widest = math.radians(min(90.0, abs(lat) + (radius + 1) * self.cell))
+        across = 2 * math.asin(min(1.0, math.cos(widest) * math.sin(min(span, math.pi) / 2)))
+        return EARTH_RADIUS_KM * min(span, across)
+
+    def _result(self, lat: float, lon: float, node_id: str, distance: float) -> tuple:
+        nlat, nlon, _ = self._positions[node_id]
+        return node_id, distance, initial_bearing(lat, lon, nlat, nlon)
+
+    def _scan(self, lat: float, lon: float, exclude) -> list[tuple]:
+        return sorted(
+            (haversine_km(lat, lon, nlat, nlon), node_id)
+            for node_id, (nlat, nlon, _) in self._positions.items() if node_id != exclude
+        )
+
+    def nearest(self, lat: float, lon: float, count: int, exclude: str = None) -> list[tuple]:
+        # (node id, km, bearing) for the count nodes closest to the point, nearest first.
+        with self._lock:
+            total = len(self._positions) - (exclude in self._positions)
+            row, column = self._cell_of(lat, lon)
+            found = {}
+            radius = 0
+            while len(found) < total:
+                if 8 * radius > len(self._cells):
+                    # The next ring has more cells than the whole index has occupied ones.
+                    found = None
+                    break
+                for cell in self._ring(row, column, radius):
+                    for node_id in self._cells.get(cell, ()):
+                        if node_id != exclude:
+                            nlat, nlon, _ = self._positions[node_id]
+                            found[node_id] = haversine_km(lat, lon, nlat, nlon)
+                if len(found) >= count and heapq.nsmallest(count, found.values())[-1] <= self._clearance_km(lat, radius):
+                    break
+                radius += 1
+            if found is None:
+                ranked = self._scan(lat, lon, exclude)
+            else:
+                ranked = sorted((distance, node_id) for node_id, distance in found.items())
+            return [self._result(lat, lon, node_id, distance) for distance, node_id in ranked[:count]]
+
+    def within(self, lat: float, lon: float, radius_km: float, exclude: str = None) -> list[tuple]:
+        # (node id, km, bearing) for every node within radius_km of the point, nearest first.
+        with self._lock:
+            dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+            low_row, column = self._cell_of(max(lat - dlat, -90.0), lon)
+            high_row, _ = self._cell_of(min(lat + dlat, 90.0), lon)
+            widest = math.radians(min(90.0, abs(lat) + dlat))
+            ratio = math.sin(min(radius_km / EARTH_RADIUS_KM, math.pi) / 2) / max(math.cos(widest), 1e-12)
+            span = self.columns if ratio >= 1 else math.ceil(math.degrees(2 * math.asin(ratio)) / self.cell) + 1
+            if (high_row - low_row + 1) * min(2 * span + 1, self.columns) > len(self._cells):
+                ranked = [(distance, node_id) for distance, node_id in self._scan(lat, lon, exclude) if distance <= radius_km]
+            else:
+                ranked = []
+                columns = {c % self.columns for c in range(column - span, column + span + 1)}
+                for r in range(low_row, high_row + 1):
+                    for c in columns:
+                        for node_id in self._cells.get((r, c), ()):
+                            nlat, nlon, _ = self._positions[node_id]
+                            distance = haversine_km(lat, lon, nlat, nlon)
+                            if distance <= radius_km and node_id != exclude:
+                                ranked.append((distance, node_id))
+                ranked.sort()
+            return [self._result(lat, lon, node_id, distance) for distance, node_id in ranked]
+
+node_positions = PositionIndex(NEARBY_CELL_DEGREES)
+
+def on_meshtastic_node_updated(node, interface):
+    try:
+        node_registry.upsert(node)
+        node_render_cache.invalidate(node_id_of(node))
+        node_positions.update(node_id_of(node), node.get("position") or {})
+    except Exception as ex:
+        print(f"Error updating node registry: {ex}")
+
+# --------------------------
+# Inbound Packet Ingestion
+# --------------------------
+INGEST_QUEUE_MAX = setting("INGEST_QUEUE_MAX", 2048)  # Packets waiting for the event loop
+INGEST_OVERFLOW_POLICY = setting("INGEST_OVERFLOW_POLICY", "drop_oldest")  # or "drop_low_priority": shed position/telemetry/etc. before text
+INGEST_PRIORITIES = {                    # Lower is more important; unlisted portnums rank last
+    "TEXT_MESSAGE_APP": 0,
+    "ROUTING_APP": 0,
+    "PRIVATE_APP": 0,                    # Compressed text between bridges
+    "TRACEROUTE_APP": 1,
+    "POSITION_APP": 2,
+    "TELEMETRY_APP": 2,
+    "NODEINFO_APP": 3,
+}
+INGEST_DEFAULT_PRIORITY = 4
+
+def packet_portnum(packet: dict):
+    return packet.get("decoded", {}).get("portnum")
+
+class PacketIngest:
+    # Hands packets from the meshtastic reader thread to the event loop in batches: the
+    # reader appends under a short lock, and only the first packet of a batch pays for a
+    # loop wakeup. The loop then runs the registered handlers for the whole batch.
+    # Every radio has its own ingest, so a flood on one cannot shed another's packets;
+    # the extra radios share the primary's handler table.
+    def __init__(self, max_depth: int, overflow_policy: str, handlers: dict = None, primary: bool = True):
+        self.max_depth = max_depth
+        self.overflow_policy = overflow_policy
+        self.primary = primary
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self.handlers = {} if handlers is None else handlers  # portnum -> (handler, primary_only) run on the event loop
+        self.loop = None
+        self.started = time.monotonic()
+        self.received = 0
+        self.dropped = 0
+        self.batches = 0
+        self.max_batch = 0
+        self._rate_samples = collections.deque(maxlen=32)  # (monotonic time, received) at each drain
+
+    def register(self, portnum: str, handler, primary_only: bool = False):
+        # primary_only handlers answer over the radio (acks, transfers, traceroutes), which is the primary's.
+        self.handlers.setdefault(portnum, []).append((handler, primary_only))
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        with self._lock:
+            if not self._queue or self._scheduled:
+                return
+            self._scheduled = True
+        loop.call_soon_threadsafe(self._drain)
+
+    def _shed(self, packet: dict) -> bool:
+        # Queue is full: make room per the overflow policy. False means the new packet is dropped instead.
+        if self.overflow_policy == "drop_low_priority":
+            incoming = INGEST_PRIORITIES.get(packet_portnum(packet), INGEST_DEFAULT_PRIORITY)
+            worst_index, worst = None, incoming
+            for index, queued in enumerate(self._queue):
+                priority = INGEST_PRIORITIES.get(packet_portnum(queued), INGEST_DEFAULT_PRIORITY)
+                if priority > worst:
+                    worst_index, worst = index, priority
+            if worst_index is None:
+                return False
+            del self._queue[worst_index]
+        else:
+            self._queue.popleft()
+        return True
+
+    def put(self, packet: dict):
+        # Called on the reader thread.
+        if packet_portnum(packet) not in self.handlers:
+            return
+        with self._lock:
+            self.received += 1
+            if len(self._queue) >= self.max_depth:
+                self.dropped += 1
+                if not self._shed(packet):
+                    return
+            self._queue.append(packet)
+            if self._scheduled or self.loop is None:
+                return
+            self._scheduled = True
+        self.loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self):
+        with self._lock:
+            batch, self._queue = self._queue, collections.deque()
+            self._scheduled = False
+            self._rate_samples.append((time.monotonic(), self.received))
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        now = time.monotonic()
+        ack = None
+        for packet in batch:
+            ack = packet.get("daemonAck", ack)
+            portnum = packet_portnum(packet)
+            metrics.inc("bridge_packets_total", (("radio", packet.get("radio", PRIMARY_RADIO)), ("portnum", portnum)))
+            if "receivedAt" in packet:
+                metrics.observe("bridge_ingest_wait_seconds", now - packet["receivedAt"])
+            for handler, primary_only in self.handlers.get(portnum, ()):
+                if primary_only and not self.primary:
+                    continue
+                try:
+                    handler(packet)
+                except Exception as ex:
+                    print(f"Error handling {portnum} packet: {ex}")
+        if ack is not None:
+            # Packets from the radio daemon are only acked once handled, so the daemon keeps them
+            # for the next bot if this one dies first.
+            ack()
+
+    def stats(self) -> dict:
+        rate = 0.0
+        if len(self._rate_samples) > 1:
+            (first_time, first_count), (last_time, last_count) = self._rate_samples[0], self._rate_samples[-1]
+            rate = (last_count - first_count) / max(last_time - first_time, 1e-9)
+        return {
+            "depth": len(self._queue),
+            "received": self.received,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "max_batch": self.max_batch,
+            "packets_per_second": rate,
+        }
+
+packet_ingest = PacketIngest(INGEST_QUEUE_MAX, INGEST_OVERFLOW_POLICY)
+
+# --------------------------
+# Packet Capture and Replay
+# --------------------------
+CAPTURE_PATH = setting("CAPTURE_PATH", None)  # e.g. "bridge.capture": record every inbound packet and radio write here
+CAPTURE_MAX_BYTES = setting("CAPTURE_MAX_BYTES", 512 * 1024 * 1024)  # Capturing stops once the file reaches this size
+REPLAY_PATH = setting("REPLAY_PATH", None)  # A capture to replay instead of connecting to the radios
+REPLAY_SPEED = setting("REPLAY_SPEED", 1.0)  # 1 is real time, 60 plays an hour a minute; 0 replays as fast as possible
+CAPTURE_MAGIC = b"MBCAP\x01"
+CAPTURE_RECORD = struct.Struct(">IdB")  # Body length, wall-clock time, kind; the zlib-compressed JSON body follows
+CAPTURE_IN = 1
+CAPTURE_OUT = 2
+# Preset dictionary for the per-record compression: the keys and values every packet repeats.
+CAPTURE_DICTIONARY = (
+    '{"radio":"primary","packet":{"from":,"to":4294967295,"channel":0,"decoded":{"portnum":"TEXT_MESSAGE_APP",'
+    '"payload":{"__bytes__":""},"text":"","bitfield":1},"id":,"rxTime":,"rxSnr":,"rxRssi":,"hopLimit":3,'
+    '"hopStart":3,"wantAck":true,"priority":"RELIABLE","fromId":"!","toId":"^all","raw":null,"relayNode":'
+    '"POSITION_APP","position":{"latitudeI":,"longitudeI":,"altitude":,"time":,"latitude":,"longitude":'
+    '"TELEMETRY_APP","telemetry":{"time":,"deviceMetrics":{"batteryLevel":,"voltage":,"channelUtilization":,"airUtilTx":,"uptimeSeconds":'
+    '"NODEINFO_APP","user":{"id":"!","longName":"","shortName":"","macaddr":"","hwModel":"","publicKey":"'
+    '"ROUTING_APP","routing":{"errorReason":"NONE"},"requestId":"TRACEROUTE_APP","PRIVATE_APP",'
+    '{"call":"[\\"sendText\\",[\\"\\"],{\\"destinationId\\":\\"^all\\",\\"channelIndex\\":0,\\"wantAck\\":false}]"}'
+).encode("utf-8")
+
+def _capture_default(value):
+    # bytes as in the outbound queue; protobuf objects ("raw") are dropped.
+    return {"__bytes__": value.hex()} if isinstance(value, bytes) else None
+
+def _capture_object_hook(value: dict):
+    if value.get("raw", 0) is None:
+        del value["raw"]
+    return _decode_bytes(value)
+
+class CaptureWriter:
+    # Appends length-prefixed records to the capture file from a background thread. Callers
+    # only serialize the record (so later changes to the packet don't race the writer) and
+    # queue it; compression and file writes never happen on the reader thread or the loop.
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.records = 0
+        self.full = False
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._file = open(self.path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(CAPTURE_MAGIC)
+        self._thread = threading.Thread(target=self._run, daemon=True, name="capture-writer")
+        self._thread.start()
+
+    def record(self, kind: int, body: dict):
+        if self._thread is None or self.full:
+            return
+        try:
+            self._queue.put((time.time(), kind, json.dumps(body, separators=(",", ":"), default=_capture_default)))
+        except (TypeError, ValueError) as e:
+            print(f"Error capturing packet: {e}")
+
+    def _run(self):
+        while True:
+            ts, kind, text = self._queue.get()
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 15, 9, zlib.Z_DEFAULT_STRATEGY, CAPTURE_DICTIONARY)
+            body = compressor.compress(text.encode("utf-8")) + compressor.flush()
+            if self._file.tell() + CAPTURE_RECORD.size + len(body) > self.max_bytes:
+                self.full = True
+                self._file.flush()
+                print(f"Capture file {self.path} reached {self.max_bytes} bytes; capturing stopped")
+                return
+            self._file.write(CAPTURE_RECORD.pack(len(body), ts, kind))
+            self._file.write(body)
+            self.records += 1
+            if self._queue.empty():
+                self._file.flush()
+
+capture_writer = CaptureWriter(CAPTURE_PATH, CAPTURE_MAX_BYTES)
+
+def read_capture(path: str):
+    # Yields (wall-clock time, kind, body) for each record, reading the file through mmap.
+    # A record cut short by a crash ends the capture rather than raising.
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= len(CAPTURE_MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+                raise ValueError(f"{path} is not a bridge capture")
+            offset = len(CAPTURE_MAGIC)
+            while offset + CAPTURE_RECORD.size <= len(data):
+                length, ts, kind = CAPTURE_RECORD.unpack_from(data, offset)
+                offset += CAPTURE_RECORD.size
+                if offset + length > len(data):
+                    return
+                decompressor = zlib.decompressobj(15, CAPTURE_DICTIONARY)
+                text = decompressor.decompress(data[offset:offset + length]) + decompressor.flush()
+                offset += length
+                yield ts, kind, json.loads(text, object_hook=_capture_object_hook)
+
+def update_nodedb(nodes: dict, packet: dict):
+    # What the library does to its NodeDB for a received packet, for replayed ones.
+    node_id = packet.get("fromId")
+    if node_id is None:
+        return
+    node = nodes.setdefault(node_id, {"num": packet.get("from"), "user": {"id": node_id}})
+    node["lastHeard"] = packet.get("rxTime", int(time.time()))
+    decoded = packet.get("decoded", {})
+    if "user" in decoded:
+        node["user"] = decoded["user"]
+    if "position" in decoded:
+        node["position"] = decoded["position"]
+    if "deviceMetrics" in decoded.get("telemetry", {}):
+        node["deviceMetrics"] = decoded["telemetry"]["deviceMetrics"]
+
+class ReplayInterface:
+    # Stands in for TCPInterface while a capture is replayed. Writes go nowhere, though they
+    # are still scheduled, counted and captured.
+    def __init__(self, hostname: str):
+        self.hostname = hostname
+        self.nodes = {}
+        self.myInfo = None
+        self.metadata = None
+        self.localNode = None
+        self.isConnected = threading.Event()
+        self.isConnected.set()
+        self.writes = 0
+
+    def _write(self, *args, **kwargs):
+        self.writes += 1
+        return mesh_pb2.MeshPacket(id=random.getrandbits(32))
+
+    sendText = sendData = sendPosition = sendTelemetry = sendTraceRoute = _write
+
+    def sendHeartbeat(self):
+        pass
+
+    def close(self):
+        self.isConnected.clear()
+
+class CaptureReplayer:
+    # Feeds a capture's inbound packets through pubsub, as each radio's reader thread would,
+    # at speed times real time (0: as fast as possible). The bridge's own writes in the capture
+    # are not replayed; the bridge makes them again, and the summary compares the counts.
+    def __init__(self, path: str, speed: float):
+        self.path = path
+        self.speed = speed
+        self.replayed = 0
+        self.finished = threading.Event()
+        self._thread = None
+
+    def start(self, radios_by_name: dict):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(radios_by_name,), daemon=True, name="capture-replay")
+        self._thread.start()
+
+    def _run(self, radios_by_name: dict):
+        while not all(radio.supervisor.connected for radio in radios_by_name.values()):
+            time.sleep(0.05)
+        started = time.monotonic()
+        first = None
+        captured_writes = 0
+        try:
+            for ts, kind, body in read_capture(self.path):
+                if kind == CAPTURE_OUT:
+                    captured_writes += 1
+                    continue
+                first = ts if first is None else first
+                if self.speed:
+                    delay = started + (ts - first) / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                radio = radios_by_name.get(body.get("radio")) or radios_by_name[PRIMARY_RADIO]
+                interface = radio.supervisor.interface
+                update_nodedb(interface.nodes, body["packet"])
+                pub.sendMessage("meshtastic.receive", packet=body["packet"], interface=interface)
+                self.replayed += 1
+        except Exception as e:
+            print(f"Error replaying capture {self.path}: {e}")
+        writes = sum(getattr(radio.supervisor.interface, "writes", 0) for radio in radios_by_name.values())
+        print(
+            f"Replayed {self.replayed} packets from {self.path} in {time.monotonic() - started:.1f}s; "
+            f"the capture holds {captured_writes} radio writes, {writes} made during replay so far"
+        )
+        self.finished.set()
+
+capture_replayer = CaptureReplayer(REPLAY_PATH, REPLAY_SPEED)
+
+# --------------------------
+# Meshtastic Receive Callback
+# --------------------------
+def on_meshtastic_receive(packet, interface):
+    # Runs on the meshtastic reader thread of whichever radio heard the packet, so it only
+    # does cheap bookkeeping before handing the packet to that radio's ingest queue.
+    try:
+        radio = radios_by_hostname.get(interface.hostname)
+        if radio is None:
+            return
+        capture_writer.record(CAPTURE_IN, {"radio": radio.name, "packet": packet})
+        # The library bumps lastHeard on the NodeDB entry before publishing the packet.
+        node = (interface.nodes or {}).get(packet.get("fromId"))
+        if node is not None:
+            node_registry.upsert(node)
+            node_render_cache.invalidate(node_id_of(node))
+        # Packet ids are mesh-wide, so a packet heard by two of our radios is only handled once.
+        if duplicate_filter.is_duplicate(packet):
+            return
+        packet["radio"] = radio.name
+        packet.setdefault("receivedAt", time.monotonic())  # Packets from the radio daemon keep the time it heard them
+        radio.ingest.put(packet)
+    except Exception as ex:
+        print(f"Error processing received Meshtastic message: {ex}")
+
+def handle_text_packet(packet: dict):
+    decoded = packet.get("decoded", {})
+    msg_channel = packet.get("channel", decoded.get("channel", 0))
+    text = decoded.get("text", "")
+    sender = packet.get("fromId", "unknown node")
+    radio = packet.get("radio", PRIMARY_RADIO)
+    if text:
+        message_archive.record("in", sender, str(packet.get("toId", "^all")), msg_channel, text)
+    routes = bridge_routes.discord_channels(radio, msg_channel)
+    if not routes or not text:
+        return
+    tag = "Mesh" if radio == PRIMARY_RADIO else f"Mesh/{radio}"
+    full_message = f"**[{tag}]** Message from {sender}: {text}"
+    for channel_id in routes:
+        discord_relay.enqueue(channel_id, full_message, packet.get("receivedAt"))
+    if unattended_mode and radio == PRIMARY_RADIO and msg_channel == 0:
+        metrics.inc("bridge_auto_reply_messages_total")
+        log.debug("Auto-reply: queued a message from node %s", sender)
+        auto_reply_engine.submit(sender, text)
+
+packet_ingest.register("TEXT_MESSAGE_APP", handle_text_packet)
+
+def handle_position_packet(packet: dict):
+    node_positions.update(packet.get("fromId"), packet.get("decoded", {}).get("position", {}))
+
+packet_ingest.register("POSITION_APP", handle_position_packet)
+
+# --------------------------
+# Batched Mesh -> Discord Relay
+# --------------------------
+DISCORD_MESSAGE_LIMIT = 2000
+RELAY_BATCH_WINDOW = setting("RELAY_BATCH_WINDOW", 0.5)  # Seconds to collect mesh texts before posting them together
+RELAY_RATE_LIMIT = 5          # Discord allows about 5 messages per 5 seconds per channel
+RELAY_RATE_PERIOD = 5.0
+RELAY_LIVE_MESSAGE = setting("RELAY_LIVE_MESSAGE", False)  # Append to a rolling "live" message instead of posting new ones
+RELAY_LIVE_WINDOW = 120.0     # Seconds a live message keeps being edited before a new one is started
+
+def split_for_discord(lines: list[str], limit: int = DISCORD_MESSAGE_LIMIT) -> list[str]:
+    # Join lines into as few messages as possible without breaking Discord's length limit.
+    chunks = []
+    current = ""
+    for line in lines:
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+class RelayChannel:
+    __slots__ = ("pending", "task", "sent_at", "live_message", "live_started")
+
+    def __init__(self):
+        self.pending = collections.deque()
+        self.task = None
+        self.sent_at = collections.deque()  # Monotonic times of recent posts/edits, for the local rate-limit bucket
+        self.live_message = None
+        self.live_started = 0.0
+
+class DiscordRelay:
+    # One flush task per Discord channel keeps posts in arrival order. Texts that arrive
+    # while the task waits (batch window or rate-limit bucket) are coalesced into the next post.
+    def __init__(self, batch_window: float, rate_limit: int, rate_period: float, live_message: bool, live_window: float):
+        self.batch_window = batch_window
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.live_message = live_message
+        self.live_window = live_window
+        self._channels = {}
+        self.started = time.monotonic()
+        self.received = 0
+        self.relayed = 0
+        self.posts = 0
+        self.edits = 0
+        self.rate_limit_waits = 0
+
+    def enqueue(self, channel_id: int, text: str, received_at: float = None):
+        # Must be called on the event loop (use loop.call_soon_threadsafe from other threads).
+        # received_at is when a relayed mesh text arrived, for the mesh -> Discord latency metric.
+        state = self._channels.get(channel_id)
+        if state is None:
+            state = self._channels[channel_id] = RelayChannel()
+        state.pending.append((text, received_at))
+        self.received += 1
+        if state.task is None or state.task.done():
+            state.task = asyncio.create_task(self._flush(channel_id, state))
+
+    def stats(self) -> dict:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "received": self.received,
+            "relayed": self.relayed,
+            "pending": sum(len(state.pending) for state in self._channels.values()),
+            "posts": self.posts,
+            "edits": self.edits,
+            "rate_limit_waits": self.rate_limit_waits,
+            "messages_per_second": self.relayed / elapsed,
+        }
+
+    async def _wait_for_bucket(self, state: RelayChannel):
+        now = time.monotonic()
+        while state.sent_at and now - state.sent_at[0] >= self.rate_period:
+            state.sent_at.popleft()
+        if len(state.sent_at) >= self.rate_limit:
+            self.rate_limit_waits += 1
+            await asyncio.sleep(state.sent_at[0] + self.rate_period - now)
+            state.sent_at.popleft()
+        state.sent_at.append(time.monotonic())
+
+    async def _flush(self, channel_id: int, state: RelayChannel):
+        while state.pending:
+            await asyncio.sleep(self.batch_window)
+            await self._wait_for_bucket(state)
+            lines = [text for text, _ in state.pending]
+            stamps = [received_at for _, received_at in state.pending if received_at is not None]
+            state.pending.clear()
+            # Radios connect while the bot logs in; texts heard meanwhile are posted once it is ready.
+            await discord_ready.wait()
+            try:
+                channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+            except Exception as e:
+                print(f"Could not fetch channel with ID {channel_id}: {e}")
+                continue
+            chunks = split_for_discord(lines)
+            for index, chunk in enumerate(chunks):
+                if index:
+                    await self._wait_for_bucket(state)
+                try:
+                    await self._deliver(channel, state, chunk)
+                except Exception as e:
+                    print(f"Error relaying message to Discord channel {channel_id}: {e}")
+            self.relayed += len(lines)
+            startup_timer.mark("first_relay")
+            now = time.monotonic()
+            for received_at in stamps:
+                metrics.observe("bridge_mesh_to_discord_seconds", now - received_at)
+
+    async def _deliver(self, channel, state: RelayChannel, chunk: str):
+        live = state.live_message
+        if (
+            self.live_message and live is not None
+            and time.monotonic() - state.live_started < self.live_window
+            and len(live.content) + 1 + len(chunk) <= DISCORD_MESSAGE_LIMIT
+        ):
+            state.live_message = await live.edit(content=f"{live.content}\n{chunk}")
+            self.edits += 1
+            return
+        state.live_message = await channel.send(chunk)
+        state.live_started = time.monotonic()
+        self.posts += 1
+
+discord_relay = DiscordRelay(RELAY_BATCH_WINDOW, RELAY_RATE_LIMIT, RELAY_RATE_PERIOD, RELAY_LIVE_MESSAGE, RELAY_LIVE_WINDOW)
+
+# --------------------------
+# Message Archive
+# --------------------------
+ARCHIVE_PATH = setting("ARCHIVE_PATH", "messages.db")
+ARCHIVE_FLUSH_INTERVAL = 1.0        # Seconds the writer waits to collect a batch
+ARCHIVE_BATCH_MAX = 500             # Rows written per transaction at most
+ARCHIVE_RETENTION_DAYS = setting("ARCHIVE_RETENTION_DAYS", 90)  # None keeps everything
+ARCHIVE_COMPACT_INTERVAL = 6 * 3600 # Seconds between retention/compaction passes
+HISTORY_PAGE_SIZE = 10
+
+class MessageArchive:
+    # Append-only SQLite log of every mesh text in and out. Callers only put rows on a
+    # queue; a writer thread commits them in batches, so the relay never waits on disk.
+    # Reads use their own connection on a separate thread (WAL lets both run at once).
+    def __init__(self, path: str, flush_interval: float, batch_max: int, retention_days, compact_interval: float):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_max = batch_max
+        self.retention_days = retention_days
+        self.compact_interval = compact_interval
+        self._pending = queue.SimpleQueue()
+        self._reader = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive-reader")
+        self._read_db = None
+        self.written = 0
+        self.has_fts = True
+        self._thread = None
+
+    def start(self):
+        # Rows recorded before this wait on the queue; the writer commits them once it runs.
+        if self._thread is not None:
+            return
+        db = self._connect()
+        db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY, ts REAL NOT NULL, direction TEXT NOT NULL, node_id TEXT, "
+            "destination TEXT, channel INTEGER NOT NULL, text TEXT NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS messages_node ON messages (node_id, id)")
+        db.execute("CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel, id)")
+        db.execute("CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts)")
+        try:
+            db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(text, content='messages', content_rowid='id')")
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN "
+                "INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text); END"
+            )
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN "
+                "INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text); END"
+            )
+        except sqlite3.OperationalError as e:
+            print(f"SQLite FTS5 unavailable, /history search will use LIKE: {e}")
+            self.has_fts = False
+        db.commit()
+        self._thread = threading.Thread(target=self._write_loop, args=(db,), daemon=True, name="archive-writer")
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def record(self, direction: str, node_id: str, destination: str, channel: int, text: str):
+        # Safe to call from any thread; never blocks.
+        self._pending.put((time.time(), direction, node_id, destination, channel, text))
+
+    def _write_loop(self, db: sqlite3.Connection):
+        next_compact = time.monotonic()
+        while True:
+            rows = []
+            try:
+                rows.append(self._pending.get(timeout=self.flush_interval))
+                deadline = time.monotonic() + self.flush_interval
+                while len(rows) < self.batch_max:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    rows.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                pass
+            try:
+                if rows:
+                    with db:
+                        db.executemany(
+                            "INSERT INTO messages (ts, direction, node_id, destination, channel, text) VALUES (?, ?, ?, ?, ?, ?)",
+                            rows
+                        )
+                    self.written += len(rows)
+                if time.monotonic() >= next_compact:
+                    self._compact(db)
+                    next_compact = time.monotonic() + self.compact_interval
+            except Exception as e:
+                print(f"Error writing message archive: {e}")
+
+    def _compact(self, db: sqlite3.Connection):
+        if self.retention_days is None:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        while True:
+            # Delete in chunks so the writer never holds one huge transaction.
+            with db:
+                deleted = db.execute(
+                    "DELETE FROM messages WHERE id IN (SELECT id FROM messages WHERE ts < ? LIMIT 10000)", (cutoff,)
+                ).rowcount
+            if deleted < 10000:
+                break
+        if self.has_fts:
+            with db:
+                db.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+        db.execute("PRAGMA incremental_vacuum")
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
 
-import meshtastic.tcp_interface
-from pubsub import pub
-from meshtastic.protobuf import channel_pb2  # Required for channel role checks
+    def _search(self, node_id, channel, text, before_id, limit) -> list[tuple]:
+        if self._read_db is None:
+            self._read_db = self._connect()
+        clauses, params = [], []
+        source = "messages m"
+        if text:
+            if self.has_fts:
+                source = "messages m JOIN messages_fts f ON f.rowid = m.id"
+                clauses.append("messages_fts MATCH ?")
+                params.append('"' + text.replace('"', '""') + '"')
+            else:
+                clauses.append("m.text LIKE ?")
+                params.append(f"%{text}%")
+        if node_id:
+            clauses.append("(m.node_id = ? OR m.destination = ?)")
+            params += [node_id, node_id]
+        if channel is not None:
+            clauses.append("m.channel = ?")
+            params.append(channel)
+        # Keyset pagination: page boundaries are row ids, so deep pages cost the same as the first.
+        if before_id is not None:
+            clauses.append("m.id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._read_db.execute(
+            f"SELECT m.id, m.ts, m.direction, m.node_id, m.destination, m.channel, m.text FROM {source} "
+            f"{where} ORDER BY m.id DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+
+    async def search(self, node_id: str = None, channel: int = None, text: str = None,
+                     before_id: int = None, limit: int = HISTORY_PAGE_SIZE) -> list[tuple]:
+        # Newest first; pass the oldest id of the current page as before_id for the next one.
+        return await asyncio.get_running_loop().run_in_executor(
+            self._reader, self._search, node_id, channel, text, before_id, limit
+        )
+
+message_archive = MessageArchive(
+    ARCHIVE_PATH, ARCHIVE_FLUSH_INTERVAL, ARCHIVE_BATCH_MAX, ARCHIVE_RETENTION_DAYS, ARCHIVE_COMPACT_INTERVAL
+)
+
+def local_node_id() -> str:
+    try:
+        return f"!{mesh_supervisor.interface.myInfo.my_node_num:08x}"
+    except Exception:
+        return "local"
 
 # --------------------------
-# Configuration
+# Traceroute Correlation
 # --------------------------
-DISCORD_BOT_TOKEN = "YOUR_DISCORD_TOKEN"
-DISCORD_CHANNEL_ID = YOUR_DISCORD_CHANNEL
-MESHTASTIC_HOSTNAME = "YOUR_MESHTASTIC_API_URL" ##localhost will probably work if meshtastic is installed on the same machine as this script
+TRACEROUTE_TIMEOUT = 60.0        # Seconds to wait for the route to come back once the request is on air
+TRACEROUTE_CACHE_TTL = 300.0     # Seconds a traced route is reused instead of sending another request
+TRACEROUTE_CACHE_SIZE = 256
+UNKNOWN_SNR = -128
+
+def node_label(node_num: int) -> str:
+    node_id = f"!{node_num:08x}"
+    record = node_registry.get(node_id)
+    return f"{record.long_name} ({node_id})" if record is not None else node_id
+
+def format_route_hops(start: int, hops: list, end: int, snrs: list) -> str:
+    # snrs has one entry per hop plus one for the final node, in quarter-dB units.
+    labels = [node_label(start)]
+    valid = len(snrs) == len(hops) + 1
+    for index, node_num in enumerate(hops + [end]):
+        snr = snrs[index] if valid else UNKNOWN_SNR
+        labels.append(f"{node_label(node_num)} ({snr / 4} dB)" if snr != UNKNOWN_SNR else f"{node_label(node_num)} (? dB)")
+    return " → ".join(labels)
+
+def format_traceroute(packet: dict) -> str:
+    route = packet.get("decoded", {}).get("traceroute", {})
+    towards = format_route_hops(packet["to"], route.get("route", []), packet["from"], route.get("snrTowards", []))
+    lines = [f"**Towards:** {towards}"]
+    if "snrBack" in route:
+        back = format_route_hops(packet["from"], route.get("routeBack", []), packet["to"], route.get("snrBack", []))
+        lines.append(f"**Back:** {back}")
+    return "\n".join(lines)
+
+class TraceRequest:
+    __slots__ = ("future", "job", "source")
+
+    def __init__(self, future: asyncio.Future, job, source: str):
+        self.future = future  # Resolves to the formatted route; await it through asyncio.shield
+        self.job = job        # The transmit job, when a new request had to be sent
+        self.source = source  # "sent", "merged" into an in-flight request, or "cached"
+
+class TracerouteTracker:
+    # Matches traceroute responses to their request ids. Routes are cached per destination, hop
+    # limit and channel, and a second identical request while one is being traced joins the first.
+    def __init__(self, timeout: float, cache_ttl: float, cache_size: int):
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()  # (destination, hop limit, channel) -> (monotonic time, route)
+        self._inflight = {}  # (destination, hop limit, channel) -> task resolving to the route
+        self._waiting = {}   # request packet id -> future for the response packet
+
+    def request(self, destination: str, hop_limit: int, channel_index: int, owner) -> TraceRequest:
+        loop = asyncio.get_running_loop()
+        key = (destination, hop_limit, channel_index)
+        cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+            future = loop.create_future()
+            future.set_result(cached[1])
+            return TraceRequest(future, None, "cached")
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return TraceRequest(inflight, None, "merged")
+        call = RadioCall(
+            "sendData", b"", destinationId=destination, portNum=portnums_pb2.PortNum.TRACEROUTE_APP,
+            wantResponse=True, channelIndex=channel_index, hopLimit=hop_limit
+        )
+        job = tx_scheduler.submit(call, TRACEROUTE_PAYLOAD_LEN, TX_PRIORITY_DIRECT, owner)
+        task = loop.create_task(self._trace(key, job))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return TraceRequest(task, job, "sent")
+
+    async def _trace(self, key: tuple, job: TxJob) -> str:
+        destination = key[0]
+        sent = await job.future
+        response = asyncio.get_running_loop().create_future()
+        self._waiting[sent.id] = response
+        try:
+            packet = await asyncio.wait_for(response, self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"no traceroute response from {destination} within {self.timeout:.0f}s")
+        finally:
+            self._waiting.pop(sent.id, None)
+        route = format_traceroute(packet)
+        self._cache[key] = (time.monotonic(), route)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return route
+
+    def handle_response(self, packet: dict):
+        decoded = packet.get("decoded", {})
+        future = self._waiting.get(decoded.get("requestId"))
+        if future is None or future.done():
+            return
+        if decoded.get("portnum") == "ROUTING_APP":
+            # Plain acks also carry the request id; only a routing error ends the wait.
+            error = decoded.get("routing", {}).get("errorReason", "NONE")
+            if error != "NONE":
+                future.set_exception(RuntimeError(f"traceroute failed: {error}"))
+            return
+        future.set_result(packet)
+
+traceroute_tracker = TracerouteTracker(TRACEROUTE_TIMEOUT, TRACEROUTE_CACHE_TTL, TRACEROUTE_CACHE_SIZE)
+packet_ingest.register("TRACEROUTE_APP", traceroute_tracker.handle_response, primary_only=True)
+packet_ingest.register("ROUTING_APP", traceroute_tracker.handle_response, primary_only=True)
+
+async def trace_and_report(interaction: discord.Interaction, destination: str, hop_limit: int, channel_index: int,
+                           ephemeral: bool = False):
+    # Acknowledge at once, then edit the traced route (or the failure) into the same reply.
+    title = "Traceroute"
+    try:
+        request = traceroute_tracker.request(destination, hop_limit, channel_index, interaction.user.id)
+    except TransmitQueueFull as e:
+        await interaction.response.send_message(f"Error sending traceroute: {e}", ephemeral=ephemeral)
+        return
+    # Every reply names the hop limit and channel, since cached and merged routes are matched on them too.
+    pending = f"Traceroute request to {destination} with hoplimit {hop_limit} on channel {channel_index}"
+    if request.source == "cached":
+        pending += f": using the route traced in the last {TRACEROUTE_CACHE_TTL / 60:.0f} minutes."
+    elif request.source == "merged":
+        pending += ": already in progress; waiting for its result."
+    else:
+        pending += f" queued.\nQueue depth: {request.job.queue_depth}, estimated wait: {request.job.estimated_wait:.0f}s"
+    embed = Embed(title=title, description=pending, color=Color.light_grey())
+    if ephemeral:
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+    else:
+        await interaction.response.send_message(embed=embed, view=DismissView())
+    try:
+        route = await asyncio.shield(request.future)
+    except Exception as e:
+        await interaction.edit_original_response(content=f"Error sending traceroute: {e}", embed=None)
+        return
+    await interaction.edit_original_response(embed=Embed(title=f"{title} to {destination}", description=route, color=Color.green()))
 
 # --------------------------
-# Initialize Meshtastic Interface
+# Compressed Text Transport
 # --------------------------
-try:
-    meshtastic_interface = meshtastic.tcp_interface.TCPInterface(hostname=MESHTASTIC_HOSTNAME)
-except Exception as e:
-    print(f"Error initializing Meshtastic TCP interface: {e}")
-    exit(1)
+COMPRESSED_TEXT = setting("COMPRESSED_TEXT", True)  # Send DMs to other bridges compressed; False always sends plain text
+TEXT_TRANSPORT_PORTNUM = portnums_pb2.PortNum.PRIVATE_APP
+TEXT_FRAME_MAX = mesh_pb2.Constants.DATA_PAYLOAD_LEN  # Largest payload a single packet carries
+TEXT_HELLO_INTERVAL = 6 * 3600.0     # Seconds between capability announcements
+TEXT_REASSEMBLY_TIMEOUT = 60.0       # Seconds without a new fragment before asking for the missing ones
+TEXT_NACK_RETRIES = 3                # Requests for missing fragments before a message is given up
+TEXT_RETAIN_SECONDS = 900.0          # Sent fragments are kept this long for retransmission
+TEXT_REASSEMBLY_MAX = 64             # Partially received messages held at once
+TEXT_MAX_DECODED = 65536             # Refuse fragments that inflate beyond this
+TEXT_TRANSPORT_OWNER = "text-transport"
+TEXT_PROTOCOL_VERSION = 1
+TEXT_CODEC_PLAIN = 0
+TEXT_CODEC_DEFLATE = 1               # Raw deflate primed with TEXT_DICTIONARY
+TEXT_FRAME_HELLO, TEXT_FRAME_DATA, TEXT_FRAME_NACK, TEXT_FRAME_ACK = 1, 2, 3, 4
+TEXT_HELLO = struct.Struct(">BBIB")         # kind, protocol version, dictionary crc32, reply wanted
+TEXT_DATA_HEADER = struct.Struct(">BHBBB")  # kind, message id, fragment index, fragment count, codec
+TEXT_CONTROL_HEADER = struct.Struct(">BH")  # kind, message id; a NACK is followed by the missing indexes
+# Deflate finds matches in the dictionary as if it preceded the message, so it holds
+# phrases common in mesh chatter, with the most frequent ones last. Changing it changes
+# the crc32 announced in HELLO, and bridges with different dictionaries fall back to plain text.
+TEXT_DICTIONARY = (
+    "weather forecast temperature humidity wind rain snow storm clear cloudy sunny tomorrow tonight morning "
+    "afternoon evening today yesterday minutes hours miles kilometers north south east west highway road trail "
+    "mountain river lake park camp home work office car truck battery charge charging solar power voltage "
+    "antenna signal strength snr rssi hop hops relay router repeater client channel frequency firmware update "
+    "gps position location coordinates altitude map meshtastic mesh network node nodes message messages "
+    "direct reply received sent delivered traceroute telemetry ping test testing check radio check "
+    "can you hear me do you copy loud and clear roger that copy that over and out standing by "
+    "please thank you thanks sorry help emergency safe okay ok yes no maybe good great nice cool "
+    "what where when why how who which is are was were will would could should have has had "
+    "I am I'm you're we're they're it's that's there's don't can't won't didn't isn't "
+    "the and for that this with from your you have not but all any can her was one our out get "
+    "hello hi hey good morning good night see you later on my way at the on the in the to the of the "
+)
+TEXT_DICTIONARY = TEXT_DICTIONARY.encode("utf-8")
+
+def split_utf8(text: str, limit: int) -> list[str]:
+    # Split text into chunks of at most limit UTF-8 bytes, preferring to break at a space.
+    chunks = []
+    encoded = text.encode("utf-8")
+    while len(encoded) > limit:
+        head = encoded[:limit].decode("utf-8", "ignore")
+        space = head.rfind(" ")
+        if space > len(head) // 2:
+            head = head[:space]
+        chunks.append(head)
+        text = text[len(head):].lstrip(" ")
+        encoded = text.encode("utf-8")
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+def compress_text(text: str) -> tuple[int, bytes]:
+    raw = text.encode("utf-8")
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, TEXT_DICTIONARY)
+    packed = compressor.compress(raw) + compressor.flush()
+    return (TEXT_CODEC_DEFLATE, packed) if len(packed) < len(raw) else (TEXT_CODEC_PLAIN, raw)
+
+def decompress_text(codec: int, data: bytes) -> str:
+    if codec == TEXT_CODEC_PLAIN:
+        return data.decode("utf-8")
+    if codec != TEXT_CODEC_DEFLATE:
+        raise ValueError(f"unknown codec {codec}")
+    decompressor = zlib.decompressobj(-15, zdict=TEXT_DICTIONARY)
+    raw = decompressor.decompress(data, TEXT_MAX_DECODED)
+    if decompressor.unconsumed_tail:
+        raise ValueError("message inflates beyond TEXT_MAX_DECODED")
+    return (raw + decompressor.flush()).decode("utf-8")
+
+class TextPlan:
+    __slots__ = ("calls", "text", "destination", "channel_index", "plain_bytes", "air_bytes", "compressed", "message_id")
+
+    def __init__(self, calls: list, text: str, destination, channel_index: int, plain_bytes: int, air_bytes: int,
+                 compressed: bool, message_id: int = None):
+        self.calls = calls  # (RadioCall, payload_len) pairs for tx_scheduler.submit_many
+        self.text = text
+        self.destination = destination
+        self.channel_index = channel_index
+        self.plain_bytes = plain_bytes  # What the text costs sent with sendText
+        self.air_bytes = air_bytes      # What this plan actually puts on air
+        self.compressed = compressed
+        self.message_id = message_id    # Set for compressed plans; the receiver ACKs it
+
+    def describe(self) -> str:
+        if self.compressed:
+            saved = self.plain_bytes - self.air_bytes
+            return (
+                f"Compressed for a bridge peer: {self.plain_bytes} → {self.air_bytes} bytes on air in "
+                f"{len(self.calls)} packet(s), {saved} bytes ({saved / self.plain_bytes:.0%}) saved."
+            )
+        if len(self.calls) > 1:
+            return f"Sent as plain text in {len(self.calls)} packets."
+        return ""
+
+class Reassembly:
+    __slots__ = ("count", "codec", "fragments", "packet", "timer", "nacks")
+
+    def __init__(self, count: int, codec: int, packet: dict):
+        self.count = count
+        self.codec = codec
+        self.fragments = {}  # index -> bytes
+        self.packet = packet
+        self.timer = None
+        self.nacks = 0
+
+class OutgoingText:
+    __slots__ = ("destination", "channel_index", "fragments", "expiry")
+
+    def __init__(self, destination: str, channel_index: int, fragments: list, expiry):
+        self.destination = destination
+        self.channel_index = channel_index
+        self.fragments = fragments
+        self.expiry = expiry  # Loop timer that forgets the fragments
+
+class TextTransport:
+    # Text for other bridges travels compressed on a private portnum, split into packets that
+    # carry a message id and fragment index. A receiver asks for just the fragments it is
+    # missing (NACK) and confirms complete messages (ACK). Bridges find each other through
+    # small HELLO broadcasts; any other node gets plain sendText, split into packet-sized chunks.
+    def __init__(self, enabled: bool, hello_interval: float, reassembly_timeout: float, nack_retries: int,
+                 retain_seconds: float, max_reassemblies: int):
+        self.enabled = enabled
+        self.hello_interval = hello_interval
+        self.reassembly_timeout = reassembly_timeout
+        self.nack_retries = nack_retries
+        self.retain_seconds = retain_seconds
+        self.max_reassemblies = max_reassemblies
+        self.dictionary_id = zlib.crc32(TEXT_DICTIONARY)
+        self._peers = {}     # node id -> time a compatible bridge was last heard from
+        self._answered = {}  # node id -> time we last answered its HELLO
+        self._outgoing = {}  # message id -> OutgoingText
+        self._incoming = collections.OrderedDict()   # (sender, message id) -> Reassembly, oldest first
+        self._completed = collections.OrderedDict()  # (sender, message id) of recent messages, to re-ACK repeats
+        self._announce_task = None
+        self.bytes_plain = 0
+        self.bytes_on_air = 0
+        self.retransmits = 0
+        self.failed = 0
+
+    def is_peer(self, node_id) -> bool:
+        return node_id in self._peers and time.time() - self._peers[node_id] < 3 * self.hello_interval
+
+    def plan(self, text: str, destination, channel_index: int, want_ack: bool = False) -> TextPlan:
+        # want_ack asks the destination's radio to acknowledge each plain packet (see AckTracker).
+        chunks = split_utf8(text, TEXT_FRAME_MAX)
+        plain_bytes = sum(len(chunk.encode("utf-8")) for chunk in chunks)
+        if self.enabled and self.is_peer(destination):
+            codec, data = compress_text(text)
+            size = TEXT_FRAME_MAX - TEXT_DATA_HEADER.size
+            pieces = [data[start:start + size] for start in range(0, len(data), size)] or [b""]
+            air_bytes = len(data) + len(pieces) * TEXT_DATA_HEADER.size
+            if air_bytes < plain_bytes and len(pieces) <= 255:
+                message_id = self._new_message_id()
+                fragments = [
+                    TEXT_DATA_HEADER.pack(TEXT_FRAME_DATA, message_id, index, len(pieces), codec) + piece
+                    for index, piece in enumerate(pieces)
+                ]
+                expiry = asyncio.get_running_loop().call_later(self.retain_seconds, self._outgoing.pop, message_id, None)
+                self._outgoing[message_id] = OutgoingText(destination, channel_index, fragments, expiry)
+                calls = [(self._data_call(fragment, destination, channel_index), len(fragment)) for fragment in fragments]
+                return TextPlan(calls, text, destination, channel_index, plain_bytes, air_bytes, True, message_id)
+        target = {"destinationId": destination} if destination is not None else {}
+        if want_ack:
+            target["wantAck"] = True
+        calls = [
+            (RadioCall("sendText", chunk, channelIndex=channel_index, **target), len(chunk.encode("utf-8")))
+            for chunk in chunks
+        ]
+        return TextPlan(calls, text, destination, channel_index, plain_bytes, plain_bytes, False)
+
+    async def sent(self, plan: TextPlan, jobs: list):
+        # Resolves once every packet of the plan is on air.
+        await asyncio.gather(*(job.future for job in jobs))
+        self.bytes_plain += plan.plain_bytes
+        self.bytes_on_air += plan.air_bytes
+        if plan.compressed:
+            # The scheduler archives sendText itself; compressed text is archived once, whole.
+            message_archive.record("out", local_node_id(), plan.destination, plan.channel_index, plan.text)
+
+    def _new_message_id(self) -> int:
+        while True:
+            message_id = random.getrandbits(16)
+            if message_id not in self._outgoing:
+                return message_id
+
+    def _data_call(self, payload: bytes, destination, channel_index: int) -> RadioCall:
+        target = {"destinationId": destination} if destination is not None else {}
+        return RadioCall("sendData", payload, portNum=TEXT_TRANSPORT_PORTNUM, channelIndex=channel_index, **target)
+
+    def _send_background(self, payloads: list, destination, channel_index: int, priority: int):
+        calls = [(self._data_call(payload, destination, channel_index), len(payload)) for payload in payloads]
+        try:
+            jobs = tx_scheduler.submit_many(calls, priority, TEXT_TRANSPORT_OWNER)
+        except TransmitQueueFull as e:
+            print(f"Error queueing text transport frame: {e}")
+            return
+        for job in jobs:
+            job.future.add_done_callback(lambda f: f.cancelled() or f.exception())  # Nobody awaits these
+
+    def announce(self):
+        hello = TEXT_HELLO.pack(TEXT_FRAME_HELLO, TEXT_PROTOCOL_VERSION, self.dictionary_id, 1)
+        self._send_background([hello], None, 0, TX_PRIORITY_BULK)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        # Keep a single announcer, however often this is called.
+        if self.enabled and (self._announce_task is None or self._announce_task.done()):
+            self._announce_task = loop.create_task(self._announce_loop())
+
+    async def _announce_loop(self):
+        while True:
+            if mesh_supervisor.connected:
+                self.announce()
+                await asyncio.sleep(self.hello_interval)
+            else:
+                await asyncio.sleep(MESHTASTIC_HEARTBEAT_INTERVAL)
+
+    def handle_packet(self, packet: dict):
+        payload = packet.get("decoded", {}).get("payload", b"")
+        sender = packet.get("fromId")
+        if not self.enabled or not payload or sender is None:
+            return
+        try:
+            kind = payload[0]
+            if kind == TEXT_FRAME_HELLO:
+                self._on_hello(sender, payload, packet)
+            elif kind == TEXT_FRAME_DATA:
+                self._on_data(sender, payload, packet)
+            elif kind == TEXT_FRAME_NACK:
+                self._on_nack(sender, payload)
+            elif kind == TEXT_FRAME_ACK:
+                _, message_id = TEXT_CONTROL_HEADER.unpack_from(payload)
+                outgoing = self._outgoing.get(message_id)
+                if outgoing is not None and outgoing.destination == sender:
+                    outgoing.expiry.cancel()
+                    del self._outgoing[message_id]
+                ack_tracker.acknowledge(("text", message_id), sender)
+        except (struct.error, ValueError, zlib.error) as e:
+            print(f"Error decoding text transport frame from {sender}: {e}")
+
+    def _on_hello(self, sender: str, payload: bytes, packet: dict):
+        _, version, dictionary_id, wants_reply = TEXT_HELLO.unpack_from(payload)
+        if version != TEXT_PROTOCOL_VERSION or dictionary_id != self.dictionary_id:
+            self._peers.pop(sender, None)
+            return
+        now = time.time()
+        self._peers[sender] = now
+        if wants_reply and now - self._answered.get(sender, 0) > self.hello_interval / 2:
+            # Answer directly, so a bridge that just started learns about us without a broadcast storm.
+            self._answered[sender] = now
+            hello = TEXT_HELLO.pack(TEXT_FRAME_HELLO, TEXT_PROTOCOL_VERSION, self.dictionary_id, 0)
+            self._send_background([hello], sender, packet.get("channel", 0), TX_PRIORITY_BULK)
+
+    def _on_data(self, sender: str, payload: bytes, packet: dict):
+        _, message_id, index, count, codec = TEXT_DATA_HEADER.unpack_from(payload)
+        if index >= count:
+            raise ValueError(f"fragment {index} of {count}")
+        self._peers[sender] = time.time()
+        key = (sender, message_id)
+        direct = packet.get("toId") != "^all"
+        if key in self._completed:
+            # A retransmission raced our ACK, or the ACK was lost.
+            if direct:
+                self._send_background([TEXT_CONTROL_HEADER.pack(TEXT_FRAME_ACK, message_id)], sender, packet.get("channel", 0), TX_PRIORITY_DIRECT)
+            return
+        entry = self._incoming.get(key)
+        if entry is None:
+            entry = self._incoming[key] = Reassembly(count, codec, packet)
+            while len(self._incoming) > self.max_reassemblies:
+                _, dropped = self._incoming.popitem(last=False)
+                if dropped.timer is not None:
+                    dropped.timer.cancel()
+                self.failed += 1
+        elif (count, codec) != (entry.count, entry.codec):
+            # The fragments disagree about the message they belong to; none of it can be trusted.
+            del self._incoming[key]
+            if entry.timer is not None:
+                entry.timer.cancel()
+            self.failed += 1
+            raise ValueError(f"fragment {index} of {count}, earlier fragments said {entry.count}")
+        entry.fragments[index] = payload[TEXT_DATA_HEADER.size:]
+        entry.packet = packet
+        if entry.timer is not None:
+            entry.timer.cancel()
+        if len(entry.fragments) < entry.count:
+            entry.timer = asyncio.get_running_loop().call_later(self.reassembly_timeout, self._on_gap, key)
+            return
+        del self._incoming[key]
+        try:
+            text = decompress_text(entry.codec, b"".join(entry.fragments[i] for i in range(entry.count)))
+        except (ValueError, zlib.error):
+            # Neither completed nor ACKed, so the sender's ack timeout resends it (or gives up) as for a loss.
+            self.failed += 1
+            raise
+        self._completed[key] = None
+        while len(self._completed) > 4 * self.max_reassemblies:
+            self._completed.popitem(last=False)
+        if direct:
+            self._send_background([TEXT_CONTROL_HEADER.pack(TEXT_FRAME_ACK, message_id)], sender, packet.get("channel", 0), TX_PRIORITY_DIRECT)
+        decoded = dict(packet.get("decoded", {}))
+        decoded.pop("payload", None)
+        decoded.update(portnum="TEXT_MESSAGE_APP", text=text)
+        handle_text_packet({**packet, "decoded": decoded})
+
+    def _on_gap(self, key: tuple):
+        entry = self._incoming.get(key)
+        if entry is None:
+            return
+        sender, message_id = key
+        if entry.packet.get("toId") == "^all" or entry.nacks >= self.nack_retries:
+            # Broadcasts are never NACKed: every bridge in range asking at once would swamp the channel.
+            del self._incoming[key]
+            self.failed += 1
+            print(f"Gave up on message {message_id} from {sender}: {len(entry.fragments)}/{entry.count} fragments received")
+            return
+        entry.nacks += 1
+        missing = bytes(index for index in range(entry.count) if index not in entry.fragments)
+        nack = TEXT_CONTROL_HEADER.pack(TEXT_FRAME_NACK, message_id) + missing[:TEXT_FRAME_MAX - TEXT_CONTROL_HEADER.size]
+        self._send_background([nack], sender, entry.packet.get("channel", 0), TX_PRIORITY_DIRECT)
+        entry.timer = asyncio.get_running_loop().call_later(self.reassembly_timeout, self._on_gap, key)
+
+    def _on_nack(self, sender: str, payload: bytes):
+        _, message_id = TEXT_CONTROL_HEADER.unpack_from(payload)
+        outgoing = self._outgoing.get(message_id)
+        if outgoing is None or outgoing.destination != sender:
+            return
+        indexes = [index for index in payload[TEXT_CONTROL_HEADER.size:] if index < len(outgoing.fragments)]
+        self.retransmits += len(indexes)
+        self._send_background([outgoing.fragments[index] for index in indexes], sender, outgoing.channel_index, TX_PRIORITY_DIRECT)
+
+text_transport = TextTransport(
+    COMPRESSED_TEXT, TEXT_HELLO_INTERVAL, TEXT_REASSEMBLY_TIMEOUT, TEXT_NACK_RETRIES, TEXT_RETAIN_SECONDS, TEXT_REASSEMBLY_MAX
+)
+packet_ingest.register("PRIVATE_APP", text_transport.handle_packet, primary_only=True)
+
+async def send_text_and_report(interaction: discord.Interaction, text: str, destination, channel_index: int,
+                               pending: str, done: str, error: str, title: str = None, ephemeral: bool = False,
+                               scheduler: TransmitScheduler = tx_scheduler):
+    # send_and_report for text: long texts are split across packets, DMs to other bridges
+    # are compressed, and the final reply says how many bytes on air that saved. Direct
+    # messages are then followed until the destination acknowledges them (see AckTracker).
+    # Broadcasts may go out another radio's scheduler; DMs always use the primary's.
+    plan = text_transport.plan(text, destination, channel_index, want_ack=destination is not None)
+    try:
+        jobs = scheduler.submit_many(plan.calls, TX_PRIORITY_DIRECT, interaction.user.id)
+    except TransmitQueueFull as e:
+        await interaction.response.send_message(f"{error}: {e}", ephemeral=ephemeral)
+        return
+    summary = plan.describe()
+    if summary:
+        done = f"{done}\n{summary}"
+    sent = text_transport.sent(plan, jobs)
+    if destination is None:
+        await report_send(interaction, sent, queue_note(pending, jobs, scheduler), done, error, title, ephemeral)
+        return
+    delivery = ack_tracker.track(plan, jobs, interaction.user.id, TX_PRIORITY_DIRECT)
+    delivery.on_retry = lambda note: asyncio.get_running_loop().create_task(
+        edit_report(interaction, f"{done}\nDelivery: {note}", title, Color.orange())
+    )
+    pending = f"{queue_note(pending, jobs)}\nDelivery: queued"
+    if not await report_send(interaction, sent, pending, f"{done}\nDelivery: sent, waiting for acknowledgement", error, title, ephemeral):
+        return
+    try:
+        retries = await delivery.future
+    except Exception as e:
+        await edit_report(interaction, f"{done}\nDelivery: failed ({e})", title, Color.red())
+        return
+    note = f" after {retries} retr{'y' if retries == 1 else 'ies'}" if retries else ""
+    await edit_report(interaction, f"{done}\nDelivery: delivered{note}", title)
 
 # --------------------------
-# Create Bot Client and Command Tree
+# Delivery Tracking
 # --------------------------
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
-tree = bot.tree
+DM_ACK_TIMEOUT = setting("DM_ACK_TIMEOUT", 120.0)  # Seconds after a DM is on air to wait for the destination's ack
+DM_MAX_RETRIES = setting("DM_MAX_RETRIES", 3)
+DM_RETRY_BACKOFF = 20.0    # First retry delay; doubles with each attempt, jittered by ±50%
+TIMER_WHEEL_TICK = 1.0     # Resolution of ack timeouts and retry delays, in seconds
+TIMER_WHEEL_SLOTS = 512
+
+class WheelTimer:
+    __slots__ = ("callback", "args", "rounds", "cancelled")
+
+    def __init__(self, callback, args: tuple, rounds: int):
+        self.callback = callback
+        self.args = args
+        self.rounds = rounds  # Full turns of the wheel still to wait
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class TimerWheel:
+    # Hashed timer wheel: each slot holds the timers due when the wheel reaches it, and a single
+    # loop callback per tick advances it. Scheduling and cancelling are O(1), a pending timer
+    # is one small object, and nothing runs at all while the wheel is empty.
+    def __init__(self, tick: float, slots: int):
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._current = 0
+        self._handle = None
+        self.pending = 0
+
+    def schedule(self, delay: float, callback, *args) -> WheelTimer:
+        ticks = max(1, math.ceil(delay / self.tick))
+        timer = WheelTimer(callback, args, (ticks - 1) // len(self._slots))
+        self._slots[(self._current + ticks) % len(self._slots)].append(timer)
+        self.pending += 1
+        if self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.tick, self._advance)
+        return timer
+
+    def _advance(self):
+        self._current = (self._current + 1) % len(self._slots)
+        due, self._slots[self._current] = self._slots[self._current], []
+        for timer in due:
+            if timer.cancelled:
+                self.pending -= 1
+            elif timer.rounds:
+                timer.rounds -= 1
+                self._slots[self._current].append(timer)
+            else:
+                self.pending -= 1
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    print(f"Error in timer callback: {e}")
+        self._handle = asyncio.get_running_loop().call_later(self.tick, self._advance) if self.pending else None
+
+class Delivery:
+    # One direct message: resolves to the number of retries once every part is acknowledged.
+    __slots__ = ("future", "remaining", "parts", "retries", "on_retry")
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.remaining = 0
+        self.parts = []
+        self.retries = 0
+        self.on_retry = None  # Called with a status line when a part is about to be resent
+
+class PendingPart:
+    # A packet (or a compressed text's fragments) waiting for its acknowledgement.
+    __slots__ = ("delivery", "calls", "destination", "owner", "priority", "key", "attempt", "timer", "compressed")
+
+    def __init__(self, delivery: Delivery, calls: list, destination: str, owner, priority: int, key, compressed: bool):
+        self.delivery = delivery
+        self.calls = calls    # (RadioCall, payload_len) pairs, resent as a whole
+        self.destination = destination
+        self.owner = owner
+        self.priority = priority
+        self.key = key        # Packet id of the latest attempt, or ("text", message id) when compressed
+        self.attempt = 0
+        self.timer = None
+        self.compressed = compressed
+
+class AckTracker:
+    # Follows direct messages until the destination acknowledges them: plain packets through
+    # the routing ack the destination's radio sends for wantAck, compressed ones through the
+    # text transport's ACK. Timeouts and retry delays live on the timer wheel, so thousands of
+    # outstanding messages are a dict entry and a wheel slot each, not a task apiece.
+    def __init__(self, wheel: TimerWheel, ack_timeout: float, max_retries: int, backoff: float):
+        self.wheel = wheel
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._by_key = {}
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+
+    def __len__(self):
+        return len(self._by_key)
+
+    def track(self, plan: TextPlan, jobs: list, owner, priority: int) -> Delivery:
+        delivery = Delivery(asyncio.get_running_loop().create_future())
+        delivery.future.add_done_callback(lambda f: f.cancelled() or f.exception())  # Awaited only if the send succeeds
+        if plan.compressed:
+            groups = [(plan.calls, jobs, ("text", plan.message_id))]
+        else:
+            groups = [([pair], [job], None) for pair, job in zip(plan.calls, jobs)]
+        for calls, part_jobs, key in groups:
+            part = PendingPart(delivery, calls, plan.destination, owner, priority, key, plan.compressed)
+            delivery.parts.append(part)
+            self._watch(part, part_jobs)
+        delivery.remaining = len(delivery.parts)
+        return delivery
+
+    def _watch(self, part: PendingPart, jobs: list):
+        # Starts the ack timeout once every packet of the attempt is on air.
+        waiting = [len(jobs)]
+
+        def on_air(future: asyncio.Future):
+            if part.delivery.future.done():
+                return
+            # future.exception() raises CancelledError on a cancelled future, so check that first.
+            exc = RuntimeError("send cancelled") if future.cancelled() else future.exception()
+            if exc is not None:
+                self._fail(part, exc)
+                return
+            if not part.compressed:
+                part.key = future.result().id
+            waiting[0] -= 1
+            if waiting[0] == 0:
+                self._by_key[part.key] = part
+                timeout = self.ack_timeout
+                if part.compressed:
+                    # Give the receiver time to NACK missing fragments before resending everything.
+                    timeout += text_transport.reassembly_timeout * text_transport.nack_retries
+                part.timer = self.wheel.schedule(timeout, self._on_timeout, part)
+
+        for job in jobs:
+            job.future.add_done_callback(on_air)
+
+    def _forget(self, part: PendingPart):
+        if self._by_key.get(part.key) is part:
+            del self._by_key[part.key]
+        if part.timer is not None:
+            part.timer.cancel()
+            part.timer = None
+
+    def _fail(self, part: PendingPart, error: Exception):
+        delivery = part.delivery
+        for other in delivery.parts:
+            self._forget(other)
+        if not delivery.future.done():
+            self.failed += 1
+            delivery.future.set_exception(error)
+
+    def acknowledge(self, key, sender: str):
+        part = self._by_key.get(key)
+        if part is None or sender != part.destination:
+            return
+        self._forget(part)
+        delivery = part.delivery
+        delivery.remaining -= 1
+        if delivery.remaining == 0 and not delivery.future.done():
+            self.delivered += 1
+            delivery.future.set_result(delivery.retries)
+
+    def handle_routing(self, packet: dict):
+        decoded = packet.get("decoded", {})
+        part = self._by_key.get(decoded.get("requestId"))
+        if part is None:
+            return
+        error = decoded.get("routing", {}).get("errorReason", "NONE")
+        if error == "NONE":
+            # Only the destination's ack counts; our own radio reports an implicit ack when a neighbour relays it.
+            self.acknowledge(part.key, packet.get("fromId"))
+        else:
+            self._retry(part, error)
+
+    def _on_timeout(self, part: PendingPart):
+        part.timer = None
+        self._retry(part, "no acknowledgement")
+
+    def _retry(self, part: PendingPart, reason: str):
+        self._forget(part)
+        if part.attempt >= self.max_retries:
+            self._fail(part, RuntimeError(f"{reason} after {part.attempt + 1} attempts"))
+            return
+        part.attempt += 1
+        part.delivery.retries += 1
+        self.retries += 1
+        delay = self.backoff * 2 ** (part.attempt - 1) * random.uniform(0.5, 1.5)
+        if part.delivery.on_retry is not None:
+            part.delivery.on_retry(f"{reason}, retry {part.attempt}/{self.max_retries} in {delay:.0f}s")
+        part.timer = self.wheel.schedule(delay, self._resend, part)
+
+    def _resend(self, part: PendingPart):
+        part.timer = None
+        if part.delivery.future.done():
+            return
+        try:
+            jobs = tx_scheduler.submit_many(part.calls, part.priority, part.owner)
+        except TransmitQueueFull as e:
+            self._retry(part, str(e))
+            return
+        self._watch(part, jobs)
+
+ack_tracker = AckTracker(TimerWheel(TIMER_WHEEL_TICK, TIMER_WHEEL_SLOTS), DM_ACK_TIMEOUT, DM_MAX_RETRIES, DM_RETRY_BACKOFF)
+packet_ingest.register("ROUTING_APP", ack_tracker.handle_routing, primary_only=True)
 
 # --------------------------
-# Global Variables for Unattended Mode
+# File Transfer
 # --------------------------
-unattended_mode = False
-conversation_history = {}  # Keyed by sender (discord user id or meshtastic node id)
+FILE_TRANSFER_DIR = setting("FILE_TRANSFER_DIR", "transfers")  # Outgoing copies and partially received files live here, never in RAM
+FILE_TRANSFER_MAX_BYTES = setting("FILE_TRANSFER_MAX_BYTES", 256 * 1024)  # LONG_FAST at a 10% duty cycle moves very roughly 60 KB an hour
+FILE_WINDOW = setting("FILE_WINDOW", 8)  # Chunks on air before waiting for an ack
+FILE_ACK_EVERY = 4                    # The receiver acks after this many new chunks...
+FILE_ACK_DELAY = 10.0                 # ...or this many seconds after the last one
+FILE_RETRY_TIMEOUT = 90.0             # Seconds without an ack before unacknowledged chunks are resent
+FILE_MAX_RETRIES = 5
+FILE_PROGRESS_INTERVAL = 5.0          # Seconds between edits of a progress message
+FILE_INCOMING_TTL = 24 * 3600.0       # Abandoned partial transfers are deleted after this long
+# File frames share the private portnum with the text transport, using kinds from 0x10 up.
+FILE_FRAME_OFFER, FILE_FRAME_CHUNK, FILE_FRAME_ACK, FILE_FRAME_CANCEL = 0x10, 0x11, 0x12, 0x13
+FILE_OFFER = struct.Struct(">BIIIH")  # kind, transfer id, size, crc32 of the file, chunk size; then the file name
+FILE_CHUNK = struct.Struct(">BIHI")   # kind, transfer id, chunk index, crc32 of the chunk; then the data
+FILE_ACK = struct.Struct(">BIHI")     # kind, transfer id, first missing chunk, bitmap of the 32 chunks after it
+FILE_ACK_BITMAP_BITS = 32
+FILE_MAX_CHUNKS = 0xFFFF              # Chunk indexes, and the final ack's "first missing" of count, are uint16
+FILE_CANCEL = struct.Struct(">BIB")   # kind, transfer id, reason
+FILE_CHUNK_SIZE = TEXT_FRAME_MAX - FILE_CHUNK.size
+FILE_CANCEL_REASONS = {1: "file too large for the receiver", 2: "checksum mismatch", 3: "unknown transfer"}
+
+def safe_file_name(name: str) -> str:
+    name = "".join(c if c.isalnum() or c in "._-" else "_" for c in os.path.basename(name))
+    return name.strip(".")[:100] or "file"
+
+def file_crc32(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+class ProgressMessage:
+    # Shows the latest status in one Discord message, edited at most once per interval.
+    def __init__(self, edit, interval: float):
+        self._edit = edit  # async callable taking an Embed and optional keyword arguments
+        self.interval = interval
+        self._latest = None
+        self._task = None
+
+    def update(self, embed: Embed):
+        self._latest = embed
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush())
+
+    async def _flush(self):
+        while self._latest is not None:
+            embed, self._latest = self._latest, None
+            try:
+                await self._edit(embed)
+            except Exception as e:
+                print(f"Error updating transfer progress: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def finish(self, embed: Embed, **kwargs):
+        if self._task is not None:
+            self._task.cancel()
+        self._latest = None
+        await self._edit(embed, **kwargs)
+
+class OutgoingFile:
+    __slots__ = (
+        "transfer_id", "path", "fd", "name", "size", "count", "crc", "destination", "owner",
+        "base", "acked", "in_flight", "send_seq", "event", "answered", "error", "retransmits", "progress"
+    )
+
+    def __init__(self, transfer_id: int, path: str, name: str, size: int, crc: int, destination: str, owner, progress):
+        self.transfer_id = transfer_id
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        self.name = name
+        self.size = size
+        self.count = -(-size // FILE_CHUNK_SIZE)
+        self.crc = crc
+        self.destination = destination
+        self.owner = owner
+        self.base = 0           # Every chunk below this has been received
+        self.acked = set()      # Chunks above base the receiver reported
+        self.in_flight = {}     # chunk index -> send sequence number, for chunks sent but not acked
+        self.send_seq = 0
+        self.event = asyncio.Event()  # Set by each ack or cancel
+        self.answered = False
+        self.error = None
+        self.retransmits = 0
+        self.progress = progress
+
+class IncomingFile:
+    __slots__ = (
+        "transfer_id", "sender", "name", "size", "count", "crc", "chunk_size", "channel_index",
+        "fd", "bitmap", "received", "base", "unacked", "ack_timer", "touched", "message", "progress"
+    )
+
+    def __init__(self, sender: str, transfer_id: int, name: str, size: int, crc: int, chunk_size: int,
+                 channel_index: int, bitmap: bytearray = None):
+        self.sender = sender
+        self.transfer_id = transfer_id
+        self.name = name
+        self.size = size
+        self.crc = crc
+        self.chunk_size = chunk_size
+        self.count = -(-size // chunk_size)
+        self.channel_index = channel_index
+        self.bitmap = bitmap if bitmap is not None else bytearray((self.count + 7) // 8)
+        self.received = sum(bin(byte).count("1") for byte in self.bitmap)
+        self.base = 0
+        self.unacked = 0
+        self.ack_timer = None
+        self.touched = time.time()
+        self.message = None
+        self.progress = None
+        self.fd = None
+
+    def has(self, index: int) -> bool:
+        return bool(self.bitmap[index >> 3] & (1 << (index & 7)))
+
+    def mark(self, index: int):
+        self.bitmap[index >> 3] |= 1 << (index & 7)
+        self.received += 1
+
+    def first_missing(self) -> int:
+        while self.base < self.count and self.has(self.base):
+            self.base += 1
+        return self.base
+
+class FileTransfers:
+    # Moves files between bridges in checksummed chunks. The sender keeps a window of chunks
+    # on air; the receiver acks with the first chunk it lacks plus a bitmap of the ones after
+    # it, so only lost chunks are resent. Received chunks go straight into a preallocated
+    # file, and its bitmap is saved alongside, so an offer for the same file resumes later.
+    def __init__(self, directory: str, max_bytes: int, window: int, ack_every: int, ack_delay: float,
+                 retry_timeout: float, max_retries: int, progress_interval: float, incoming_ttl: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.window = window
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+        self.retry_timeout = retry_timeout
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self.incoming_ttl = incoming_ttl
+        self._outgoing = {}  # transfer id -> OutgoingFile
+        self._incoming = {}  # (sender, transfer id) -> IncomingFile
+        # (sender, transfer id) -> (chunk count, completion time), to re-ack the sender's retries. Ids are
+        # derived from the file, so entries expire once the sender has given up retrying; sending the same
+        # file again after that starts a new transfer instead of being told it is already complete.
+        self._completed = collections.OrderedDict()
+        self.completed_ttl = retry_timeout * (max_retries + 1)
+        self.sent = 0
+        self.received = 0
+        self.corrupt_chunks = 0
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        cutoff = time.time() - self.incoming_ttl
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+
+    def _frame_call(self, payload: bytes, destination: str, channel_index: int = 0) -> tuple:
+        call = RadioCall("sendData", payload, destinationId=destination, portNum=TEXT_TRANSPORT_PORTNUM, channelIndex=channel_index)
+        return call, len(payload)
+
+    def _send_control(self, payload: bytes, destination: str, channel_index: int):
+        try:
+            jobs = tx_scheduler.submit_many([self._frame_call(payload, destination, channel_index)], TX_PRIORITY_DIRECT, TEXT_TRANSPORT_OWNER)
+        except TransmitQueueFull as e:
+            print(f"Error queueing file transfer frame: {e}")
+            return
+        jobs[0].future.add_done_callback(lambda f: f.cancelled() or f.exception())  # Nobody awaits these
+
+    def eta(self, chunks: int) -> float:
+        preset = tx_scheduler.preset or LORA_MODEM_PRESET or "LONG_FAST"
+        return chunks * estimate_airtime(TEXT_FRAME_MAX, preset) / tx_scheduler.duty_cycle
+
+    async def send(self, url: str, name: str, destination: str, owner, progress: ProgressMessage) -> OutgoingFile:
+        # Streams the attachment to disk (checksumming as it goes), then runs the transfer to completion.
+        path = os.path.join(self.directory, f"out-{random.getrandbits(32):08x}.bin")
+        crc, size = 0, 0
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                with open(path, "wb") as f:
+                    async for block in response.content.iter_chunked(65536):
+                        size += len(block)
+                        if size > self.max_bytes:
+                            break
+                        crc = zlib.crc32(block, crc)
+                        f.write(block)
+        if size > self.max_bytes or size == 0:
+            os.remove(path)
+            raise ValueError(f"files must be between 1 byte and {self.max_bytes // 1024} KB")
+        # The id depends only on the file and the destination, so sending the same file again resumes.
+        transfer_id = zlib.crc32(f"{destination}:{size}:{crc}".encode())
+        if transfer_id in self._outgoing:
+            os.remove(path)
+            raise ValueError(f"this file is already being sent to {destination}")
+        transfer = self._outgoing[transfer_id] = OutgoingFile(transfer_id, path, safe_file_name(name), size, crc, destination, owner, progress)
+        try:
+            await self._run(transfer)
+            self.sent += 1
+        finally:
+            del self._outgoing[transfer_id]
+            os.close(transfer.fd)
+            os.remove(path)
+        return transfer
+
+    def describe_outgoing(self, transfer: OutgoingFile) -> str:
+        done = transfer.base + len(transfer.acked)
+        lines = [
+            f"**{transfer.name}** ({transfer.size} bytes) to {transfer.destination}",
+            f"{done}/{transfer.count} chunks acknowledged ({done / transfer.count:.0%})",
+            f"Retransmitted chunks: {transfer.retransmits}",
+        ]
+        if done < transfer.count:
+            lines.append(f"Estimated time left: {self.eta(transfer.count - done) / 60:.0f} min")
+        return "\n".join(lines)
+
+    async def _run(self, transfer: OutgoingFile):
+        offer = FILE_OFFER.pack(FILE_FRAME_OFFER, transfer.transfer_id, transfer.size, transfer.crc, FILE_CHUNK_SIZE)
+        offer += transfer.name.encode("utf-8")[:TEXT_FRAME_MAX - FILE_OFFER.size]
+        retries = 0
+        while not transfer.answered:
+            transfer.event.clear()
+            jobs = tx_scheduler.submit_many([self._frame_call(offer, transfer.destination)], TX_PRIORITY_BULK, transfer.owner)
+            await jobs[0].future
+            if not await self._wait_for_ack(transfer):
+                retries += 1
+                if retries > self.max_retries:
+                    raise TimeoutError(f"{transfer.destination} did not answer; is it running the bridge?")
+        retries = 0
+        while transfer.base < transfer.count:
+            transfer.event.clear()
+            transfer.progress.update(Embed(title="File Transfer", description=self.describe_outgoing(transfer), color=Color.light_grey()))
+            end = min(transfer.base + self.window, transfer.count)
+            missing = [i for i in range(transfer.base, end) if i not in transfer.acked and i not in transfer.in_flight]
+            if missing:
+                calls = []
+                for index in missing:
+                    data = os.pread(transfer.fd, FILE_CHUNK_SIZE, index * FILE_CHUNK_SIZE)
+                    frame = FILE_CHUNK.pack(FILE_FRAME_CHUNK, transfer.transfer_id, index, zlib.crc32(data)) + data
+                    calls.append(self._frame_call(frame, transfer.destination))
+                    transfer.send_seq += 1
+                    transfer.in_flight[index] = transfer.send_seq
+                jobs = tx_scheduler.submit_many(calls, TX_PRIORITY_BULK, transfer.owner)
+                await asyncio.gather(*(job.future for job in jobs))
+                if transfer.event.is_set():
+                    continue
+            if await self._wait_for_ack(transfer):
+                retries = 0
+                continue
+            retries += 1
+            if retries > self.max_retries:
+                raise TimeoutError(f"{transfer.destination} stopped acknowledging chunks")
+            # Nothing heard for a whole timeout: everything unacknowledged goes again.
+            transfer.retransmits += len(transfer.in_flight)
+            transfer.in_flight.clear()
+
+    async def _wait_for_ack(self, transfer: OutgoingFile) -> bool:
+        try:
+            await asyncio.wait_for(transfer.event.wait(), self.retry_timeout)
+        except asyncio.TimeoutError:
+            return False
+        if transfer.error is not None:
+            raise RuntimeError(f"receiver cancelled the transfer: {transfer.error}")
+        return True
+
+    def _on_ack(self, sender: str, payload: bytes):
+        _, transfer_id, base, bitmap = FILE_ACK.unpack_from(payload)
+        transfer = self._outgoing.get(transfer_id)
+        if transfer is None or transfer.destination != sender or base < transfer.base:
+            return
+        transfer.answered = True
+        transfer.base = base
+        transfer.acked = {base + 1 + bit for bit in range(FILE_ACK_BITMAP_BITS) if bitmap >> bit & 1}
+        # A chunk still missing although a chunk sent after it arrived was lost; resend it now.
+        delivered = [seq for index, seq in transfer.in_flight.items() if index < base or index in transfer.acked]
+        newest = max(delivered, default=0)
+        lost = [index for index, seq in transfer.in_flight.items() if index >= base and index not in transfer.acked and seq < newest]
+        transfer.retransmits += len(lost)
+        transfer.in_flight = {
+            index: seq for index, seq in transfer.in_flight.items()
+            if index >= base and index not in transfer.acked and seq >= newest
+        }
+        transfer.event.set()
+
+    def _paths(self, sender: str, transfer_id: int) -> tuple[str, str]:
+        stem = os.path.join(self.directory, f"in-{sender.lstrip('!')}-{transfer_id:08x}")
+        return f"{stem}.part", f"{stem}.json"
+
+    def _open_incoming(self, incoming: IncomingFile):
+        part_path, _ = self._paths(incoming.sender, incoming.transfer_id)
+        incoming.fd = os.open(part_path, os.O_RDWR | os.O_CREAT)
+        os.ftruncate(incoming.fd, incoming.size)
+
+        async def edit(embed: Embed, **kwargs):
+            if incoming.message is None:
+                if "attachments" in kwargs:
+                    kwargs = {"file": kwargs["attachments"][0]}
+                # An offer can arrive while the bot is still logging in.
+                await discord_ready.wait()
+                # Transfers arrive on the primary radio; post where that mesh channel is routed.
+                channel_id = (bridge_routes.discord_channels(PRIMARY_RADIO, incoming.channel_index) or (DISCORD_CHANNEL_ID,))[0]
+                channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+                incoming.message = await channel.send(embed=embed, **kwargs)
+            else:
+                await incoming.message.edit(embed=embed, **kwargs)
+
+        incoming.progress = ProgressMessage(edit, self.progress_interval)
+
+    def _load_incoming(self, sender: str, transfer_id: int):
+        # Picks a partial transfer back up from disk, e.g. after a restart.
+        part_path, state_path = self._paths(sender, transfer_id)
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if not os.path.exists(part_path):
+            return None
+        incoming = IncomingFile(
+            sender, transfer_id, state["name"], state["size"], state["crc"], state["chunk_size"],
+            state["channel_index"], bytearray.fromhex(state["bitmap"])
+        )
+        self._open_incoming(incoming)
+        self._incoming[(sender, transfer_id)] = incoming
+        return incoming
+
+    def _save_state(self, incoming: IncomingFile):
+        _, state_path = self._paths(incoming.sender, incoming.transfer_id)
+        with open(state_path, "w") as f:
+            json.dump({
+                "name": incoming.name, "size": incoming.size, "crc": incoming.crc, "chunk_size": incoming.chunk_size,
+                "channel_index": incoming.channel_index, "bitmap": incoming.bitmap.hex()
+            }, f)
+
+    def _close_incoming(self, incoming: IncomingFile, delete: bool):
+        self._incoming.pop((incoming.sender, incoming.transfer_id), None)
+        if incoming.ack_timer is not None:
+            incoming.ack_timer.cancel()
+        if incoming.fd is not None:
+            os.close(incoming.fd)
+            incoming.fd = None
+        if delete:
+            for path in self._paths(incoming.sender, incoming.transfer_id):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _send_ack(self, incoming: IncomingFile):
+        if incoming.ack_timer is not None:
+            incoming.ack_timer.cancel()
+            incoming.ack_timer = None
+        incoming.unacked = 0
+        base = incoming.first_missing()
+        bitmap = 0
+        for bit in range(FILE_ACK_BITMAP_BITS):
+            index = base + 1 + bit
+            if index < incoming.count and incoming.has(index):
+                bitmap |= 1 << bit
+        self._save_state(incoming)
+        self._send_control(FILE_ACK.pack(FILE_FRAME_ACK, incoming.transfer_id, base, bitmap), incoming.sender, incoming.channel_index)
+
+    def describe_incoming(self, incoming: IncomingFile) -> str:
+        return (
+            f"**{incoming.name}** ({incoming.size} bytes) from {incoming.sender}\n"
+            f"{incoming.received}/{incoming.count} chunks received ({incoming.received / incoming.count:.0%})"
+        )
+
+    def _completed_count(self, key: tuple):
+        cutoff = time.monotonic() - self.completed_ttl
+        while self._completed and next(iter(self._completed.values()))[1] < cutoff:
+            self._completed.popitem(last=False)
+        entry = self._completed.get(key)
+        return None if entry is None else entry[0]
+
+    def _on_offer(self, sender: str, payload: bytes, packet: dict):
+        _, transfer_id, size, crc, chunk_size = FILE_OFFER.unpack_from(payload)
+        key = (sender, transfer_id)
+        channel_index = packet.get("channel", 0)
+        completed = self._completed_count(key)
+        if completed is not None:
+            self._send_control(FILE_ACK.pack(FILE_FRAME_ACK, transfer_id, completed, 0), sender, channel_index)
+            return
+        if size == 0 or size > self.max_bytes or chunk_size == 0:
+            self._send_control(FILE_CANCEL.pack(FILE_FRAME_CANCEL, transfer_id, 1), sender, channel_index)
+            return
+        now = time.time()
+        for stale in [entry for entry in self._incoming.values() if now - entry.touched > self.incoming_ttl]:
+            self._close_incoming(stale, delete=True)
+        incoming = self._incoming.get(key) or self._load_incoming(sender, transfer_id)
+        if incoming is None:
+            name = safe_file_name(payload[FILE_OFFER.size:].decode("utf-8", "replace"))
+            incoming = IncomingFile(sender, transfer_id, name, size, crc, chunk_size, channel_index)
+            self._open_incoming(incoming)
+            self._incoming[key] = incoming
+        incoming.touched = now
+        incoming.progress.update(Embed(title="Incoming File", description=self.describe_incoming(incoming), color=Color.light_grey()))
+        self._send_ack(incoming)
+
+    def _on_chunk(self, sender: str, payload: bytes, packet: dict):
+        _, transfer_id, index, crc = FILE_CHUNK.unpack_from(payload)
+        key = (sender, transfer_id)
+        completed = self._completed_count(key)
+        if completed is not None:
+            self._send_control(FILE_ACK.pack(FILE_FRAME_ACK, transfer_id, completed, 0), sender, packet.get("channel", 0))
+            return
+        incoming = self._incoming.get(key) or self._load_incoming(sender, transfer_id)
+        if incoming is None:
+            self._send_control(FILE_CANCEL.pack(FILE_FRAME_CANCEL, transfer_id, 3), sender, packet.get("channel", 0))
+            return
+        data = payload[FILE_CHUNK.size:]
+        expected = min(incoming.chunk_size, incoming.size - index * incoming.chunk_size)
+        if index >= incoming.count or len(data) != expected or zlib.crc32(data) != crc:
+            self.corrupt_chunks += 1
+            return
+        incoming.touched = time.time()
+        if not incoming.has(index):
+            os.pwrite(incoming.fd, data, index * incoming.chunk_size)
+            incoming.mark(index)
+            incoming.unacked += 1
+        if incoming.received == incoming.count:
+            asyncio.get_running_loop().create_task(self._complete(incoming))
+            return
+        incoming.progress.update(Embed(title="Incoming File", description=self.describe_incoming(incoming), color=Color.light_grey()))
+        if incoming.unacked >= self.ack_every:
+            self._send_ack(incoming)
+        elif incoming.ack_timer is None:
+            incoming.ack_timer = asyncio.get_running_loop().call_later(self.ack_delay, self._send_ack, incoming)
+
+    async def _complete(self, incoming: IncomingFile):
+        key = (incoming.sender, incoming.transfer_id)
+        self._close_incoming(incoming, delete=False)
+        self._completed.pop(key, None)
+        self._completed[key] = (incoming.count, time.monotonic())
+        while len(self._completed) > 256:
+            self._completed.popitem(last=False)
+        part_path, state_path = self._paths(*key)
+        crc = await asyncio.get_running_loop().run_in_executor(None, file_crc32, part_path)
+        if crc != incoming.crc:
+            del self._completed[key]
+            self._close_incoming(incoming, delete=True)
+            self._send_control(FILE_CANCEL.pack(FILE_FRAME_CANCEL, incoming.transfer_id, 2), incoming.sender, incoming.channel_index)
+            await incoming.progress.finish(Embed(title="Incoming File", description=f"{self.describe_incoming(incoming)}\nChecksum mismatch; transfer discarded.", color=Color.red()))
+            return
+        self._send_control(FILE_ACK.pack(FILE_FRAME_ACK, incoming.transfer_id, incoming.count, 0), incoming.sender, incoming.channel_index)
+        self.received += 1
+        try:
+            embed = Embed(title="Incoming File", description=f"{self.describe_incoming(incoming)}\nTransfer complete.", color=Color.green())
+            await incoming.progress.finish(embed, attachments=[discord.File(part_path, filename=incoming.name)])
+        except Exception as e:
+            print(f"Error posting received file {incoming.name}: {e}")
+        finally:
+            self._close_incoming(incoming, delete=True)
+
+    def handle_packet(self, packet: dict):
+        payload = packet.get("decoded", {}).get("payload", b"")
+        sender = packet.get("fromId")
+        if not payload or sender is None or payload[0] < FILE_FRAME_OFFER:
+            return
+        try:
+            kind = payload[0]
+            if kind == FILE_FRAME_OFFER:
+                self._on_offer(sender, payload, packet)
+            elif kind == FILE_FRAME_CHUNK:
+                self._on_chunk(sender, payload, packet)
+            elif kind == FILE_FRAME_ACK:
+                self._on_ack(sender, payload)
+            elif kind == FILE_FRAME_CANCEL:
+                _, transfer_id, reason = FILE_CANCEL.unpack_from(payload)
+                transfer = self._outgoing.get(transfer_id)
+                if transfer is not None and transfer.destination == sender:
+                    transfer.error = FILE_CANCEL_REASONS.get(reason, f"reason {reason}")
+                    transfer.event.set()
+        except (struct.error, OSError) as e:
+            print(f"Error handling file transfer frame from {sender}: {e}")
+
+file_transfers = FileTransfers(
+    FILE_TRANSFER_DIR, FILE_TRANSFER_MAX_BYTES, FILE_WINDOW, FILE_ACK_EVERY, FILE_ACK_DELAY,
+    FILE_RETRY_TIMEOUT, FILE_MAX_RETRIES, FILE_PROGRESS_INTERVAL, FILE_INCOMING_TTL
+)
+packet_ingest.register("PRIVATE_APP", file_transfers.handle_packet, primary_only=True)
 
 # --------------------------
-# Meshtastic Receive Callback
+# Telemetry History
 # --------------------------
-def on_meshtastic_receive(packet, interface):
-    try:
-        decoded = packet.get("decoded", {})
-        msg_channel = decoded.get("channel", 0)
-        if msg_channel != 0:
+TELEMETRY_METRICS = ("batteryLevel", "voltage", "channelUtilization", "airUtilTx")
+TELEMETRY_UNITS = {"batteryLevel": "%", "voltage": "V", "channelUtilization": "%", "airUtilTx": "%"}
+TELEMETRY_RAW_SAMPLES = 120          # Most recent reports kept exactly as received
+TELEMETRY_ROLLUPS = ((60, 720), (900, 1344))  # (bucket seconds, buckets kept): 12 hours of 1-minute and 14 days of 15-minute means
+TELEMETRY_MAX_NODES = setting("TELEMETRY_MAX_NODES", 2000)  # Nodes that reported least recently are dropped beyond this
+TELEMETRY_SNAPSHOT_PATH = setting("TELEMETRY_SNAPSHOT_PATH", "telemetry.snapshot")
+TELEMETRY_SNAPSHOT_INTERVAL = setting("TELEMETRY_SNAPSHOT_INTERVAL", 600.0)  # Seconds between snapshots to disk
+TELEMETRY_DEFAULT_HOURS = 24
+# Snapshot file: the magic, then per node its id and each ring's arrays as raw little-endian bytes.
+TELEMETRY_SNAPSHOT_MAGIC = b"MBTEL\x01"  # The trailing byte is the format version
+TELEMETRY_SNAPSHOT_HEADER = struct.Struct("<B")    # Metrics per row
+TELEMETRY_SNAPSHOT_NODE = struct.Struct("<H")      # Node id length; the UTF-8 node id follows
+TELEMETRY_SNAPSHOT_RING = struct.Struct("<III")    # Capacity, head, rows; the times (uint32) and values (float32) follow
+TELEMETRY_SNAPSHOT_ROLLUP = struct.Struct("<q")    # Bucket in progress or -1; its sums (float64) and counts (uint32) follow
+SPARKLINE_BLOCKS = "▁▂▃▄▅▆▇█"
+SPARKLINE_WIDTH = 40
+
+def _array_bytes(values: array.array) -> bytes:
+    if sys.byteorder == "big":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _read_array(read, typecode: str, count: int) -> array.array:
+    values = array.array(typecode)
+    values.frombytes(read(count * values.itemsize))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+class RingSeries:
+    # Fixed-capacity ring of rows (timestamp plus one value per metric) in flat typed arrays:
+    # 4 bytes per timestamp and per value, and no Python object per sample.
+    __slots__ = ("capacity", "width", "times", "values", "head")
+
+    def __init__(self, capacity: int, width: int):
+        self.capacity = capacity
+        self.width = width
+        self.times = array.array("I")
+        self.values = array.array("f")
+        self.head = 0  # Oldest row once the ring is full
+
+    def append(self, ts: float, row: list):
+        if len(self.times) < self.capacity:
+            self.times.append(int(ts))
+            self.values.extend(row)
             return
-        text = decoded.get("text", "")
-        sender = packet.get("fromId", "unknown node")
-        if text:
-            full_message = f"**[Mesh]** Message from {sender}: {text}"
-            asyncio.run_coroutine_threadsafe(
-                send_meshtastic_message(DISCORD_CHANNEL_ID, full_message),
-                bot.loop
-            )
-            if unattended_mode:
-                print(f"[DEBUG] Unattended mode active. Received message from node {sender}: {text}")
-                asyncio.run_coroutine_threadsafe(
-                    process_unattended_meshtastic_message(sender, text),
-                    bot.loop
-                )
-    except Exception as ex:
-        print(f"Error processing received Meshtastic message: {ex}")
+        start = self.head * self.width
+        self.times[self.head] = int(ts)
+        self.values[start:start + self.width] = array.array("f", row)
+        self.head = (self.head + 1) % self.capacity
+
+    def oldest(self):
+        return self.times[self.head] if self.times else None
+
+    def column(self, index: int, since: float) -> tuple[array.array, array.array]:
+        # Oldest first, starting at the first row at or after since.
+        times = self.times[self.head:] + self.times[:self.head]
+        values = self.values[index::self.width]
+        values = values[self.head:] + values[:self.head]
+        first = bisect.bisect_left(times, since)
+        return times[first:], values[first:]
+
+    def dump(self) -> bytes:
+        header = TELEMETRY_SNAPSHOT_RING.pack(self.capacity, self.head, len(self.times))
+        return header + _array_bytes(self.times) + _array_bytes(self.values)
+
+    def restore(self, read):
+        capacity, head, rows = TELEMETRY_SNAPSHOT_RING.unpack(read(TELEMETRY_SNAPSHOT_RING.size))
+        if capacity != self.capacity or rows > capacity or (head and head >= rows):
+            raise ValueError(f"ring of {rows}/{capacity} rows does not fit one of {self.capacity}")
+        self.times = _read_array(read, "I", rows)
+        self.values = _read_array(read, "f", rows * self.width)
+        self.head = head
+
+class NodeTelemetry:
+    # Raw reports plus the rolled-up series for one node. Each rollup keeps a running sum per
+    # metric for the bucket in progress and appends the bucket mean once time moves past it.
+    __slots__ = ("raw", "rollups", "buckets", "sums", "counts")
+
+    def __init__(self):
+        width = len(TELEMETRY_METRICS)
+        self.raw = RingSeries(TELEMETRY_RAW_SAMPLES, width)
+        self.rollups = [RingSeries(kept, width) for _, kept in TELEMETRY_ROLLUPS]
+        self.buckets = [None] * len(TELEMETRY_ROLLUPS)
+        self.sums = [[0.0] * width for _ in TELEMETRY_ROLLUPS]
+        self.counts = [[0] * width for _ in TELEMETRY_ROLLUPS]
+
+    def add(self, ts: float, row: list):
+        self.raw.append(ts, row)
+        for level, (seconds, _) in enumerate(TELEMETRY_ROLLUPS):
+            bucket = int(ts // seconds)
+            if bucket != self.buckets[level]:
+                self._close(level)
+                self.buckets[level] = bucket
+            sums, counts = self.sums[level], self.counts[level]
+            for index, value in enumerate(row):
+                if not math.isnan(value):
+                    sums[index] += value
+                    counts[index] += 1
+
+    def dump(self) -> bytes:
+        parts = [self.raw.dump()]
+        for level, series in enumerate(self.rollups):
+            bucket = self.buckets[level]
+            parts += [
+                series.dump(), TELEMETRY_SNAPSHOT_ROLLUP.pack(-1 if bucket is None else bucket),
+                _array_bytes(array.array("d", self.sums[level])), _array_bytes(array.array("I", self.counts[level]))
+            ]
+        return b"".join(parts)
+
+    def restore(self, read):
+        self.raw.restore(read)
+        for level, series in enumerate(self.rollups):
+            series.restore(read)
+            bucket, = TELEMETRY_SNAPSHOT_ROLLUP.unpack(read(TELEMETRY_SNAPSHOT_ROLLUP.size))
+            self.buckets[level] = None if bucket < 0 else bucket
+            self.sums[level] = list(_read_array(read, "d", series.width))
+            self.counts[level] = list(_read_array(read, "I", series.width))
+
+    def _close(self, level: int):
+        sums, counts = self.sums[level], self.counts[level]
+        if any(counts):
+            row = [total / count if count else math.nan for total, count in zip(sums, counts)]
+            self.rollups[level].append(self.buckets[level] * TELEMETRY_ROLLUPS[level][0], row)
+        self.sums[level] = [0.0] * len(sums)
+        self.counts[level] = [0] * len(counts)
+
+    def column(self, index: int, since: float) -> tuple[array.array, array.array]:
+        # The finest series that still reaches back to since; rollups include the bucket in progress.
+        raw_oldest = self.raw.oldest()
+        if len(self.raw.times) < self.raw.capacity or (raw_oldest is not None and raw_oldest <= since):
+            return self.raw.column(index, since)
+        level = len(self.rollups) - 1
+        for candidate, series in enumerate(self.rollups):
+            oldest = series.oldest()
+            if len(series.times) < series.capacity or (oldest is not None and oldest <= since):
+                level = candidate
+                break
+        times, values = self.rollups[level].column(index, since)
+        count = self.counts[level][index]
+        if count:
+            times.append(self.buckets[level] * TELEMETRY_ROLLUPS[level][0])
+            values.append(self.sums[level][index] / count)
+        return times, values
+
+def percentile(ordered: list, pct: float) -> float:
+    # Linear interpolation between closest ranks, as numpy.percentile does by default.
+    position = (len(ordered) - 1) * pct / 100
+    low = math.floor(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+def summarize_values(values: array.array):
+    numpy = optional_module("numpy")
+    if numpy is not None:
+        data = numpy.frombuffer(values, dtype=numpy.float32)
+        data = data[~numpy.isnan(data)]
+        if not data.size:
+            return None
+        p50, p95 = numpy.percentile(data, (50, 95))
+        return {"min": float(data.min()), "max": float(data.max()), "mean": float(data.mean()),
+                "p50": float(p50), "p95": float(p95), "count": int(data.size)}
+    data = sorted(value for value in values if not math.isnan(value))
+    if not data:
+        return None
+    return {"min": data[0], "max": data[-1], "mean": math.fsum(data) / len(data),
+            "p50": percentile(data, 50), "p95": percentile(data, 95), "count": len(data)}
+
+def sparkline(values: array.array, width: int = SPARKLINE_WIDTH) -> str:
+    data = [value for value in values if not math.isnan(value)]
+    if len(data) > width:
+        step = len(data) / width
+        data = [
+            math.fsum(data[int(i * step):int((i + 1) * step)]) / (int((i + 1) * step) - int(i * step))
+            for i in range(width)
+        ]
+    if not data:
+        return ""
+    low, high = min(data), max(data)
+    span = (high - low) or 1.0
+    return "".join(SPARKLINE_BLOCKS[round((value - low) / span * (len(SPARKLINE_BLOCKS) - 1))] for value in data)
+
+def render_telemetry_chart(title: str, series: dict) -> bytes:
+    # Runs on the chart thread, which is also where matplotlib gets imported. Uses Figure
+    # directly rather than pyplot, which is not thread-safe.
+    figure = optional_module("matplotlib.figure").Figure(figsize=(8, 1.8 * len(series)), dpi=100)
+    for index, (metric, (times, values)) in enumerate(series.items(), 1):
+        axes = figure.add_subplot(len(series), 1, index)
+        axes.plot([datetime.datetime.fromtimestamp(ts) for ts in times], values, linewidth=1.2)
+        axes.set_ylabel(f"{metric} ({TELEMETRY_UNITS[metric]})", fontsize=8)
+        axes.grid(alpha=0.3)
+    figure.suptitle(title)
+    figure.autofmt_xdate()
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png")
+    return buffer.getvalue()
 
-async def send_meshtastic_message(channel_id, message):
-    channel = bot.get_channel(channel_id)
-    if channel is None:
+class TelemetryStore:
+    # Device metrics history per node in bounded ring buffers. A full node costs
+    # (raw samples + rollup buckets) * (1 + metrics) * 4 bytes, about 44 KB with the defaults,
+    # so memory stays under max_nodes times that however long the bridge runs.
+    def __init__(self, max_nodes: int, snapshot_path: str, snapshot_interval: float):
+        self.max_nodes = max_nodes
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._nodes = collections.OrderedDict()  # node id -> NodeTelemetry, least recently updated first
+        self._charts = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="telemetry-chart")
+        self._snapshot_task = None
+        self.samples = 0
+        self.evicted = 0
+
+    def record(self, node_id: str, ts: float, metrics: dict):
+        row = [float(metrics[name]) if name in metrics else math.nan for name in TELEMETRY_METRICS]
+        if all(math.isnan(value) for value in row):
+            return
+        node = self._nodes.get(node_id)
+        if node is None:
+            node = self._nodes[node_id] = NodeTelemetry()
+            while len(self._nodes) > self.max_nodes:
+                self._nodes.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._nodes.move_to_end(node_id)
+        node.add(ts, row)
+        self.samples += 1
+
+    def handle_packet(self, packet: dict):
+        metrics = packet.get("decoded", {}).get("telemetry", {}).get("deviceMetrics")
+        node_id = packet.get("fromId")
+        if metrics and node_id:
+            self.record(node_id, time.time(), metrics)
+
+    def series(self, node_id: str, since: float):
+        # metric -> (times, values) for every metric with data since the given time, or None for an unknown node.
+        node = self._nodes.get(node_id)
+        if node is None:
+            return None
+        columns = {}
+        for index, metric in enumerate(TELEMETRY_METRICS):
+            times, values = node.column(index, since)
+            if any(not math.isnan(value) for value in values):
+                columns[metric] = (times, values)
+        return columns
+
+    async def chart(self, title: str, series: dict) -> bytes:
+        return await asyncio.get_running_loop().run_in_executor(self._charts, render_telemetry_chart, title, series)
+
+    def _load(self):
+        # Nodes are stored least recently updated first, so trimming from the front as they load
+        # keeps the freshest max_nodes even if the limit was lowered since the snapshot.
         try:
-            channel = await bot.fetch_channel(channel_id)
+            with open(self.snapshot_path, "rb") as f:
+                def read(size: int) -> bytes:
+                    data = f.read(size)
+                    if len(data) != size:
+                        raise ValueError("the snapshot is truncated")
+                    return data
+
+                if f.read(len(TELEMETRY_SNAPSHOT_MAGIC)) != TELEMETRY_SNAPSHOT_MAGIC:
+                    raise ValueError("not a telemetry snapshot in this version's format")
+                width, = TELEMETRY_SNAPSHOT_HEADER.unpack(read(TELEMETRY_SNAPSHOT_HEADER.size))
+                if width != len(TELEMETRY_METRICS):
+                    raise ValueError(f"the snapshot has {width} metrics per row, not {len(TELEMETRY_METRICS)}")
+                while header := f.read(TELEMETRY_SNAPSHOT_NODE.size):
+                    length, = TELEMETRY_SNAPSHOT_NODE.unpack(header)
+                    node_id = read(length).decode("utf-8")
+                    node = NodeTelemetry()
+                    node.restore(read)
+                    self._nodes[node_id] = node
+                    while len(self._nodes) > self.max_nodes:
+                        self._nodes.popitem(last=False)
+        except FileNotFoundError:
+            pass
         except Exception as e:
-            print(f"Could not fetch channel with ID {channel_id}: {e}")
-            return
-    await channel.send(message)
+            print(f"Error loading telemetry snapshot: {e}")
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self._snapshot_task is None:
+            self._load()
+            self._snapshot_task = loop.create_task(self._snapshot_loop())
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.snapshot()
+            except Exception as e:
+                print(f"Error writing telemetry snapshot: {e}")
 
-pub.subscribe(on_meshtastic_receive, "meshtastic.receive.text")
+    async def snapshot(self):
+        # Encode one node at a time on the loop (each is a few small arrays), yielding now and
+        # then so thousands of nodes never stall it; only the file write goes to a thread.
+        chunks = [TELEMETRY_SNAPSHOT_MAGIC, TELEMETRY_SNAPSHOT_HEADER.pack(len(TELEMETRY_METRICS))]
+        for index, (node_id, node) in enumerate(list(self._nodes.items())):
+            encoded = node_id.encode("utf-8")
+            chunks += [TELEMETRY_SNAPSHOT_NODE.pack(len(encoded)), encoded, node.dump()]
+            if index % 100 == 99:
+                await asyncio.sleep(0)
+        await asyncio.get_running_loop().run_in_executor(None, self._write_snapshot, b"".join(chunks))
+
+    def _write_snapshot(self, data: bytes):
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, self.snapshot_path)
+
+telemetry_store = TelemetryStore(TELEMETRY_MAX_NODES, TELEMETRY_SNAPSHOT_PATH, TELEMETRY_SNAPSHOT_INTERVAL)
+packet_ingest.register("TELEMETRY_APP", telemetry_store.handle_packet)
+
+def on_meshtastic_connection_lost(interface):
+    radio = radios_by_hostname.get(interface.hostname)
+    if radio is not None and interface is radio.supervisor.interface:
+        radio.supervisor.mark_down("connection lost")
+
+def subscribe_meshtastic_handlers():
+    # pypubsub ignores repeated subscriptions, so this is safe to call on every (re)connect.
+    pub.subscribe(on_meshtastic_receive, "meshtastic.receive")
+    pub.subscribe(on_meshtastic_node_updated, "meshtastic.node.updated")
+    pub.subscribe(on_meshtastic_connection_lost, "meshtastic.connection.lost")
 
 # --------------------------
 # Helper Functions for Formatting
@@ -90,9 +3344,25 @@ def format_timestamp(ts: float) -> str:
     return dt.strftime("%Y-%m-%d %H:%M:%S")
 
 def minutes_ago(ts: float) -> int:
-    dt = datetime.datetime.fromtimestamp(ts)
-    delta = datetime.datetime.now() - dt
-    return int(delta.total_seconds() // 60)
+    return int((time.time() - ts) // 60)
+
+def truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 4] + "\n..."
+
+def json_block(text: str, limit: int) -> str:
+    # Wrap JSON in a code block that still fits an embed field/description of the given size.
+    return f"```json\n{truncate(text, limit - 11)}```"
+
+def strip_raw_fields(value):
+    # Same cleanup showInfo() applies, but on a copy so the live NodeDB is left untouched.
+    if isinstance(value, dict):
+        return {k: strip_raw_fields(v) for k, v in value.items() if k not in ("raw", "decoded", "payload")}
+    return value
+
+def render_node_info(node_id: str) -> tuple[str, str]:
+    node = (mesh_supervisor.interface.nodes or {}).get(node_id, {})
+    title = f"Node: {node.get('user', {}).get('longName', 'Unknown')}"
+    return title, json_block(json.dumps(strip_raw_fields(node), indent=2, default=str), 4096)
 
 def format_device_metrics(metrics: dict) -> str:
     parts = []
@@ -137,13 +3407,14 @@ class DMModal(Modal, title="Send Direct Message"):
         self.node_id = node_id
 
     async def on_submit(self, interaction: discord.Interaction):
-        try:
-            meshtastic_interface.sendText(
-                self.message_input.value, destinationId=self.node_id, channelIndex=0
-            )
-            await interaction.response.send_message("Direct message sent to node.", ephemeral=True)
-        except Exception as e:
-            await interaction.response.send_message(f"Error sending DM to node: {e}", ephemeral=True)
+        await send_text_and_report(
+            interaction,
+            self.message_input.value, self.node_id, 0,
+            "Sending direct message to node...",
+            "Direct message sent to node.",
+            "Error sending DM to node",
+            ephemeral=True
+        )
 
 # --------------------------
 # Refresh View for Read Commands (e.g. /info)
@@ -163,32 +3434,51 @@ class RefreshView(View):
 # --------------------------
 # Nodes Pagination and Detail Views
 # --------------------------
+NODES_PAGE_SIZE = 7
+
+def render_node_field(node: NodeRecord) -> str:
+    # The "mins ago" suffix changes every minute, so only the stable part is cached.
+    return f"**ID:** {node.node_id}\n**AKA:** {node.short_name}\n**Last Heard:** {format_timestamp(node.last_heard)}"
+
 class NodesPaginationView(View):
-    def __init__(self, embeds: list[Embed], page_nodes: list[list[dict]]):
+    def __init__(self, snapshot: list[NodeRecord]):
         super().__init__(timeout=180)
-        self.embeds = embeds
-        self.page_nodes = page_nodes
+        # Pages are slices of a shared registry snapshot and are only rendered when viewed.
+        self.snapshot = snapshot
+        self.page_count = (len(snapshot) + NODES_PAGE_SIZE - 1) // NODES_PAGE_SIZE
         self.current_page = 0
         self._build_components()
 
+    def page_nodes(self) -> list[NodeRecord]:
+        start = self.current_page * NODES_PAGE_SIZE
+        return self.snapshot[start:start + NODES_PAGE_SIZE]
+
+    def current_embed(self) -> Embed:
+        embed = Embed(
+            title="Mesh Network Nodes",
+            description="Most recently active nodes:",
+            color=Color.blurple()
+        )
+        for node in self.page_nodes():
+            field = node_render_cache.get(node.node_id, "nodes_field", functools.partial(render_node_field, node))
+            embed.add_field(name=node.long_name, value=f"{field} ({minutes_ago(node.last_heard)} mins ago)", inline=False)
+        return embed
+
     def _build_components(self):
         self.clear_items()
-        if len(self.embeds) > 1:
+        if self.page_count > 1:
             if self.current_page > 0:
                 btn_prev = Button(label="Previous", style=discord.ButtonStyle.primary, custom_id="pagination_prev")
                 btn_prev.callback = self.prev_callback
                 self.add_item(btn_prev)
-            if self.current_page < len(self.embeds) - 1:
+            if self.current_page < self.page_count - 1:
                 btn_next = Button(label="Next", style=discord.ButtonStyle.primary, custom_id="pagination_next")
                 btn_next.callback = self.next_callback
                 self.add_item(btn_next)
         options = []
-        for node in self.page_nodes[self.current_page]:
-            user = node.get("user", {})
-            label = user.get("longName", "Unknown")
-            description = f"AKA: {user.get('shortName', 'N/A')}, {minutes_ago(node.get('lastHeard', 0))} mins ago"
-            value = user.get("id", "N/A")
-            options.append(discord.SelectOption(label=label, description=description, value=value))
+        for node in self.page_nodes():
+            description = f"AKA: {node.short_name}, {minutes_ago(node.last_heard)} mins ago"
+            options.append(discord.SelectOption(label=node.long_name, description=description, value=node.node_id))
         if options:
             select_menu = Select(placeholder="Select a node for details", min_values=1, max_values=1, options=options, custom_id="node_select")
             select_menu.callback = self.node_select_callback
@@ -197,34 +3487,32 @@ class NodesPaginationView(View):
     async def prev_callback(self, interaction: discord.Interaction):
         self.current_page -= 1
         self._build_components()
-        await interaction.response.edit_message(embed=self.embeds[self.current_page], view=self)
+        await interaction.response.edit_message(embed=self.current_embed(), view=self)
 
     async def next_callback(self, interaction: discord.Interaction):
         self.current_page += 1
         self._build_components()
-        await interaction.response.edit_message(embed=self.embeds[self.current_page], view=self)
+        await interaction.response.edit_message(embed=self.current_embed(), view=self)
 
     async def node_select_callback(self, interaction: discord.Interaction):
         selected_id = interaction.data.get("values", [None])[0]
         if selected_id is None:
             await interaction.response.send_message("No node selected.", ephemeral=True)
             return
-        current_nodes = self.page_nodes[self.current_page]
-        node = next((n for n in current_nodes if n.get("user", {}).get("id") == selected_id), None)
+        node = node_registry.get(selected_id)
         if node is None:
             await interaction.response.send_message("Node details not found.", ephemeral=True)
             return
-        user = node.get("user", {})
         details = (
-            f"**Long Name:** {user.get('longName', 'N/A')}\n"
-            f"**ID:** {user.get('id', 'N/A')}\n"
-            f"**AKA:** {user.get('shortName', 'N/A')}\n"
-            f"**Last Heard:** {format_timestamp(node.get('lastHeard', 0))} ({minutes_ago(node.get('lastHeard', 0))} mins ago)\n"
-            f"**SNR:** {node.get('snr', 'N/A')}\n"
-            f"**Device Metrics:**\n{format_device_metrics(node.get('deviceMetrics', {}))}"
+            f"**Long Name:** {node.long_name}\n"
+            f"**ID:** {node.node_id}\n"
+            f"**AKA:** {node.short_name}\n"
+            f"**Last Heard:** {format_timestamp(node.last_heard)} ({minutes_ago(node.last_heard)} mins ago)\n"
+            f"**SNR:** {node.snr}\n"
+            f"**Device Metrics:**\n{format_device_metrics(node.device_metrics)}"
         )
-        detail_view = NodeDetailView(user.get("id", "N/A"))
-        embed = Embed(title=f"Details for {user.get('longName', 'Unknown')}", description=details, color=Color.green())
+        detail_view = NodeDetailView(node.node_id)
+        embed = Embed(title=f"Details for {node.long_name}", description=details, color=Color.green())
         await interaction.response.send_message(embed=embed, view=detail_view, ephemeral=True)
 
 class NodeDetailView(View):
@@ -258,17 +3546,17 @@ class NodeActionView(View):
     async def select_callback(self, interaction: discord.Interaction):
         choice = interaction.data.get("values", [None])[0]
         if choice == "trace":
-            try:
-                meshtastic_interface.sendTraceRoute(self.node_id, hoplimit=10, channel_index=0)
-                await interaction.response.send_message(f"Traceroute request sent to node {self.node_id}.", ephemeral=True)
-            except Exception as e:
-                await interaction.response.send_message(f"Error sending traceroute: {e}", ephemeral=True)
+            await trace_and_report(interaction, self.node_id, 10, 0, ephemeral=True)
         elif choice == "location":
-            try:
-                meshtastic_interface.sendText("Requesting location update", destinationId=self.node_id, channelIndex=0)
-                await interaction.response.send_message(f"Location request sent to node {self.node_id}.", ephemeral=True)
-            except Exception as e:
-                await interaction.response.send_message(f"Error requesting location: {e}", ephemeral=True)
+            await send_and_report(
+                interaction,
+                RadioCall("sendText", "Requesting location update", destinationId=self.node_id, channelIndex=0),
+                f"Sending location request to node {self.node_id}...",
+                f"Location request sent to node {self.node_id}.",
+                "Error requesting location",
+                ephemeral=True,
+                payload_len=len("Requesting location update")
+            )
         elif choice == "message":
             modal = DMModal(self.node_id)
             await interaction.response.send_modal(modal)
@@ -279,22 +3567,33 @@ class NodeActionView(View):
 # New: InfoPaginationView for the /info command
 # --------------------------
 class InfoPaginationView(View):
-    def __init__(self, embeds: list[Embed], node_list: list[dict]):
+    def __init__(self, owner_embed: Embed, node_ids: list[str]):
         super().__init__(timeout=180)
-        # Page 0 is the owner/my info/metadata embed; subsequent pages are node info pages.
-        self.embeds = embeds
-        self.node_list = node_list  # List of node dicts (one per page)
+        # Page 0 is the owner/my info/metadata embed; subsequent pages are node info pages,
+        # rendered only when someone pages to them.
+        self.owner_embed = owner_embed
+        self.node_ids = node_ids
+        self.page_count = 1 + len(node_ids)
         self.current_page = 0
         self._build_components()
 
+    def current_embed(self) -> Embed:
+        if self.current_page == 0:
+            return self.owner_embed
+        node_id = self.node_ids[self.current_page - 1]
+        title, description = node_render_cache.get(node_id, "info", functools.partial(render_node_info, node_id))
+        embed = Embed(title=title, description=description, color=Color.blurple())
+        embed.set_footer(text=f"Page {self.current_page + 1} of {self.page_count}")
+        return embed
+
     def _build_components(self):
         self.clear_items()
-        if len(self.embeds) > 1:
+        if self.page_count > 1:
             if self.current_page > 0:
                 btn_prev = Button(label="Previous", style=discord.ButtonStyle.primary, custom_id="info_prev")
                 btn_prev.callback = self.prev_callback
                 self.add_item(btn_prev)
-            if self.current_page < len(self.embeds) - 1:
+            if self.current_page < self.page_count - 1:
                 btn_next = Button(label="Next", style=discord.ButtonStyle.primary, custom_id="info_next")
                 btn_next.callback = self.next_callback
                 self.add_item(btn_next)
@@ -306,16 +3605,15 @@ class InfoPaginationView(View):
     async def prev_callback(self, interaction: discord.Interaction):
         self.current_page -= 1
         self._build_components()
-        await interaction.response.edit_message(embed=self.embeds[self.current_page], view=self)
+        await interaction.response.edit_message(embed=self.current_embed(), view=self)
 
     async def next_callback(self, interaction: discord.Interaction):
         self.current_page += 1
         self._build_components()
-        await interaction.response.edit_message(embed=self.embeds[self.current_page], view=self)
+        await interaction.response.edit_message(embed=self.current_embed(), view=self)
 
     async def action_callback(self, interaction: discord.Interaction):
-        node = self.node_list[self.current_page - 1]  # page 0 is owner info
-        node_id = node.get("user", {}).get("id", "N/A")
+        node_id = self.node_ids[self.current_page - 1]  # page 0 is owner info
         await interaction.response.send_message("Select an action for this node:", view=NodeActionView(node_id), ephemeral=True)
 
 # --------------------------
@@ -324,175 +3622,161 @@ class InfoPaginationView(View):
 @tree.command(name="nodes", description="Retrieves a sorted, paginated list of nodes in the mesh network.")
 async def nodes(interaction: discord.Interaction):
     try:
-        nodes_data = meshtastic_interface.nodes
-        if not nodes_data:
+        snapshot = node_registry.snapshot()
+        if not snapshot:
             await interaction.response.send_message("No nodes found in the mesh network.")
             return
-
-        sorted_nodes = sorted(nodes_data.values(), key=lambda n: n.get("lastHeard", 0), reverse=True)
-        page_size = 7
-        pages = [sorted_nodes[i:i + page_size] for i in range(0, len(sorted_nodes), page_size)]
-        embeds = []
-        for page in pages:
-            embed = Embed(
-                title="Mesh Network Nodes",
-                description="Most recently active nodes:",
-                color=Color.blurple()
-            )
-            for node in page:
-                user = node.get("user", {})
-                long_name = user.get("longName", "Unknown")
-                node_id = user.get("id", "N/A")
-                short_name = user.get("shortName", "N/A")
-                ts = node.get("lastHeard", 0)
-                embed.add_field(
-                    name=long_name,
-                    value=f"**ID:** {node_id}\n**AKA:** {short_name}\n**Last Heard:** {format_timestamp(ts)} ({minutes_ago(ts)} mins ago)",
-                    inline=False
-                )
-            embeds.append(embed)
-        view = NodesPaginationView(embeds, pages)
-        await interaction.response.send_message(embed=embeds[0], view=view)
+        view = NodesPaginationView(snapshot)
+        await interaction.response.send_message(embed=view.current_embed(), view=view)
     except Exception as e:
         await interaction.response.send_message(f"Error retrieving nodes: {e}")
 
-# Updated /info command with human readable output
 @tree.command(name="info", description="Retrieves the device's configuration and status info in a human-readable format.")
 async def info(interaction: discord.Interaction):
     try:
-        info_str = meshtastic_interface.showInfo()
-        owner_line = re.search(r'^Owner:\s*(.*)', info_str, re.MULTILINE)
-        my_info_line = re.search(r'^My info:\s*(\{.*?\})', info_str, re.MULTILINE)
-        metadata_line = re.search(r'^Metadata:\s*(\{.*?\})', info_str, re.MULTILINE)
-        nodes_text = re.search(r'^Nodes in mesh:\s*(\{.*)', info_str, re.DOTALL | re.MULTILINE)
-
-        owner_info = owner_line.group(1).strip() if owner_line else "Unknown"
-        my_info_json = my_info_line.group(1).strip() if my_info_line else "{}"
-        metadata_json = metadata_line.group(1).strip() if metadata_line else "{}"
-        nodes_json_str = nodes_text.group(1).strip() if nodes_text else "{}"
-        try:
-            nodes_dict = json.loads(nodes_json_str)
-        except Exception as e:
-            nodes_dict = {}
-            print(f"Error parsing nodes JSON: {e}")
+        interface = mesh_supervisor.interface
+        owner_info = f"{interface.getLongName()} ({interface.getShortName()})"
+        my_info_json = message_to_json(interface.myInfo, multiline=True) if interface.myInfo else "{}"
+        metadata_json = message_to_json(interface.metadata, multiline=True) if interface.metadata else "{}"
+        node_ids = [node.node_id for node in node_registry.snapshot()]
 
         owner_embed = Embed(title="Owner Information", color=Color.gold())
         owner_embed.add_field(name="Owner", value=owner_info, inline=False)
-        owner_embed.add_field(name="My Info", value=f"```json\n{json.dumps(json.loads(my_info_json), indent=2)}```", inline=False)
-        owner_embed.add_field(name="Metadata", value=f"```json\n{json.dumps(json.loads(metadata_json), indent=2)}```", inline=False)
-        owner_embed.set_footer(text="Page 1 of " + str(1 + len(nodes_dict)))
-        
-        node_embeds = []
-        node_list = []
-        for key, node in nodes_dict.items():
-            node_list.append(node)
-            node_title = f"Node: {node.get('user', {}).get('longName', 'Unknown')}"
-            node_description = f"```json\n{json.dumps(node, indent=2)}```"
-            embed = Embed(title=node_title, description=node_description, color=Color.blurple())
-            embed.set_footer(text=f"Page {len(node_list)+1} of {1+len(nodes_dict)}")
-            node_embeds.append(embed)
-        
-        all_embeds = [owner_embed] + node_embeds
-        view = InfoPaginationView(all_embeds, node_list)
-        await interaction.response.send_message(embed=all_embeds[0], view=view)
+        owner_embed.add_field(name="My Info", value=json_block(my_info_json, 1024), inline=False)
+        owner_embed.add_field(name="Metadata", value=json_block(metadata_json, 1024), inline=False)
+        owner_embed.set_footer(text="Page 1 of " + str(1 + len(node_ids)))
+
+        view = InfoPaginationView(owner_embed, node_ids)
+        await interaction.response.send_message(embed=owner_embed, view=view)
     except Exception as e:
         await interaction.response.send_message(f"Error retrieving info: {e}")
 
 @tree.command(name="position", description="Sends a position packet (latitude, longitude, [altitude]).")
 async def position(interaction: discord.Interaction, latitude: float, longitude: float, altitude: int = 0):
-    try:
-        meshtastic_interface.sendPosition(latitude=latitude, longitude=longitude, altitude=altitude)
-        embed = Embed(title="Position Sent", description=f"lat: {latitude}, lon: {longitude}, alt: {altitude}", color=Color.green())
-        await interaction.response.send_message(embed=embed, view=DismissView())
-    except Exception as e:
-        await interaction.response.send_message(f"Error sending position: {e}")
+    await send_and_report(
+        interaction,
+        RadioCall("sendPosition", latitude=latitude, longitude=longitude, altitude=altitude),
+        f"Sending lat: {latitude}, lon: {longitude}, alt: {altitude}...",
+        f"lat: {latitude}, lon: {longitude}, alt: {altitude}",
+        "Error sending position",
+        title="Position Sent",
+        payload_len=POSITION_PAYLOAD_LEN
+    )
 
 @tree.command(name="telemetry", description="Requests telemetry data from the Meshtastic node.")
 async def telemetry(interaction: discord.Interaction):
-    try:
-        meshtastic_interface.sendTelemetry()
-        embed = Embed(title="Telemetry", description="Telemetry request sent.", color=Color.green())
-        await interaction.response.send_message(embed=embed, view=DismissView())
-    except Exception as e:
-        await interaction.response.send_message(f"Error requesting telemetry: {e}")
+    await send_and_report(
+        interaction,
+        RadioCall("sendTelemetry"),
+        "Sending telemetry request...",
+        "Telemetry request sent.",
+        "Error requesting telemetry",
+        title="Telemetry",
+        payload_len=TELEMETRY_PAYLOAD_LEN
+    )
 
 @tree.command(name="trace", description="Initiates a traceroute to the specified destination node.")
 async def trace(interaction: discord.Interaction, destination: str, hoplimit: int = 10, channel_index: int = 0):
-    try:
-        meshtastic_interface.sendTraceRoute(destination, hoplimit, channel_index)
-        embed = Embed(title="Traceroute", description=f"Traceroute request sent to {destination} with hoplimit {hoplimit} on channel {channel_index}.", color=Color.green())
-        await interaction.response.send_message(embed=embed, view=DismissView())
-    except Exception as e:
-        await interaction.response.send_message(f"Error sending traceroute: {e}")
+    await trace_and_report(interaction, destination, hoplimit, channel_index)
 
 @tree.command(name="senddata", description="Sends custom data on the specified port (data as hex string).")
 async def senddata(interaction: discord.Interaction, port: int, data: str):
     try:
         data_bytes = bytes.fromhex(data)
-        meshtastic_interface.sendData(data_bytes, portNum=port)
-        embed = Embed(title="Send Data", description=f"Data sent on port {port}: {data}", color=Color.green())
-        await interaction.response.send_message(embed=embed, view=DismissView())
     except Exception as e:
         await interaction.response.send_message(f"Error sending data: {e}")
+        return
+    await send_and_report(
+        interaction,
+        RadioCall("sendData", data_bytes, portNum=port),
+        f"Sending data on port {port}: {data}",
+        f"Data sent on port {port}: {data}",
+        "Error sending data",
+        title="Send Data",
+        payload_len=len(data_bytes),
+        priority=TX_PRIORITY_BULK
+    )
 
-@tree.command(name="ping", description="Sends a heartbeat (ping) to the Meshtastic node.")
-async def ping(interaction: discord.Interaction):
+@tree.command(name="sendfile", description="Sends a file to another bridge over the mesh in acknowledged chunks.")
+async def sendfile(interaction: discord.Interaction, node: str, file: discord.Attachment):
+    title = "File Transfer"
+    if file.size > FILE_TRANSFER_MAX_BYTES:
+        await interaction.response.send_message(
+            f"Error sending file: {file.filename} is {file.size // 1024} KB; the limit is {FILE_TRANSFER_MAX_BYTES // 1024} KB.", ephemeral=True
+        )
+        return
+    estimate = file_transfers.eta(-(-file.size // FILE_CHUNK_SIZE)) / 60
+    embed = Embed(title=title, description=f"Offering **{file.filename}** to {node}; about {estimate:.0f} min of airtime.", color=Color.light_grey())
+    await interaction.response.send_message(embed=embed, view=DismissView())
+    progress = ProgressMessage(lambda embed, **kwargs: interaction.edit_original_response(embed=embed, **kwargs), FILE_PROGRESS_INTERVAL)
     try:
-        meshtastic_interface.sendHeartbeat()
-        embed = Embed(title="Ping", description="Heartbeat sent to Meshtastic node.", color=Color.green())
-        await interaction.response.send_message(embed=embed, view=DismissView())
+        transfer = await file_transfers.send(file.url, file.filename, node, interaction.user.id, progress)
     except Exception as e:
-        await interaction.response.send_message(f"Error sending heartbeat: {e}")
+        await progress.finish(Embed(title=title, description=f"Error sending {file.filename} to {node}: {e}", color=Color.red()))
+        return
+    await progress.finish(Embed(title=title, description=f"{file_transfers.describe_outgoing(transfer)}\nDelivered and verified.", color=Color.green()))
+
+@tree.command(name="ping", description="Sends a heartbeat (ping) to the Meshtastic node.")
+async def ping(interaction: discord.Interaction):
+    await send_and_report(
+        interaction,
+        RadioCall("sendHeartbeat"),
+        "Sending heartbeat to Meshtastic node...",
+        "Heartbeat sent to Meshtastic node.",
+        "Error sending heartbeat",
+        title="Ping"
+    )
 
 @tree.command(
     name="lora",
     description="Sends a LoRa message on a specified channel (default 1: Side Channel (encrypted))."
 )
-async def lora(interaction: discord.Interaction, message: str, channel: int = 1):
-    try:
-        meshtastic_interface.sendText(message, channelIndex=channel)
-        embed = Embed(title="LoRa Message", description=f"Message sent on channel {channel}:\n{message}", color=Color.green())
-        await interaction.response.send_message(embed=embed, view=DismissView())
-    except Exception as e:
-        await interaction.response.send_message(f"Error sending message: {e}")
+async def lora(interaction: discord.Interaction, message: str, channel: int = 1, radio: str = None):
+    # Without a radio the message goes out the one this Discord channel is routed to, else the primary.
+    radio = radio or (bridge_routes.mesh_route(interaction.channel_id) or (PRIMARY_RADIO,))[0]
+    if radio not in radios:
+        await interaction.response.send_message(f"Unknown radio {radio}; configured: {', '.join(radios)}", ephemeral=True)
+        return
+    where = f"channel {channel}" if len(radios) == 1 else f"channel {channel} via {radio}"
+    await send_text_and_report(
+        interaction,
+        message, None, channel,
+        f"Sending message on {where}:\n{message}",
+        f"Message sent on {where}:\n{message}",
+        "Error sending message",
+        title="LoRa Message",
+        scheduler=radios[radio].scheduler
+    )
 
 @tree.command(name="message", description="Sends a direct message to a specified node.")
 async def message(interaction: discord.Interaction, nodeid: str, message: str):
-    try:
-        meshtastic_interface.sendText(message, destinationId=nodeid, channelIndex=0)
-        embed = Embed(title="Direct Message", description=f"Message sent to node {nodeid}:\n{message}", color=Color.green())
-        await interaction.response.send_message(embed=embed, view=DismissView())
-    except Exception as e:
-        await interaction.response.send_message(f"Error sending direct message to {nodeid}: {e}")
+    await send_text_and_report(
+        interaction,
+        message, nodeid, 0,
+        f"Sending message to node {nodeid}:\n{message}",
+        f"Message sent to node {nodeid}:\n{message}",
+        f"Error sending direct message to {nodeid}",
+        title="Direct Message"
+    )
 
 # New /dm command for sending a direct message using recent nodes plus any favorites
 @tree.command(name="dm", description="Send a direct message to one of the 10 most recent nodes plus any favorites.")
 async def dm(interaction: discord.Interaction):
     try:
-        nodes_data = meshtastic_interface.nodes
-        if not nodes_data:
+        # The registry keeps nodes ordered by lastHeard, so the 10 most recent are a slice.
+        recent_nodes = node_registry.recent(0, 10)
+        if not recent_nodes:
             await interaction.response.send_message("No nodes available.", ephemeral=True)
             return
-
-        # Sort nodes by lastHeard descending.
-        sorted_nodes = sorted(nodes_data.values(), key=lambda n: n.get("lastHeard", 0), reverse=True)
-        recent_nodes = sorted_nodes[:10]
-        # Collect favorites from all nodes.
-        favorite_nodes = [node for node in nodes_data.values() if node.get("isFavorite", False)]
         # Use a dictionary keyed by node ID to avoid duplicates.
-        combined = {node.get("user", {}).get("id", "N/A"): node for node in recent_nodes}
-        for node in favorite_nodes:
-            node_id = node.get("user", {}).get("id", "N/A")
-            if node_id not in combined:
-                combined[node_id] = node
+        combined = {node.node_id: node for node in recent_nodes}
+        for node in node_registry.favorites():
+            if node.node_id not in combined:
+                combined[node.node_id] = node
         # Build the select options.
         options = []
         for node in combined.values():
-            user = node.get("user", {})
-            label = user.get("longName", "Unknown")
-            description = f"AKA: {user.get('shortName', 'N/A')}"
-            value = user.get("id", "N/A")
-            options.append(discord.SelectOption(label=label, description=description, value=value))
+            options.append(discord.SelectOption(label=node.long_name, description=f"AKA: {node.short_name}", value=node.node_id))
         # Create the select menu.
         select_menu = Select(placeholder="Select a node to message", options=options, custom_id="dm_select")
         
@@ -514,7 +3798,7 @@ async def dm(interaction: discord.Interaction):
 @tree.command(name="channels", description="Lists active channels on the Meshtastic node.")
 async def channels(interaction: discord.Interaction):
     try:
-        chans = meshtastic_interface.localNode.channels
+        chans = mesh_supervisor.interface.localNode.channels
         active_channels = []
         for idx, chan in enumerate(chans):
             if chan.role == channel_pb2.Channel.Role.DISABLED:
@@ -529,6 +3813,193 @@ async def channels(interaction: discord.Interaction):
     except Exception as e:
         await interaction.response.send_message(f"Error retrieving channels: {e}")
 
+# --------------------------
+# Message History Pagination View
+# --------------------------
+def format_history_row(row: tuple) -> str:
+    _, ts, direction, node_id, destination, channel, text = row
+    if direction == "in":
+        route = f"{node_id} → {destination}"
+    else:
+        route = f"bridge → {destination}"
+    return f"`{format_timestamp(ts)}` **{route}** (ch {channel}): {truncate(text, 300)}"
+
+class HistoryPaginationView(View):
+    def __init__(self, filters: dict, rows: list[tuple]):
+        super().__init__(timeout=180)
+        self.filters = filters
+        self.rows = rows
+        self.newer_cursors = []  # Newest row id of each page we moved away from, to step back with
+        self._build_components()
+
+    def current_embed(self) -> Embed:
+        described = ", ".join(f"{k}: {v}" for k, v in self.filters.items() if v is not None) or "all messages"
+        lines = [format_history_row(row) for row in self.rows] or ["No messages found."]
+        return Embed(title="Message History", description=truncate("\n".join(lines), 4096), color=Color.blurple()).set_footer(text=described)
+
+    def _build_components(self):
+        self.clear_items()
+        if self.newer_cursors:
+            btn_newer = Button(label="Newer", style=discord.ButtonStyle.primary, custom_id="history_newer")
+            btn_newer.callback = self.newer_callback
+            self.add_item(btn_newer)
+        if len(self.rows) == HISTORY_PAGE_SIZE:
+            btn_older = Button(label="Older", style=discord.ButtonStyle.primary, custom_id="history_older")
+            btn_older.callback = self.older_callback
+            self.add_item(btn_older)
+
+    async def older_callback(self, interaction: discord.Interaction):
+        self.newer_cursors.append(self.rows[0][0])
+        self.rows = await message_archive.search(**self.filters, before_id=self.rows[-1][0])
+        self._build_components()
+        await interaction.response.edit_message(embed=self.current_embed(), view=self)
+
+    async def newer_callback(self, interaction: discord.Interaction):
+        # Rows from the newest row of the previous page downwards.
+        self.rows = await message_archive.search(**self.filters, before_id=self.newer_cursors.pop() + 1)
+        self._build_components()
+        await interaction.response.edit_message(embed=self.current_embed(), view=self)
+
+@tree.command(name="history", description="Searches archived mesh messages by node, channel or text.")
+async def history(interaction: discord.Interaction, node: str = None, channel: int = None, search: str = None):
+    try:
+        filters = {"node_id": node, "channel": channel, "text": search}
+        rows = await message_archive.search(**filters)
+        view = HistoryPaginationView(filters, rows)
+        await interaction.response.send_message(embed=view.current_embed(), view=view)
+    except Exception as e:
+        await interaction.response.send_message(f"Error retrieving history: {e}")
+
+@tree.command(name="stats", description="Shows a node's telemetry history: min/max/mean/percentiles and a chart.")
+async def stats(interaction: discord.Interaction, node: str, hours: int = TELEMETRY_DEFAULT_HOURS):
+    try:
+        series = telemetry_store.series(node, time.time() - hours * 3600)
+        if not series:
+            await interaction.response.send_message(f"No telemetry recorded for {node} in the last {hours}h.", ephemeral=True)
+            return
+        # Rendering the chart can take a moment; acknowledge first.
+        await interaction.response.defer()
+        record = node_registry.get(node)
+        title = f"Telemetry: {record.long_name} ({node})" if record is not None else f"Telemetry: {node}"
+        embed = Embed(title=title, description=f"Last {hours}h", color=Color.teal())
+        for metric, (times, values) in series.items():
+            summary = summarize_values(values)
+            unit = TELEMETRY_UNITS[metric]
+            lines = [
+                f"min {summary['min']:.2f}{unit} / max {summary['max']:.2f}{unit} / mean {summary['mean']:.2f}{unit}",
+                f"p50 {summary['p50']:.2f}{unit} / p95 {summary['p95']:.2f}{unit} ({summary['count']} points)"
+            ]
+            if not HAS_MATPLOTLIB:
+                lines.append(f"`{sparkline(values)}`")
+            embed.add_field(name=metric, value="\n".join(lines), inline=False)
+        if not HAS_MATPLOTLIB:
+            await interaction.followup.send(embed=embed, view=DismissView())
+            return
+        chart = await telemetry_store.chart(title, series)
+        embed.set_image(url="attachment://telemetry.png")
+        await interaction.followup.send(embed=embed, file=discord.File(io.BytesIO(chart), filename="telemetry.png"), view=DismissView())
+    except Exception as e:
+        if interaction.response.is_done():
+            await interaction.followup.send(f"Error retrieving telemetry stats: {e}")
+        else:
+            await interaction.response.send_message(f"Error retrieving telemetry stats: {e}")
+
+@tree.command(name="nearby", description="Lists the nodes closest to a node (ours by default), or all within a radius.")
+async def nearby(interaction: discord.Interaction, node: str = None, count: int = NEARBY_DEFAULT_COUNT, radius_km: float = None):
+    try:
+        origin = node or local_node_id()
+        center = node_positions.get(origin)
+        if center is None:
+            await interaction.response.send_message(f"No known position for {origin}.", ephemeral=True)
+            return
+        if radius_km is not None:
+            results = node_positions.within(*center, radius_km, exclude=origin)
+            heading = f"{len(results)} node(s) within {radius_km:g} km"
+        else:
+            results = node_positions.nearest(*center, min(count, NEARBY_MAX_RESULTS), exclude=origin)
+            heading = f"{len(results)} nearest node(s)"
+        lines = []
+        for node_id, distance, bearing in results[:NEARBY_MAX_RESULTS]:
+            record = node_registry.get(node_id)
+            name = f"{record.long_name} ({node_id})" if record is not None else node_id
+            heard = f", heard {minutes_ago(record.last_heard)} min ago" if record is not None and record.last_heard else ""
+            lines.append(f"**{name}**: {distance:.2f} km {compass_point(bearing)} ({bearing:.0f}°){heard}")
+        if len(results) > NEARBY_MAX_RESULTS:
+            lines.append(f"...and {len(results) - NEARBY_MAX_RESULTS} more")
+        embed = Embed(title=f"Nodes near {origin}", description="\n".join(lines) or "No other nodes with a known position.", color=Color.blurple())
+        embed.set_footer(text=f"{heading} · {len(node_positions)} positioned nodes")
+        await interaction.response.send_message(embed=embed, view=DismissView())
+    except Exception as e:
+        await interaction.response.send_message(f"Error finding nearby nodes: {e}")
+
+def format_latency(seconds: float) -> str:
+    return f"{seconds * 1000:.0f} ms" if seconds < 1 else f"{seconds:.2f} s"
+
+LATENCY_SUMMARIES = (  # (histogram, label) shown by /metrics
+    ("bridge_mesh_to_discord_seconds", "Mesh → Discord"),
+    ("bridge_ingest_wait_seconds", "Ingest wait"),
+    ("bridge_radio_write_seconds", "Queue → radio write"),
+    ("bridge_command_seconds", "Slash commands"),
+    ("bridge_llm_seconds", "LLM round trip"),
+)
+
+@tree.command(name="metrics", description="Shows bridge latencies, queue depths and radio link health.")
+async def metrics_report(interaction: discord.Interaction):
+    try:
+        lines = []
+        for name, label in LATENCY_SUMMARIES:
+            histogram = metrics.histogram(name)
+            if histogram.count:
+                lines.append(
+                    f"**{label}**: p50 {format_latency(histogram.quantile(0.5))}, "
+                    f"p99 {format_latency(histogram.quantile(0.99))} ({histogram.count})"
+                )
+        embed = Embed(title="Bridge Metrics", description="\n".join(lines) or "No latencies recorded yet.", color=Color.blurple())
+        for name, radio in radios.items():
+            link = radio.supervisor.stats()
+            ingest = radio.ingest.stats()
+            embed.add_field(name=f"Radio {name}", value="\n".join([
+                f"{'Connected' if link['connected'] else 'Down'}, {link['reconnects']} reconnect(s)",
+                f"TX queue {radio.scheduler.depth}, outbound {link['outbound_queued']} (lost {link['outbound_lost']})",
+                f"Ingest queue {ingest['depth']}, {ingest['received']} received, {ingest['dropped']} dropped",
+            ]), inline=False)
+        relay = discord_relay.stats()
+        embed.add_field(name="Discord relay", value=(
+            f"{relay['pending']} pending, {relay['posts']} posts, {relay['rate_limit_waits']} rate-limit waits\n"
+            f"{len(ack_tracker)} DM(s) awaiting acknowledgement"
+        ), inline=False)
+        endpoint = f"http://{METRICS_HOST}:{METRICS_PORT}/metrics" if METRICS_PORT is not None else "disabled"
+        embed.set_footer(text=f"Prometheus endpoint: {endpoint}")
+        await interaction.response.send_message(embed=embed, view=DismissView())
+    except Exception as e:
+        await interaction.response.send_message(f"Error reading metrics: {e}")
+
+@tree.command(name="profile", description="Samples the bot's CPU use for some seconds and lists the busiest functions.")
+async def profile_loop(interaction: discord.Interaction, seconds: int = 10):
+    try:
+        if profiler.running:
+            await interaction.response.send_message("A profile is already running.", ephemeral=True)
+            return
+        seconds = max(1, min(seconds, PROFILER_MAX_SECONDS))
+        await interaction.response.defer()
+        samples = await profiler.profile(seconds)
+        if samples is None:
+            await interaction.followup.send("A profile is already running.")
+            return
+        lines = [
+            f"`{own:6.1%}` self, `{total:6.1%}` total: {frame}"
+            for frame, own, total in SamplingProfiler.top(samples, 15)
+        ]
+        embed = Embed(title=f"CPU profile ({seconds}s)", description="\n".join(lines) or "No samples taken; the bot was idle.", color=Color.blurple())
+        embed.set_footer(text=f"{sum(samples.values())} samples · attached as collapsed stacks for flame graph tools")
+        profile_file = discord.File(io.BytesIO(SamplingProfiler.collapsed(samples).encode()), filename="profile.txt")
+        await interaction.followup.send(embed=embed, file=profile_file, view=DismissView())
+    except Exception as e:
+        if interaction.response.is_done():
+            await interaction.followup.send(f"Error profiling: {e}")
+        else:
+            await interaction.response.send_message(f"Error profiling: {e}")
+
 @tree.command(name="unattended", description="Toggle unattended mode for auto-reply using Ollama API.")
 async def unattended(interaction: discord.Interaction):
     global unattended_mode
@@ -547,73 +4018,1000 @@ async def on_message(message: discord.Message):
     await bot.process_commands(message)
 
 # --------------------------
-# Async function to process unattended meshtastic messages
+# Conversation Memory for Unattended Mode
 # --------------------------
-async def process_unattended_meshtastic_message(node_id: str, text: str):
-    key = str(node_id)
-    if key not in conversation_history:
-        conversation_history[key] = []
-    conversation_history[key].append({"role": "user", "content": text})
-    system_prompt = {
-        "role": "system",
-        "content": "You are Sara a human female user of a LoRa radio in Pike National Forest in Colorado. Reply to this message, keeping all responses under 125 characters."
-    }
-    payload = {
-        "model": "llama3.2:1b",
-        "messages": [system_prompt] + conversation_history[key],
-        "stream": False,
-        "options": {
-            "max_tokens": 120
+CONVERSATION_MAX_NODES = 256       # Idle conversations beyond this are evicted from RAM (least recently used first)
+CONVERSATION_MAX_MESSAGES = 20     # Turns kept per node
+CONVERSATION_MAX_TOKENS = 1024     # Estimated prompt tokens of history sent per request
+CONVERSATION_SUMMARIZE = setting("CONVERSATION_SUMMARIZE", False)  # Fold trimmed turns into a running summary via the LLM
+CONVERSATION_DB_PATH = setting("CONVERSATION_DB_PATH", None)  # e.g. "conversations.db" to keep history across restarts
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text; good enough for budgeting.
+    return len(text) // 4 + 1
+
+class Conversation:
+    __slots__ = ("messages", "tokens", "summary", "trimmed")
+
+    def __init__(self, messages=(), summary: str = ""):
+        self.messages = collections.deque(messages)
+        self.tokens = sum(estimate_tokens(m["content"]) for m in self.messages)
+        self.summary = summary
+        self.trimmed = []  # Turns dropped from the window that have not been summarized yet
+
+class ConversationStore:
+    # Keeps at most max_nodes conversations in RAM. With a db_path, every turn is also
+    # written to SQLite and a conversation is only loaded back when its node talks again.
+    # After open(), the database is only touched on one worker thread: writes are queued in order,
+    # a load sees every earlier write, and the event loop never waits on disk.
+    def __init__(self, max_nodes: int, max_messages: int, max_tokens: int, summarize: bool = False, db_path: str = None):
+        self.max_nodes = max_nodes
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self._cache = collections.OrderedDict()  # node id -> Conversation, least recently used first
+        self.db_path = db_path
+        self._db = None
+        self._worker = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-db")
+
+    def open(self):
+        if not self.db_path or self._db is not None:
+            return
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, node_id TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_node ON messages (node_id, id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS summaries (node_id TEXT PRIMARY KEY, summary TEXT NOT NULL)")
+        self._db.commit()
+
+    def __len__(self):
+        return len(self._cache)
+
+    async def _load(self, node_id: str) -> Conversation:
+        conversation = self._cache.get(node_id)
+        if conversation is not None:
+            self._cache.move_to_end(node_id)
+            return conversation
+        if self._db is not None:
+            messages, summary = await asyncio.get_running_loop().run_in_executor(self._worker, self._read, node_id)
+            # Another task may have loaded it while we waited; that copy may already have new turns.
+            conversation = self._cache.get(node_id) or Conversation(messages, summary)
+        else:
+            conversation = Conversation()
+        self._cache[node_id] = conversation
+        self._cache.move_to_end(node_id)
+        while len(self._cache) > self.max_nodes:
+            self._cache.popitem(last=False)
+        return conversation
+
+    def _read(self, node_id: str) -> tuple[list[dict], str]:
+        rows = self._db.execute(
+            "SELECT role, content FROM messages WHERE node_id = ? ORDER BY id DESC LIMIT ?",
+            (node_id, self.max_messages)
+        ).fetchall()
+        row = self._db.execute("SELECT summary FROM summaries WHERE node_id = ?", (node_id,)).fetchone()
+        return [{"role": role, "content": content} for role, content in reversed(rows)], row[0] if row else ""
+
+    def _write(self, statements: list[tuple]):
+        try:
+            with self._db:
+                for sql, params in statements:
+                    self._db.execute(sql, params)
+        except Exception as e:
+            print(f"Error writing conversation history: {e}")
+
+    async def append(self, node_id: str, role: str, content: str):
+        conversation = await self._load(node_id)
+        conversation.messages.append({"role": role, "content": content})
+        conversation.tokens += estimate_tokens(content)
+        while len(conversation.messages) > 1 and (
+            len(conversation.messages) > self.max_messages or conversation.tokens > self.max_tokens
+        ):
+            dropped = conversation.messages.popleft()
+            conversation.tokens -= estimate_tokens(dropped["content"])
+            if self.summarize:
+                conversation.trimmed.append(dropped)
+        if self._db is not None:
+            self._worker.submit(self._write, [
+                ("INSERT INTO messages (node_id, role, content) VALUES (?, ?, ?)", (node_id, role, content)),
+                # Only the newest window is ever read back, so older rows are pruned as we go.
+                ("DELETE FROM messages WHERE node_id = ? AND id <= "
+                 "(SELECT id FROM messages WHERE node_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                 (node_id, node_id, len(conversation.messages))),
+            ])
+
+    async def prompt(self, node_id: str) -> list[dict]:
+        conversation = await self._load(node_id)
+        messages = list(conversation.messages)
+        if conversation.summary:
+            messages.insert(0, {"role": "system", "content": f"Summary of earlier conversation: {conversation.summary}"})
+        return messages
+
+    async def take_trimmed(self, node_id: str) -> tuple[str, list[dict]]:
+        conversation = await self._load(node_id)
+        trimmed, conversation.trimmed = conversation.trimmed, []
+        return conversation.summary, trimmed
+
+    async def set_summary(self, node_id: str, summary: str):
+        (await self._load(node_id)).summary = summary
+        if self._db is not None:
+            self._worker.submit(self._write, [
+                ("INSERT OR REPLACE INTO summaries (node_id, summary) VALUES (?, ?)", (node_id, summary)),
+            ])
+
+conversation_store = ConversationStore(
+    CONVERSATION_MAX_NODES, CONVERSATION_MAX_MESSAGES, CONVERSATION_MAX_TOKENS,
+    CONVERSATION_SUMMARIZE, CONVERSATION_DB_PATH
+)
+
+# --------------------------
+# Auto-Reply Engine for Unattended Mode
+# --------------------------
+OLLAMA_API_URL = setting("OLLAMA_API_URL", "http://localhost:11434/api/chat")
+OLLAMA_MODEL = setting("OLLAMA_MODEL", "llama3.2:1b")
+LLM_MAX_CONCURRENCY = setting("LLM_MAX_CONCURRENCY", 2)  # Replies generated at the same time across all nodes
+LLM_MAX_PENDING_PER_NODE = 4   # Messages buffered per node while a reply is generating; oldest are dropped beyond this
+LLM_REQUEST_TIMEOUT = 250
+SYSTEM_PROMPT = {
+    "role": "system",
+    "content": "You are Sara a human female user of a LoRa radio in Pike National Forest in Colorado. Reply to this message, keeping all responses under 125 characters."
+}
+
+class AutoReplyEngine:
+    # Each node gets its own worker so replies to it stay in order, while a shared
+    # semaphore caps how many LLM requests run at once. Nothing here blocks the event loop.
+    def __init__(self, api_url: str, model: str, max_concurrency: int, max_pending: int, timeout: float):
+        self.api_url = api_url
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pending = {}   # node id -> deque of texts waiting for a reply
+        self._workers = {}   # node id -> task draining that node's pending texts
+        self._semaphore = None
+        self._session = None
+        self.dropped = 0
+        self.merged = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def submit(self, node_id: str, text: str):
+        # Must be called on the event loop (use loop.call_soon_threadsafe from other threads).
+        key = str(node_id)
+        pending = self._pending.setdefault(key, collections.deque())
+        if len(pending) >= self.max_pending:
+            pending.popleft()
+            self.dropped += 1
+        pending.append(text)
+        worker = self._workers.get(key)
+        if worker is None or worker.done():
+            self._workers[key] = asyncio.create_task(self._drain(key))
+
+    async def _drain(self, key: str):
+        pending = self._pending[key]
+        try:
+            while pending:
+                # Everything that arrived while the previous reply was generating is answered in one turn.
+                texts = list(pending)
+                pending.clear()
+                self.merged += len(texts) - 1
+                await self._reply(key, "\n".join(texts))
+        finally:
+            self._workers.pop(key, None)
+            if not pending:
+                self._pending.pop(key, None)
+
+    async def _chat(self, messages: list[dict]) -> str:
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": False,
+            "options": {
+                "max_tokens": 120
+            }
         }
-    }
-    try:
-        print(f"[DEBUG] Sending meshtastic message to LLM for node {node_id}: {text}")
-        response = requests.post("http://localhost:11434/api/chat", json=payload, timeout=250)
-        response.raise_for_status()
-        response_text = response.text.strip()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                async with self._get_session().post(self.api_url, json=payload) as response:
+                    response.raise_for_status()
+                    response_text = (await response.text()).strip()
+            except Exception:
+                metrics.inc("bridge_llm_errors_total")
+                raise
+            metrics.observe("bridge_llm_seconds", time.monotonic() - started)
         try:
             data, _ = json.JSONDecoder().raw_decode(response_text)
         except Exception as json_ex:
-            print(f"[DEBUG] JSON decode error for node {node_id}: {json_ex}. Response text: {response_text}")
-            raise json_ex
-        assistant_reply = data.get("message", {}).get("content", "").strip()
-        if assistant_reply:
-            conversation_history[key].append({"role": "assistant", "content": assistant_reply})
-            print(f"[DEBUG] Received reply from LLM for node {node_id}: {assistant_reply}")
-            meshtastic_interface.sendText(assistant_reply, destinationId=node_id, channelIndex=0)
-            print(f"[DEBUG] A response to node {node_id} was sent to their message '{text}' the LLM replied '{assistant_reply}'")
-            await send_meshtastic_message(DISCORD_CHANNEL_ID, f"**[Mesh Auto Reply]** to node {node_id}: {assistant_reply}")
-        else:
-            print(f"[DEBUG] LLM did not return a valid reply for node {node_id}.")
-    except Exception as e:
-        print(f"[DEBUG] Error communicating with LLM for node {node_id}: {e}")
+            metrics.inc("bridge_llm_errors_total")
+            log.debug("LLM response is not JSON (%s): %.200s", json_ex, response_text)
+            raise
+        return data.get("message", {}).get("content", "").strip()
+
+    async def _summarize(self, node_id: str):
+        summary, trimmed = await conversation_store.take_trimmed(node_id)
+        if not trimmed:
+            return
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in trimmed)
+        if summary:
+            transcript = f"Earlier summary: {summary}\n{transcript}"
+        instruction = {
+            "role": "system",
+            "content": "Summarize this conversation in under 300 characters, keeping names, places and open questions."
+        }
+        try:
+            new_summary = await self._chat([instruction, {"role": "user", "content": transcript}])
+            if new_summary:
+                await conversation_store.set_summary(node_id, new_summary)
+        except Exception as e:
+            print(f"Error summarizing conversation for node {node_id}: {e}")
+
+    async def _reply(self, node_id: str, text: str):
+        await conversation_store.append(node_id, "user", text)
+        try:
+            log.debug("Auto-reply: asking the LLM for node %s", node_id)
+            assistant_reply = await self._chat([SYSTEM_PROMPT] + await conversation_store.prompt(node_id))
+            if assistant_reply:
+                await conversation_store.append(node_id, "assistant", assistant_reply)
+                plan = text_transport.plan(assistant_reply, node_id, 0)
+                jobs = tx_scheduler.submit_many(plan.calls, TX_PRIORITY_AUTO_REPLY, "auto-reply")
+                await text_transport.sent(plan, jobs)
+                metrics.inc("bridge_auto_replies_total", (("result", "sent"),))
+                log.debug("Auto-reply: sent %d characters to node %s", len(assistant_reply), node_id)
+                # Echo it wherever the message it answers was relayed: channel 0 of the primary radio.
+                for channel_id in bridge_routes.discord_channels(PRIMARY_RADIO, 0):
+                    discord_relay.enqueue(channel_id, f"**[Mesh Auto Reply]** to node {node_id}: {assistant_reply}")
+            else:
+                metrics.inc("bridge_auto_replies_total", (("result", "empty"),))
+                log.debug("Auto-reply: the LLM returned nothing for node %s", node_id)
+        except Exception as e:
+            metrics.inc("bridge_auto_replies_total", (("result", "error"),))
+            print(f"Error generating an auto-reply for node {node_id}: {e}")
+        if conversation_store.summarize:
+            await self._summarize(node_id)
+
+auto_reply_engine = AutoReplyEngine(
+    OLLAMA_API_URL, OLLAMA_MODEL, LLM_MAX_CONCURRENCY, LLM_MAX_PENDING_PER_NODE, LLM_REQUEST_TIMEOUT
+)
 
 # --------------------------
-# Keep Meshtastic Connection Alive
+# Meshtastic Connection Supervisor
 # --------------------------
-def keep_meshtastic_alive():
-    try:
+class MeshtasticSupervisor:
+    # Owns one radio's TCPInterface: checks link health with heartbeats, and when the link drops
+    # closes it and reconnects with exponential backoff. Sends made meanwhile are parked
+    # in the outbound queue by the transmit scheduler and resumed after reconnecting.
+    def __init__(self, radio: "Radio", hostname: str, heartbeat_interval: float, heartbeat_timeout: float,
+                 backoff_initial: float, backoff_max: float):
+        self.radio = radio
+        self.hostname = hostname
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.interface = None
+        self.connected = False
+        self.loop = None  # The bridge's event loop, set before start()
+        self._lost = threading.Event()
+        self._down_since = None
+        self._thread = None
+        self.reconnects = 0
+        self.connect_failures = 0
+        self.last_reconnect_seconds = None
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "reconnects": self.reconnects,
+            "connect_failures": self.connect_failures,
+            "last_reconnect_seconds": self.last_reconnect_seconds,
+            "outbound_queued": len(self.radio.outbound),
+            "outbound_queued_total": self.radio.outbound.queued_total,
+            "outbound_lost": self.radio.outbound.lost,
+        }
+
+    def mark_down(self, reason):
+        if self.connected:
+            print(f"Meshtastic link to {self.radio.name} down: {reason}")
+        self.connected = False
+        self._lost.set()
+
+    def _connect(self) -> bool:
+        try:
+            if RADIO_DAEMON_SOCKET and not radio_daemon.running:
+                interface_class = DaemonInterface
+            else:
+                interface_class = ReplayInterface if REPLAY_PATH else meshtastic.tcp_interface.TCPInterface
+            interface = interface_class(hostname=self.hostname)
+        except Exception as e:
+            print(f"Error initializing Meshtastic TCP interface for {self.radio.name}: {e}")
+            self.connect_failures += 1
+            return False
+        self.interface = interface
+        self._lost.clear()
+        self.connected = True
+        subscribe_meshtastic_handlers()
+        if self.radio.primary:
+            node_registry.load(interface.nodes or {})
+            node_positions.load(interface.nodes or {})
+        else:
+            # Other radios add what they can see to the primary's view instead of replacing it.
+            for node in (interface.nodes or {}).values():
+                node_registry.upsert(node)
+                node_positions.update(node_id_of(node), node.get("position") or {})
+        node_render_cache.clear()
+        if self.radio.primary:
+            startup_timer.mark("radio_connected")
+        if self._down_since is not None:
+            self.last_reconnect_seconds = time.monotonic() - self._down_since
+            self._down_since = None
+            self.reconnects += 1
+            print(f"Reconnected to Meshtastic node {self.radio.name} after {self.last_reconnect_seconds:.1f}s")
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.radio.scheduler.resume)
+        return True
+
+    def _disconnect(self):
+        self.connected = False
+        if self._down_since is None:
+            self._down_since = time.monotonic()
+            try:
+                self.interface.close()
+            except Exception as e:
+                print(f"Error closing Meshtastic interface: {e}")
+
+    def _run(self):
+        delay = self.backoff_initial
+        if not self._connect():
+            self._down_since = time.monotonic()
         while True:
-            time.sleep(1)
-    except Exception as e:
-        print(f"Meshtastic thread error: {e}")
+            if self.connected:
+                if not self._lost.wait(self.heartbeat_interval):
+                    try:
+                        if not self.interface.isConnected.is_set():
+                            raise RadioUnavailable("interface reports disconnected")
+                        self.radio.sender.run_blocking(RadioCall("sendHeartbeat"), self.heartbeat_timeout)
+                    except Exception as e:
+                        self.mark_down(f"heartbeat failed: {e}")
+                    continue
+            self._disconnect()
+            if self._connect():
+                delay = self.backoff_initial
+            else:
+                time.sleep(random.uniform(delay / 2, delay))
+                delay = min(delay * 2, self.backoff_max)
 
-meshtastic_thread = threading.Thread(target=keep_meshtastic_alive, daemon=True)
-meshtastic_thread.start()
+    def start(self):
+        # Even the first connect happens on the supervisor thread: fetching a large NodeDB takes
+        # seconds, and the Discord login and the other radios go ahead in the meantime.
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"meshtastic-supervisor-{self.radio.name}")
+        self._thread.start()
 
 # --------------------------
-# Bot Event Handlers
+# Radios and Bridge Routes
 # --------------------------
-@bot.event
-async def on_ready():
-    print(f"Logged in as {bot.user} (ID: {bot.user.id})")
+PRIMARY_RADIO = next(iter(MESHTASTIC_RADIOS))
+
+class Radio:
+    # One gateway node with its own supervisor, sender thread, outbound queue, transmit
+    # scheduler and ingest queue, so a slow or dead radio never stalls traffic on the others.
+    def __init__(self, name: str, hostname: str, sender: RadioSender, outbound: OutboundQueue,
+                 scheduler: TransmitScheduler, ingest: PacketIngest):
+        self.name = name
+        self.primary = name == PRIMARY_RADIO
+        self.sender = sender
+        self.outbound = outbound
+        self.scheduler = scheduler
+        self.ingest = ingest
+        self.supervisor = MeshtasticSupervisor(
+            self, hostname, MESHTASTIC_HEARTBEAT_INTERVAL, MESHTASTIC_HEARTBEAT_TIMEOUT,
+            MESHTASTIC_RECONNECT_INITIAL, MESHTASTIC_RECONNECT_MAX
+        )
+        sender.supervisor = scheduler.supervisor = self.supervisor
+        scheduler.sender = sender
+        scheduler.outbound = outbound
+
+    @classmethod
+    def extra(cls, name: str, hostname: str) -> "Radio":
+        # Any radio but the primary, which is built from the module-level singletons instead.
+        root, ext = os.path.splitext(OUTBOUND_QUEUE_PATH)
+        return cls(
+            name, hostname, RadioSender(name), OutboundQueue(f"{root}-{name}{ext}", OUTBOUND_QUEUE_MAX),
+            TransmitScheduler(TX_DUTY_CYCLE, TX_BURST_AIRTIME, TX_MAX_QUEUED_PER_USER),
+            PacketIngest(INGEST_QUEUE_MAX, INGEST_OVERFLOW_POLICY, packet_ingest.handlers, primary=False)
+        )
+
+class RouteTable:
+    # (radio, mesh channel) <-> Discord channel, indexed both ways when built so routing a
+    # packet or a command is a single dict lookup.
+    def __init__(self, routes: list[tuple]):
+        self._to_discord = {}
+        self._to_mesh = {}
+        for radio, channel_index, channel_id in routes:
+            if radio not in MESHTASTIC_RADIOS:
+                print(f"Ignoring bridge route for unknown radio {radio}")
+                continue
+            self._to_discord.setdefault((radio, channel_index), []).append(channel_id)
+            self._to_mesh.setdefault(channel_id, []).append((radio, channel_index))
+
+    def discord_channels(self, radio: str, channel_index: int) -> list:
+        return self._to_discord.get((radio, channel_index), ())
+
+    def mesh_route(self, channel_id: int):
+        # The first (radio, mesh channel) routed to a Discord channel, or None.
+        routes = self._to_mesh.get(channel_id)
+        return routes[0] if routes else None
+
+bridge_routes = RouteTable(BRIDGE_ROUTES)
+
+radios = {
+    name: Radio(name, hostname, radio_sender, outbound_queue, tx_scheduler, packet_ingest)
+    if name == PRIMARY_RADIO else Radio.extra(name, hostname)
+    for name, hostname in MESHTASTIC_RADIOS.items()
+}
+radios_by_hostname = {hostname: radios[name] for name, hostname in MESHTASTIC_RADIOS.items()}  # For the pubsub callbacks
+mesh_supervisor = radios[PRIMARY_RADIO].supervisor
+
+# --------------------------
+# Radio Daemon
+# --------------------------
+RADIO_DAEMON_SOCKET = setting("RADIO_DAEMON_SOCKET", None)  # e.g. "/run/meshbridge/radio.sock": the radios run in `python main.py radio-daemon`
+RADIO_DAEMON_SPOOL_MAX = setting("RADIO_DAEMON_SPOOL_MAX", 4096)  # Packets per radio the daemon keeps until the bot acknowledges them
+RADIO_DAEMON_CALL_TIMEOUT = 30.0                 # Seconds the bot waits for the daemon to run a radio write
+RADIO_DAEMON_WRITE_BUFFER_MAX = 8 * 1024 * 1024  # A bot this far behind is disconnected; it gets the spool again on reconnect
+DAEMON_FRAME = struct.Struct(">IBI")  # Body length, kind, sequence or request id; the JSON body follows
+DAEMON_HELLO = 1     # bot -> daemon: {"hostname"} of the radio this connection is for
+DAEMON_SNAPSHOT = 2  # daemon -> bot: the radio's NodeDB, node info and config, sent once the radio is connected
+DAEMON_PACKET = 3    # daemon -> bot: a received packet and its sender's NodeDB entry, numbered per radio
+DAEMON_ACK = 4       # bot -> daemon: every packet up to this number has been handled by the bot
+DAEMON_NODE = 5      # daemon -> bot: a NodeDB entry the library updated
+DAEMON_CALL = 6      # bot -> daemon: [method, args, kwargs] of a RadioCall to run on the radio's sender
+DAEMON_RESULT = 7    # daemon -> bot: {"id"} of the packet sent, or {"error", "unavailable"}
+
+def encode_frame(kind: int, number: int, body=None) -> bytes:
+    data = b"" if body is None else json.dumps(body, separators=(",", ":"), default=_capture_default).encode("utf-8")
+    return DAEMON_FRAME.pack(len(data), kind, number) + data
+
+def decode_body(data: bytes):
+    return json.loads(data, object_hook=_capture_object_hook) if data else None
+
+def interface_snapshot(interface) -> dict:
+    local = interface.localNode
+    return {
+        "nodes": interface.nodes or {},
+        "myInfo": interface.myInfo.SerializeToString() if interface.myInfo else None,
+        "metadata": interface.metadata.SerializeToString() if interface.metadata else None,
+        "localConfig": local.localConfig.SerializeToString() if local is not None else None,
+        "channels": [channel.SerializeToString() for channel in (local.channels or [])] if local is not None else [],
+        "longName": interface.getLongName() if hasattr(interface, "getLongName") else None,
+        "shortName": interface.getShortName() if hasattr(interface, "getShortName") else None,
+    }
+
+class DaemonInterface:
+    # Stands in for TCPInterface in the bot when the radios run in the radio daemon, so the
+    # supervisor, sender and transmit scheduler work unchanged. A reader thread publishes the
+    # daemon's packets on pubsub as TCPInterface's does, and the ingest drain acks them once
+    # their handlers have run (see PacketIngest._drain), so a crash loses none; writes go to the
+    # daemon and wait for its result. Errors that mean the radio is unreachable are raised as
+    # OSError, so the bot parks the send in its outbound queue until the link is back.
+    def __init__(self, hostname: str):
+        self.hostname = hostname
+        self.isConnected = threading.Event()
+        self._send_lock = threading.Lock()
+        self._calls = {}  # request id -> [Event, result body]
+        self._ids = itertools.count(1)
+        self._closing = False
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # The daemon answers the hello once its radio is connected; that counts as connecting.
+            self._sock.settimeout(MESHTASTIC_HEARTBEAT_INTERVAL)
+            self._sock.connect(RADIO_DAEMON_SOCKET)
+            self._file = self._sock.makefile("rb")
+            self._send(DAEMON_HELLO, 0, {"hostname": hostname})
+            kind, _, snapshot = self._read_frame()
+            if kind != DAEMON_SNAPSHOT:
+                raise ConnectionError(f"Radio daemon sent frame kind {kind} instead of a snapshot")
+            self._sock.settimeout(None)
+        except Exception:
+            self._sock.close()
+            raise
+        self.nodes = snapshot["nodes"]
+        self.myInfo = mesh_pb2.MyNodeInfo.FromString(snapshot["myInfo"]) if snapshot["myInfo"] else None
+        self.metadata = mesh_pb2.DeviceMetadata.FromString(snapshot["metadata"]) if snapshot["metadata"] else None
+        self.localNode = types.SimpleNamespace(
+            localConfig=localonly_pb2.LocalConfig.FromString(snapshot["localConfig"] or b""),
+            channels=[channel_pb2.Channel.FromString(channel) for channel in snapshot["channels"]]
+        )
+        self._long_name = snapshot["longName"]
+        self._short_name = snapshot["shortName"]
+        self.isConnected.set()
+        threading.Thread(target=self._reader, daemon=True, name=f"radio-daemon-reader-{hostname}").start()
+
+    def _send(self, kind: int, number: int, body=None):
+        frame = encode_frame(kind, number, body)
+        with self._send_lock:
+            self._sock.sendall(frame)
+
+    def _read_frame(self) -> tuple:
+        header = self._file.read(DAEMON_FRAME.size)
+        if len(header) < DAEMON_FRAME.size:
+            raise ConnectionError("Radio daemon closed the connection")
+        length, kind, number = DAEMON_FRAME.unpack(header)
+        data = self._file.read(length)
+        if len(data) < length:
+            raise ConnectionError("Radio daemon closed the connection")
+        return kind, number, decode_body(data)
+
+    def _reader(self):
+        try:
+            while True:
+                kind, number, body = self._read_frame()
+                if kind == DAEMON_PACKET:
+                    packet = body["packet"]
+                    if body["node"] is not None:
+                        self.nodes[packet["fromId"]] = body["node"]
+                    packet["daemonAck"] = functools.partial(self.ack, number)
+                    pub.sendMessage("meshtastic.receive", packet=packet, interface=self)
+                elif kind == DAEMON_NODE:
+                    self.nodes[body["id"]] = body["node"]
+                    pub.sendMessage("meshtastic.node.updated", node=body["node"], interface=self)
+                elif kind == DAEMON_RESULT:
+                    waiter = self._calls.pop(number, None)
+                    if waiter is not None:
+                        waiter[1] = body
+                        waiter[0].set()
+        except Exception as e:
+            if not self._closing:
+                print(f"Radio daemon connection for {self.hostname} lost: {e}")
+        self.isConnected.clear()
+        for waiter in list(self._calls.values()):
+            waiter[0].set()
+        if not self._closing:
+            pub.sendMessage("meshtastic.connection.lost", interface=self)
+
+    def ack(self, number: int):
+        # Acks are cumulative, so the drain only sends one per batch. If the connection is gone,
+        # the daemon resends everything unacked to the next one.
+        try:
+            self._send(DAEMON_ACK, number)
+        except OSError:
+            pass
+
+    def _call(self, method: str, *args, **kwargs):
+        # Runs on the bot's sender thread, one write at a time.
+        if not self.isConnected.is_set():
+            raise ConnectionError("Radio daemon connection lost")
+        request_id = next(self._ids)
+        waiter = self._calls[request_id] = [threading.Event(), None]
+        self._send(DAEMON_CALL, request_id, [method, args, kwargs])
+        if not waiter[0].wait(RADIO_DAEMON_CALL_TIMEOUT):
+            self._calls.pop(request_id, None)
+            raise TimeoutError(f"Radio daemon did not answer {method} within {RADIO_DAEMON_CALL_TIMEOUT:.0f}s")
+        result = waiter[1]
+        if result is None:
+            raise ConnectionError("Radio daemon connection lost")
+        if "error" in result:
+            if result.get("unavailable"):
+                raise ConnectionError(result["error"])
+            raise RuntimeError(result["error"])
+        return mesh_pb2.MeshPacket(id=result["id"]) if result.get("id") is not None else None
+
+    sendText = functools.partialmethod(_call, "sendText")
+    sendData = functools.partialmethod(_call, "sendData")
+    sendPosition = functools.partialmethod(_call, "sendPosition")
+    sendTelemetry = functools.partialmethod(_call, "sendTelemetry")
+    sendTraceRoute = functools.partialmethod(_call, "sendTraceRoute")
+    sendHeartbeat = functools.partialmethod(_call, "sendHeartbeat")
+
+    def getLongName(self):
+        return self._long_name
+
+    def getShortName(self):
+        return self._short_name
+
+    def close(self):
+        self._closing = True
+        self.isConnected.clear()
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+
+class RadioDaemon:
+    # The radio side of two-process mode: every radio's TCPInterface, reader thread, supervisor,
+    # duplicate filter and capture, with no Discord gateway, embeds or LLM work competing for
+    # the GIL. Packets the bot handles are numbered and kept in a bounded per-radio spool until
+    # the bot acks them, so a bot restart loses none; writes from the bot run on the radio's
+    # sender. The bot parks writes in its own outbound queue while the daemon is away.
+    def __init__(self, socket_path: str, spool_max: int, write_buffer_max: int):
+        self.socket_path = socket_path
+        self.spool_max = spool_max
+        self.write_buffer_max = write_buffer_max
+        self.running = False
+        self.loop = None
+        self._spools = {name: collections.deque() for name in radios}  # radio name -> (number, frame) not yet acked
+        self._numbers = {name: itertools.count(1) for name in radios}
+        self._writers = {}  # radio name -> StreamWriter of the bot connected for it
+        self.forwarded = 0
+        self.spool_dropped = 0
+        self.calls = 0
+
+    def forward(self, packet: dict):
+        # The ingest handler for every portnum the bot handles, run on the daemon's event loop.
+        name = packet["radio"]
+        node = (radios[name].supervisor.interface.nodes or {}).get(packet.get("fromId"))
+        number = next(self._numbers[name])
+        frame = encode_frame(DAEMON_PACKET, number, {"packet": packet, "node": node})
+        spool = self._spools[name]
+        if len(spool) >= self.spool_max:
+            spool.popleft()
+            self.spool_dropped += 1
+        spool.append((number, frame))
+        self.forwarded += 1
+        self._write(name, frame)
+
+    def _on_node_updated(self, node, interface):
+        # On the reader thread; serialized here so later changes to the node don't race the loop.
+        radio = radios_by_hostname.get(interface.hostname)
+        if radio is not None and self.loop is not None:
+            frame = encode_frame(DAEMON_NODE, 0, {"id": node_id_of(node), "node": node})
+            self.loop.call_soon_threadsafe(self._write, radio.name, frame)
+
+    def _write(self, name: str, frame: bytes):
+        writer = self._writers.get(name)
+        if writer is None:
+            return
+        if writer.transport.get_write_buffer_size() > self.write_buffer_max:
+            print(f"Bot connection for {name} is {self.write_buffer_max} bytes behind; disconnecting it")
+            self._writers.pop(name, None)
+            writer.close()
+            return
+        writer.write(frame)
+
+    async def _read_frame(self, reader: asyncio.StreamReader) -> tuple:
+        length, kind, number = DAEMON_FRAME.unpack(await reader.readexactly(DAEMON_FRAME.size))
+        return kind, number, decode_body(await reader.readexactly(length))
+
+    async def _serve_bot(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        name = None
+        try:
+            kind, _, body = await self._read_frame(reader)
+            radio = radios_by_hostname.get(body["hostname"]) if kind == DAEMON_HELLO else None
+            if radio is None:
+                print(f"Radio daemon: refusing a connection for unknown radio {body}")
+                return
+            name = radio.name
+            while not radio.supervisor.connected:
+                await asyncio.sleep(0.1)
+            previous = self._writers.pop(name, None)
+            if previous is not None:
+                previous.close()
+            writer.write(encode_frame(DAEMON_SNAPSHOT, 0, interface_snapshot(radio.supervisor.interface)))
+            for _, frame in self._spools[name]:
+                writer.write(frame)
+            self._writers[name] = writer
+            print(f"Bot connected for radio {name}; resent {len(self._spools[name])} unacknowledged packets")
+            while True:
+                kind, number, body = await self._read_frame(reader)
+                if kind == DAEMON_ACK:
+                    spool = self._spools[name]
+                    while spool and spool[0][0] <= number:
+                        spool.popleft()
+                elif kind == DAEMON_CALL:
+                    asyncio.create_task(self._run_call(radio, writer, number, RadioCall(body[0], *body[1], **body[2])))
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass  # The bot went away, or the daemon is shutting down
+        except Exception as e:
+            print(f"Error serving bot connection for radio {name}: {e}")
+        finally:
+            if name is not None and self._writers.get(name) is writer:
+                del self._writers[name]
+            writer.close()
+
+    async def _run_call(self, radio: "Radio", writer: asyncio.StreamWriter, request_id: int, call: RadioCall):
+        self.calls += 1
+        try:
+            result = await radio.sender.submit(call)
+        except RadioUnavailable as e:
+            body = {"error": str(e), "unavailable": True}
+        except Exception as e:
+            body = {"error": f"{type(e).__name__}: {e}"}
+        else:
+            body = {"id": getattr(result, "id", None)}
+            if call.method != "sendHeartbeat":
+                capture_writer.record(CAPTURE_OUT, {"radio": radio.name, "call": call.to_json()})
+        if not writer.is_closing():
+            writer.write(encode_frame(DAEMON_RESULT, request_id, body))
+
+    async def serve(self):
+        self.running = True
+        self.loop = asyncio.get_running_loop()
+        if CAPTURE_PATH:
+            capture_writer.start()
+        # Same portnum filter as the bot's ingest, so packets nobody handles never cross the socket.
+        forwarders = {portnum: [(self.forward, False)] for portnum in packet_ingest.handlers}
+        for radio in radios.values():
+            radio.ingest = PacketIngest(INGEST_QUEUE_MAX, INGEST_OVERFLOW_POLICY, forwarders, radio.primary)
+            radio.ingest.start(self.loop)
+            radio.supervisor.start()
+        pub.subscribe(self._on_node_updated, "meshtastic.node.updated")
+        if REPLAY_PATH:
+            capture_replayer.start(radios)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # Left behind by a previous run
+        server = await asyncio.start_unix_server(self._serve_bot, self.socket_path)
+        print(f"Radio daemon listening on {self.socket_path}")
+        async with server:
+            while True:
+                # A bot whose radio went down is disconnected; it reconnects, and its hello is
+                # answered once the radio is back.
+                await asyncio.sleep(0.25)
+                for name, writer in list(self._writers.items()):
+                    if not radios[name].supervisor.connected:
+                        del self._writers[name]
+                        writer.close()
+
+    def run(self) -> int:
+        if not self.socket_path:
+            print("Configuration error: RADIO_DAEMON_SOCKET is not set")
+            return 1
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+radio_daemon = RadioDaemon(RADIO_DAEMON_SOCKET, RADIO_DAEMON_SPOOL_MAX, RADIO_DAEMON_WRITE_BUFFER_MAX)
+
+# --------------------------
+# Metrics Endpoint
+# --------------------------
+metrics.describe("bridge_radio_reconnects_total", "counter", "Times the radio link came back after dropping")
+metrics.describe("bridge_radio_connect_failures_total", "counter", "Failed attempts to connect to the radio")
+metrics.describe("bridge_outbound_lost_total", "counter", "Sends dropped from the full outbound queue")
+metrics.describe("bridge_ingest_received_total", "counter", "Packets handed to the ingest queue")
+metrics.describe("bridge_ingest_dropped_total", "counter", "Packets shed from the full ingest queue")
+metrics.describe("bridge_relay_posts_total", "counter", "Discord messages posted by the relay")
+metrics.describe("bridge_relay_edits_total", "counter", "Live relay messages edited")
+metrics.describe("bridge_relay_rate_limit_waits_total", "counter", "Times the relay waited for Discord's rate limit")
+metrics.describe("bridge_llm_dropped_total", "counter", "Mesh texts not answered because a node had too many pending")
+metrics.describe("bridge_radio_connected", "gauge", "1 while the radio link is up")
+metrics.describe("bridge_tx_queue_depth", "gauge", "Sends waiting in the transmit scheduler")
+metrics.describe("bridge_tx_airtime_tokens_seconds", "gauge", "Airtime the transmit scheduler may spend right now")
+metrics.describe("bridge_outbound_queued", "gauge", "Sends parked on disk until the radio link returns")
+metrics.describe("bridge_ingest_queue_depth", "gauge", "Packets waiting for the event loop")
+metrics.describe("bridge_relay_pending", "gauge", "Mesh texts waiting to be posted on Discord")
+metrics.describe("bridge_dm_awaiting_ack", "gauge", "Direct messages waiting for the destination's acknowledgement")
+metrics.describe("bridge_nodes", "gauge", "Nodes in the node registry")
+
+@metrics.collector
+def collect_bridge_metrics() -> list[tuple]:
+    # Read from each component's own counters at scrape time, so none of this costs anything per packet.
+    samples = []
+    for name, radio in radios.items():
+        labels = (("radio", name),)
+        link = radio.supervisor.stats()
+        ingest = radio.ingest.stats()
+        samples += [
+            ("bridge_radio_connected", labels, int(link["connected"])),
+            ("bridge_radio_reconnects_total", labels, link["reconnects"]),
+            ("bridge_radio_connect_failures_total", labels, link["connect_failures"]),
+            ("bridge_tx_queue_depth", labels, radio.scheduler.depth),
+            ("bridge_tx_airtime_tokens_seconds", labels, radio.scheduler.tokens),
+            ("bridge_outbound_queued", labels, link["outbound_queued"]),
+            ("bridge_outbound_lost_total", labels, link["outbound_lost"]),
+            ("bridge_ingest_queue_depth", labels, ingest["depth"]),
+            ("bridge_ingest_received_total", labels, ingest["received"]),
+            ("bridge_ingest_dropped_total", labels, ingest["dropped"]),
+        ]
+    relay = discord_relay.stats()
+    samples += [
+        ("bridge_relay_pending", (), relay["pending"]),
+        ("bridge_relay_posts_total", (), relay["posts"]),
+        ("bridge_relay_edits_total", (), relay["edits"]),
+        ("bridge_relay_rate_limit_waits_total", (), relay["rate_limit_waits"]),
+        ("bridge_dm_awaiting_ack", (), len(ack_tracker)),
+        ("bridge_llm_dropped_total", (), auto_reply_engine.dropped),
+        ("bridge_nodes", (), len(node_registry)),
+    ]
+    samples += [("bridge_startup_seconds", (("phase", phase),), seconds) for phase, seconds in startup_timer.phases.items()]
+    return samples
+
+class MetricsServer:
+    # Serves /metrics in the Prometheus text format, and /debug/profile?seconds=N with
+    # collapsed stacks from the sampling profiler, from the bot's own event loop.
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self):
+        # The endpoint only starts once.
+        if self.port is None or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._metrics)
+        app.router.add_get("/debug/profile", self._profile)
+        self._runner = web.AppRunner(app)
+        try:
+            await self._runner.setup()
+            await web.TCPSite(self._runner, self.host, self.port).start()
+            print(f"Metrics endpoint listening on http://{self.host}:{self.port}/metrics")
+        except Exception as e:
+            print(f"Error starting metrics endpoint on {self.host}:{self.port}: {e}")
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def _profile(self, request: web.Request) -> web.Response:
+        try:
+            seconds = float(request.query.get("seconds", 10))
+        except ValueError:
+            return web.Response(status=400, text="seconds must be a number\n")
+        try:
+            samples = await profiler.profile(seconds)
+        except RuntimeError as e:
+            return web.Response(status=501, text=f"Profiling unavailable: {e}\n")
+        if samples is None:
+            return web.Response(status=409, text="A profile is already running\n")
+        return web.Response(text=SamplingProfiler.collapsed(samples))
+
+metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT)
+
+# --------------------------
+# Slash Command Sync
+# --------------------------
+def command_set_hash() -> str:
+    # Everything Discord is told about the commands, so any change to a name, description,
+    # option or permission changes the hash.
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda command: command["name"])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+async def sync_commands():
+    # Syncing is a rate-limited API call that Discord only needs when the commands change,
+    # so the hash of the last synced set (per application) is kept and compared first.
+    state = f"{bot.application_id}:{command_set_hash()}"
+    try:
+        with open(COMMAND_SYNC_STATE_PATH) as f:
+            if f.read().strip() == state:
+                print("Slash commands unchanged; skipping sync.")
+                startup_timer.mark("commands_ready")
+                return
+    except FileNotFoundError:
+        pass
     try:
         await tree.sync()
         print("Slash commands synced.")
     except Exception as e:
         print(f"Error syncing commands: {e}")
+        return
+    startup_timer.mark("commands_ready")
+    try:
+        with open(COMMAND_SYNC_STATE_PATH, "w") as f:
+            f.write(state)
+    except OSError as e:
+        print(f"Error saving command sync state: {e}")
+
+# --------------------------
+# Bot Event Handlers
+# --------------------------
+@bot.event
+async def on_ready():
+    print(f"Logged in as {bot.user} (ID: {bot.user.id})")
+    await bridge_app.on_login()
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    metrics.observe("bridge_command_seconds", elapsed, (("command", command.qualified_name),))
+
+# --------------------------
+# Application
+# --------------------------
+class BridgeApp:
+    # Starts the bridge. Importing main.py only defines everything (no connections, threads
+    # or files), so bench.py and other tools can import it; run() is what the script calls.
+    # The radios connect on their own threads while the bot logs in, and mesh texts heard
+    # before the login finishes wait in the relay.
+    def __init__(self, token: str):
+        self.token = token
+        self.loop = None
+
+    def check_config(self) -> list[str]:
+        problems = [f"Unknown setting {name} in the configuration" for name in sorted(set(CONFIG) - _settings_read)]
+        if self.token == "YOUR_DISCORD_TOKEN":
+            problems.append("DISCORD_BOT_TOKEN is not set")
+        # DISCORD_CHANNEL_ID only feeds the default route; explicit BRIDGE_ROUTES name their own channels.
+        if DISCORD_CHANNEL_ID is None and "BRIDGE_ROUTES" not in CONFIG:
+            problems.append("DISCORD_CHANNEL_ID is not set (or configure BRIDGE_ROUTES)")
+        for radio, _, _ in BRIDGE_ROUTES:
+            if radio not in MESHTASTIC_RADIOS:
+                problems.append(f"BRIDGE_ROUTES names radio {radio}, which is not in MESHTASTIC_RADIOS")
+        hostnames = collections.Counter(MESHTASTIC_RADIOS.values())
+        for hostname, count in hostnames.items():
+            if count > 1:
+                problems.append(f"MESHTASTIC_RADIOS lists hostname {hostname} for {count} radios")
+        if not 0 < FILE_TRANSFER_MAX_BYTES <= FILE_MAX_CHUNKS * FILE_CHUNK_SIZE:
+            problems.append(f"FILE_TRANSFER_MAX_BYTES must be between 1 and {FILE_MAX_CHUNKS * FILE_CHUNK_SIZE}")
+        # The sender waits for acks on its window, and an ack covers the first missing chunk plus its bitmap.
+        if not 1 <= FILE_WINDOW <= FILE_ACK_BITMAP_BITS + 1:
+            problems.append(f"FILE_WINDOW must be between 1 and {FILE_ACK_BITMAP_BITS + 1}")
+        if not 0 < TX_DUTY_CYCLE <= 1:
+            problems.append(f"TX_DUTY_CYCLE must be above 0 and at most 1, not {TX_DUTY_CYCLE}")
+        return problems
+
+    def start_radios(self, loop: asyncio.AbstractEventLoop):
+        # Everything that needs the event loop but not Discord. Only the first call does anything.
+        if self.loop is not None:
+            return
+        self.loop = loop
+        message_archive.start()
+        file_transfers.start()
+        conversation_store.open()
+        telemetry_store.start(loop)
+        # With a radio daemon, capture and replay happen there, next to the radios.
+        if CAPTURE_PATH and not RADIO_DAEMON_SOCKET:
+            capture_writer.start()
+        for radio in radios.values():
+            radio.outbound.open()
+            radio.supervisor.loop = loop
+            radio.ingest.start(loop)
+            radio.supervisor.start()
+        text_transport.start(loop)
+        if REPLAY_PATH and not RADIO_DAEMON_SOCKET:
+            capture_replayer.start(radios)
+
+    async def on_login(self):
+        discord_ready.set()
+        startup_timer.mark("discord_ready")
+        await sync_commands()
+
+    async def start(self):
+        self.start_radios(asyncio.get_running_loop())
+        await metrics_server.start()
+        try:
+            async with bot:
+                await bot.start(self.token)
+        finally:
+            await auto_reply_engine.close()
+
+    def run(self) -> int:
+        problems = self.check_config()
+        for problem in problems:
+            print(f"Configuration error: {problem}")
+        if problems:
+            return 1
+        discord.utils.setup_logging()
+        try:
+            asyncio.run(self.start())
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+bridge_app = BridgeApp(DISCORD_BOT_TOKEN)
 
 # --------------------------
 # Run the Bot
 # --------------------------
-bot.run(DISCORD_BOT_TOKEN)
+if __name__ == "__main__":
+    # `python main.py radio-daemon` runs the radio side of two-process mode (see RADIO_DAEMON_SOCKET).
+    sys.exit(radio_daemon.run() if sys.argv[1:] == ["radio-daemon"] else bridge_app.run())